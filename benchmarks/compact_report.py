@@ -0,0 +1,195 @@
+# benchmarks/compact_report.py
+"""Recall vs memory of TweetStore's compact modes against the float32 flat index.
+
+For each quantization the report builds a VectorIndex over the same
+synthetic corpus and measures recall@k against exact L2 search (what the
+store does without compact mode) and against exact cosine search (which
+isolates the loss from quantization and the approximate index from the
+change of metric), the serialized index size, and search latency. It then
+opens a whole TweetStore over the corpus in each mode, in a fresh process,
+and reports what it keeps resident per tweet. Run from the repo root:
+
+    python -m benchmarks.compact_report --size 50000
+    python -m benchmarks.compact_report --size 20000 --encoder minilm --kind flat
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from benchmarks.corpus import HashingEncoder, generate_corpus
+from benchmarks.run import quiet
+from rag import TweetStore
+from vector_index import VectorIndex
+
+MODES = [None, "fp16", "int8", "pq"]
+
+
+def make_encoder(name: str):
+    if name == "minilm":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer("all-MiniLM-L6-v2"), "all-MiniLM-L6-v2"
+    encoder = HashingEncoder()
+    return encoder, encoder.model_name
+
+
+def rss() -> int:
+    """Resident set of this process in bytes (Linux; 0 elsewhere)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def open_store(storage_dir: str, mode: Optional[str], encoder_name: str) -> Dict[str, float]:
+    """Open the store, load its vector and BM25 indexes and run one query;
+    runs in a fresh process so the RSS figures belong to this store alone"""
+    encoder, _ = make_encoder(encoder_name)
+    rss_before = rss()
+    tracemalloc.start()
+    with quiet():
+        store = TweetStore(storage_dir=storage_dir, encoder=encoder, compact=mode)
+        store.warm_up()
+        store.retrieve_context("what do you think about the gpu shortage")
+    heap, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # FAISS allocates outside the Python heap
+    index = faiss.serialize_index(store.index.index).nbytes
+    result = {"heap": heap, "heap_peak": heap_peak, "index": index, "rss": rss() - rss_before}
+    with quiet():
+        store.close()
+    return result
+
+
+def store_memory(corpus: List[Dict], encoder_name: str, workdir: str) -> List[Dict]:
+    """Bytes per tweet a whole TweetStore keeps per mode, on switching an
+    existing default store to the mode (a full index rebuild) and on a
+    restart after that"""
+    base = os.path.join(workdir, "store")
+    encoder, _ = make_encoder(encoder_name)
+    with quiet():
+        store = TweetStore(storage_dir=base, encoder=encoder)
+        store.store_tweets(corpus)
+        store.warm_up()
+        store.close()
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for mode in MODES:
+        storage_dir = os.path.join(workdir, f"store-{mode or 'fp32'}")
+        shutil.copytree(base, storage_dir)
+        runs = {}
+        for run in ("switch", "restart"):
+            with context.Pool(1) as pool:
+                runs[run] = pool.apply(open_store, (storage_dir, mode, encoder_name))
+        restart = runs["restart"]
+        rows.append({
+            "mode": mode or "fp32",
+            "heap": restart["heap"] / len(corpus),
+            "index": restart["index"] / len(corpus),
+            "total": (restart["heap"] + restart["index"]) / len(corpus),
+            "rss": restart["rss"] / len(corpus),
+            "switch_heap_peak": runs["switch"]["heap_peak"] / len(corpus),
+        })
+    return rows
+
+
+def recall_at_k(truth: np.ndarray, found: List[List[str]], ids: List[str], k: int) -> float:
+    hits = 0
+    for row, result in zip(truth, found):
+        expected = {ids[i] for i in row[:k]}
+        hits += len(expected & set(result[:k]))
+    return hits / (len(found) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs memory of the compact index modes")
+    parser.add_argument("--size", type=int, default=50000, help="Tweets in the synthetic corpus")
+    parser.add_argument("--queries", type=int, default=500, help="Queries used for recall")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared per query")
+    parser.add_argument("--kind", default="auto", choices=["auto", "flat", "ivf", "hnsw"],
+                        help="Index kind for every mode (auto picks by size, like the store)")
+    parser.add_argument("--encoder", default="hashing", choices=["hashing", "minilm"],
+                        help="hashing needs no model download; minilm uses all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    corpus = list(generate_corpus(args.size))
+    encoder, model_name = make_encoder(args.encoder)
+    print(f"[Benchmark] Encoding {len(corpus)} tweets...")
+    vectors = np.asarray(encoder.encode([t['text'] for t in corpus], batch_size=64), dtype=np.float32)
+    dim = vectors.shape[1]
+    ids = [t['tweet_id'] for t in corpus]
+    hashes = [0] * len(ids)
+    rng = np.random.default_rng(0)
+    picked = rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)
+    # Queries are perturbed corpus texts, so nearest neighbours aren't just the text itself
+    queries = np.asarray(encoder.encode([corpus[i]['text'] + " " + corpus[(i + 1) % len(corpus)]['text']
+                                         for i in picked]), dtype=np.float32)
+
+    # Ground truth: exact L2, the store's default metric, and exact cosine
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    unit, unit_queries = vectors.copy(), queries.copy()
+    faiss.normalize_L2(unit)
+    faiss.normalize_L2(unit_queries)
+    exact_cosine = faiss.IndexFlatIP(dim)
+    exact_cosine.add(unit)
+    _, truth_cosine = exact_cosine.search(unit_queries, args.k)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in MODES:
+            with quiet():
+                index = VectorIndex(dim, os.path.join(workdir, mode or "fp32"), model_name,
+                                    kind=args.kind, quantization=mode)
+                start = time.perf_counter()
+                index.rebuild(ids, vectors, hashes)
+                build = time.perf_counter() - start
+            start = time.perf_counter()
+            found = [[tid for tid, _ in index.search(q, args.k)] for q in queries]
+            search = (time.perf_counter() - start) / len(queries)
+            size = faiss.serialize_index(index.index).nbytes
+            info = index.describe()
+            rows.append({
+                "mode": mode or "fp32",
+                "index": f"{info['kind']}/{info['codec']}",
+                "recall_l2": recall_at_k(truth, found, ids, args.k),
+                "recall_cosine": recall_at_k(truth_cosine, found, ids, args.k),
+                "index_mb": size / 2 ** 20,
+                "bytes_per_vector": size / len(ids),
+                "build_s": build,
+                "search_ms": search * 1000,
+            })
+
+    print(f"\nrecall@{args.k} vs exact search over {len(ids)} vectors ({len(queries)} queries)")
+    print(f"{'mode':<6} {'index':<11} {'vs L2':>8} {'vs cos':>8} {'index MB':>10} "
+          f"{'B/vector':>10} {'build s':>9} {'search ms':>10}")
+    for row in rows:
+        print(f"{row['mode']:<6} {row['index']:<11} {row['recall_l2']:>8.3f} {row['recall_cosine']:>8.3f} "
+              f"{row['index_mb']:>10.2f} {row['bytes_per_vector']:>10.1f} {row['build_s']:>9.2f} "
+              f"{row['search_ms']:>10.3f}")
+
+    print(f"\n[Benchmark] Opening a TweetStore of {len(corpus)} tweets in each mode...")
+    with tempfile.TemporaryDirectory() as workdir:
+        memory = store_memory(corpus, args.encoder, workdir)
+    print("\nTweetStore bytes per tweet after a restart: Python heap, FAISS index, their total and the")
+    print("process's RSS growth (which also counts touched pages of the memory-mapped vectors file).")
+    print("The switch column is the heap peak of the first open in the mode, which rebuilds the index.")
+    print(f"{'mode':<6} {'heap':>8} {'index':>8} {'total':>8} {'vs fp32':>8} {'RSS':>8} {'switch peak':>12}")
+    for row in memory:
+        print(f"{row['mode']:<6} {row['heap']:>8.0f} {row['index']:>8.0f} {row['total']:>8.0f} "
+              f"{1 - row['total'] / memory[0]['total']:>8.0%} {row['rss']:>8.0f} {row['switch_heap_peak']:>12.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/corpus.py
+# Deterministic synthetic tweets and a model-free encoder for benchmarks
+import hashlib
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+TOPICS = ["ai", "llm", "gpu", "agents", "rag", "python", "startups", "robots", "chips", "open-source",
+          "benchmarks", "transformers", "alignment", "latency", "compilers", "databases"]
+FIRST_ID = 1_500_000_000_000_000_000
+
+
+def _vocabulary(rng: random.Random, size: int = 3000) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(size)]
+
+
+def generate_corpus(n: int, seed: int = 0, authors: int = 1000, reply_rate: float = 0.5,
+                    quote_rate: float = 0.05, unread_rate: float = 0.01,
+                    start: Optional[datetime] = None) -> Iterator[Dict]:
+    """Yield n TweetStore-style tweets forming reply threads and quotes.
+
+    Replies attach to one of the last 2000 tweets, favouring recent ones, so
+    threads have realistic depth and fan-out. Ids increase with created_at
+    like real snowflake ids. Same arguments, same corpus.
+    """
+    rng = random.Random(seed)
+    words = _vocabulary(rng) + TOPICS * 20
+    start = start or datetime(2024, 1, 1, tzinfo=timezone.utc)
+    recent: List[Dict] = []
+    for i in range(n):
+        tweet_id = str(FIRST_ID + i * 4096)
+        text = ' '.join(rng.choice(words) for _ in range(rng.randint(5, 40)))
+        if rng.random() < 0.3:
+            text += f" #{rng.choice(TOPICS)}"
+        tweet = {
+            'tweet_id': tweet_id,
+            'text': text,
+            'author_id': str(10_000 + rng.randrange(authors)),
+            'created_at': (start + timedelta(seconds=30 * i)).isoformat(),
+            'is_read': rng.random() >= unread_rate,
+        }
+        if recent and rng.random() < reply_rate:
+            parent = recent[-1 - min(len(recent) - 1, int(rng.expovariate(1 / 50)))]
+            tweet['in_reply_to_status_id'] = parent['tweet_id']
+            tweet['conversation_id'] = parent.get('conversation_id') or parent['tweet_id']
+        else:
+            tweet['conversation_id'] = tweet_id
+        if recent and rng.random() < quote_rate:
+            tweet['quoted_tweet_id'] = rng.choice(recent)['tweet_id']
+        recent.append(tweet)
+        if len(recent) > 2000:
+            del recent[:1000]
+        yield tweet
+
+
+def generate_mentions(n: int, user_id: str, corpus_size: int, seed: int = 1) -> List[Dict]:
+    """n new mentions of user_id replying to tweets of a corpus of corpus_size"""
+    rng = random.Random(seed)
+    mentions = []
+    for i, tweet in enumerate(generate_corpus(n, seed=seed, reply_rate=0.0, quote_rate=0.0)):
+        tweet_id = str(FIRST_ID + (corpus_size + i) * 4096)
+        parent = str(FIRST_ID + rng.randrange(corpus_size) * 4096) if corpus_size else None
+        mentions.append(dict(tweet, tweet_id=tweet_id, text=f"@bench_bot {tweet['text']}",
+                             in_reply_to_status_id=parent, conversation_id=parent or tweet_id,
+                             created_at=datetime.now(timezone.utc).isoformat()))
+    return mentions
+
+
+class HashingEncoder:
+    """Stand-in for SentenceTransformer: bag-of-words feature hashing.
+
+    Same encode() interface, no model download, and similar texts still get
+    similar vectors, so index and retrieval costs are realistic.
+    """
+
+    model_name = "hashing-encoder-384"
+    embedding_size = 384
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.embedding_size, dtype=np.float32)
+        for word in text.lower().split():
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.embedding_size] += 1.0 if h >> 63 else -1.0
+        return vector
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        vectors = np.array([self._vector(s) for s in ([sentences] if single else sentences)],
+                           dtype=np.float32).reshape(-1, self.embedding_size)
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        return vectors[0] if single else vectors
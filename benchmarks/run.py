@@ -0,0 +1,263 @@
+# benchmarks/run.py
+"""Benchmarks for TweetStore, TwitterClientV2 and a full TwitterBot.run_cycle.
+
+Everything runs locally: tweets come from a synthetic corpus, embeddings
+from a hashing encoder, and Twitter and Anthropic are replaced by the fake
+HTTP servers in fakes.py. Run from the repo root:
+
+    python -m benchmarks.run --sizes 1000,10000
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+Results are written as JSON (flat metric -> seconds) so two runs can be
+compared; --compare exits non-zero if a metric regressed past --threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import FIRST_ID, HashingEncoder, generate_corpus, generate_mentions
+from fakes import FakeAnthropicServer, FakeTwitterServer
+from rag import TweetStore
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+FAKE_ENV = {
+    "TWITTER_API_KEY": "bench", "TWITTER_API_SECRET": "bench",
+    "TWITTER_ACCESS_TOKEN": "bench", "TWITTER_ACCESS_SECRET": "bench",
+    "ANTHROPIC_API_KEY": "bench",
+}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the modules' progress prints while measuring"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(fn: Callable, repeat: int = 1) -> float:
+    """Median wall time of fn() over repeat runs"""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs)
+
+
+def per_call(fn: Callable, args: List) -> float:
+    """Mean seconds per fn(arg) call"""
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) / max(1, len(args))
+
+
+def bench_store(n: int, workdir: str, queries: int = 200) -> Dict[str, float]:
+    """Ingest, load, thread lookup, index build/load and retrieval for n tweets"""
+    encoder = HashingEncoder()
+    storage_dir = os.path.join(workdir, f"store_{n}")
+    corpus = list(generate_corpus(n))
+    rng = random.Random(0)
+    sample = [t['tweet_id'] for t in rng.sample(corpus, min(1000, n))]
+    results = {}
+    with quiet():
+        store = TweetStore(storage_dir=storage_dir, encoder=encoder)
+        results['ingest_s'] = timed(lambda: store.store_tweets(corpus, batch_size=1000))
+        store.close()
+
+        def load():
+            TweetStore(storage_dir=storage_dir, encoder=encoder).close()
+        results['load_s'] = timed(load, repeat=3)
+
+        store = TweetStore(storage_dir=storage_dir, encoder=encoder)
+        results['get_thread_s'] = per_call(store.get_thread, sample)
+        results['next_unread_s'] = per_call(lambda _: store.get_next_unread_tweet(), range(1000))
+        results['index_build_s'] = timed(store.warm_up)
+        store.close()
+
+        store = TweetStore(storage_dir=storage_dir, encoder=encoder)
+        results['index_load_s'] = timed(store.warm_up)
+        texts = [t['text'] for t in rng.sample(corpus, min(queries, n))]
+        results['retrieve_context_s'] = per_call(store.retrieve_context, texts)
+        authors = [t['author_id'] for t in rng.sample(corpus, min(queries, n))]
+        results['retrieve_context_author_s'] = per_call(
+            lambda i: store.retrieve_context(texts[i], author_id=authors[i]), range(len(texts)))
+        new = list(generate_corpus(100, seed=n + 1))
+        for i, tweet in enumerate(new):
+            tweet['tweet_id'] = f"9{n:09d}{i:04d}"
+        results['store_tweet_indexed_s'] = per_call(store.store_tweet, new)
+        store.close()
+    return {f"store.{n}.{name}": value for name, value in results.items()}
+
+
+def bench_client(workdir: str, mentions: int = 500, latency: float = 0.0) -> Dict[str, float]:
+    """TwitterClientV2 startup and fetch paths against the fake Twitter server"""
+    from twitter_client import TwitterClientV2
+    results = {}
+    corpus = list(generate_corpus(1000, seed=7))
+    identity_path = os.path.join(workdir, "client_identity.json")
+    with FakeTwitterServer(latency=latency) as twitter, quiet():
+        twitter.add_tweets(corpus)
+        twitter.add_mentions(generate_mentions(mentions, twitter.user_id, len(corpus)))
+        results['init_uncached_s'] = timed(lambda: TwitterClientV2(identity_path=identity_path, api_base=twitter.url))
+        client = TwitterClientV2(identity_path=identity_path, api_base=twitter.url)
+        results['init_cached_s'] = timed(lambda: TwitterClientV2(identity_path=identity_path, api_base=twitter.url))
+        # A cursor older than every mention, so the whole timeline is paged through
+        results[f'check_notifications_{mentions}_s'] = timed(
+            lambda: client.check_notifications(since_id=str(FIRST_ID), max_total=mentions), repeat=3)
+        ids = [t['tweet_id'] for t in corpus[:300]]
+        results['get_tweets_300_s'] = timed(lambda: client.get_tweets(ids), repeat=3)
+        results['post_tweet_s'] = per_call(client.post_tweet, [f"bench post {i}" for i in range(20)])
+    return {f"client.{name}": value for name, value in results.items()}
+
+
+def _responder(params: Dict) -> str:
+    """Reply to the focus tweet with text that won't trip the duplicate guard"""
+    prompt = params["messages"][0]["content"]
+    match = re.search(r"Tweet ID: (\d+)\n(?:[^\n]*\n){2}<-- This is the main", prompt)
+    rng = random.Random(prompt)
+    text = ' '.join(f"w{rng.randrange(10 ** 6)}" for _ in range(12))
+    if match:
+        return json.dumps({"action": "reply", "tweet_id": match.group(1), "text": text})
+    return json.dumps({"action": "post", "tweet_id": None, "text": text})
+
+
+def bench_cycle(workdir: str, corpus_size: int = 10000, mentions: int = 50,
+                twitter_latency: float = 0.0, model_latency: float = 0.0) -> Dict[str, float]:
+    """One TwitterBot.run_cycle: fetch, hydrate, retrieve, decide and reply"""
+    cycle_dir = os.path.join(workdir, "cycle")
+    os.makedirs(cycle_dir, exist_ok=True)
+    corpus = list(generate_corpus(corpus_size, seed=3, unread_rate=0.0))
+    encoder = HashingEncoder()
+    results = {}
+    cwd = os.getcwd()
+    with FakeTwitterServer(latency=twitter_latency) as twitter, \
+            FakeAnthropicServer(_responder, latency=model_latency) as anthropic, quiet():
+        twitter.add_tweets(corpus)
+        twitter.add_mentions(generate_mentions(mentions, twitter.user_id, corpus_size))
+        os.environ.update(TWITTER_API_BASE=twitter.url, ANTHROPIC_BASE_URL=anthropic.url)
+        os.chdir(cycle_dir)
+        try:
+            # Store half the corpus; the rest has to be hydrated from the API
+            store = TweetStore(encoder=encoder)
+            store.store_tweets(corpus[:corpus_size // 2])
+            # A bot that has run before, so the first cycle takes every new mention
+            store.set_state('mentions_since_id', str(FIRST_ID))
+            store.warm_up()
+            store.close()
+
+            from main import TwitterBot
+            start = time.perf_counter()
+            bot = TwitterBot(encoder=encoder)
+            results['startup_s'] = time.perf_counter() - start
+            results['run_cycle_first_s'] = timed(bot.run_cycle)
+            results['run_cycle_steady_s'] = timed(bot.run_cycle, repeat=3)
+            bot.store.close()
+            calls = dict(twitter.calls)
+            calls.update(anthropic.calls)
+        finally:
+            os.chdir(cwd)
+    results = {f"cycle.{name}": value for name, value in results.items()}
+    results['cycle.http_requests'] = sum(calls.values())
+    return results
+
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """Print current vs baseline and return the metrics that got slower than threshold allows"""
+    regressions = []
+    print(f"{'metric':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(current) & set(baseline)):
+        base, cur = baseline[name], current[name]
+        change = (cur - base) / base if base else 0.0
+        # Ignore sub-millisecond noise on fast operations
+        slower = change > threshold and cur - base > 0.001
+        if slower and name.endswith("_s"):
+            regressions.append(name)
+        flag = "  <-- regression" if slower and name.endswith("_s") else ""
+        print(f"{name:<45} {base:>12.6f} {cur:>12.6f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot's benchmarks against local fakes")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="Comma-separated corpus sizes for the store benchmarks (up to 1000000)")
+    parser.add_argument("--suites", default="store,client,cycle", help="Which benchmarks to run")
+    parser.add_argument("--mentions", type=int, default=500, help="Mentions on the fake timeline (client suite)")
+    parser.add_argument("--cycle_corpus", type=int, default=10000, help="Tweets behind the run_cycle benchmark")
+    parser.add_argument("--cycle_mentions", type=int, default=50, help="New mentions for the run_cycle benchmark")
+    parser.add_argument("--twitter_latency", type=float, default=0.0, help="Seconds added to each fake Twitter call")
+    parser.add_argument("--model_latency", type=float, default=0.0, help="Seconds added to each fake model call")
+    parser.add_argument("--out", default=None, help="Results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    suites = set(args.suites.split(","))
+    # Only the fakes are ever called; never use real credentials here
+    os.environ.update(FAKE_ENV)
+    metrics: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        if "store" in suites:
+            for n in (int(s) for s in args.sizes.split(",")):
+                print(f"[Benchmark] TweetStore with {n} tweets...")
+                metrics.update(bench_store(n, workdir))
+        if "client" in suites:
+            print(f"[Benchmark] TwitterClientV2 with {args.mentions} mentions...")
+            metrics.update(bench_client(workdir, args.mentions, args.twitter_latency))
+        if "cycle" in suites:
+            print(f"[Benchmark] run_cycle with {args.cycle_mentions} mentions over {args.cycle_corpus} tweets...")
+            metrics.update(bench_cycle(workdir, args.cycle_corpus, args.cycle_mentions,
+                                       args.twitter_latency, args.model_latency))
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "metrics": metrics,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    for name, value in sorted(metrics.items()):
+        print(f"{name:<45} {value:>12.6f}")
+    print(f"[Benchmark] Results saved to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["metrics"]
+        regressions = compare(metrics, baseline, args.threshold)
+        if regressions:
+            print(f"[Benchmark] {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+# conftest.py
+# Unit tests live in tests/ and run against local fakes; test_scripts/ are
+# manual checks against the live Twitter API, so pytest leaves them alone
+collect_ignore = ["test_scripts"]
@@ -0,0 +1,77 @@
+# decision_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def thread_cache_key(thread: List[Dict], focus_id: Optional[str], salt: str = "") -> str:
+    """Hash of a thread's content that ignores case and whitespace differences"""
+    parts = [salt, str(focus_id)]
+    for t in thread:
+        text = re.sub(r"\s+", " ", t.get('text', '')).strip().lower()
+        parts.append(f"{t.get('tweet_id', t.get('id'))}|{t.get('author_id')}|{text}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class DecisionCache:
+    """LRU cache of model decisions with a TTL, persisted to a small JSON file.
+
+    Each entry remembers what the original call cost in tokens, so hits can
+    be reported as tokens saved.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: float = 6 * 3600, max_entries: int = 1000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self._entries = OrderedDict(json.load(f))
+            except (OSError, ValueError) as e:
+                print(f"[DecisionCache] Ignoring unreadable cache file: {e}")
+        self._evict(time.time())
+
+    def _evict(self, now: float):
+        for key in [k for k, e in self._entries.items() if e['expires_at'] <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """The cached entry ({'decision', 'tokens', 'expires_at'}) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, decision: Dict, tokens: int = 0):
+        with self._lock:
+            now = time.time()
+            self._entries[key] = {'decision': decision, 'tokens': tokens, 'expires_at': now + self.ttl_seconds}
+            self._entries.move_to_end(key)
+            self._evict(now)
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_file = self.path + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_file, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
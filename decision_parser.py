@@ -0,0 +1,89 @@
+# decision_parser.py
+import json
+from typing import Dict, Optional
+
+ACTIONS = {"like", "retweet", "quote", "reply", "post", "do_nothing"}
+NEEDS_TWEET_ID = {"like", "retweet", "quote", "reply"}
+NEEDS_TEXT = {"post", "reply", "quote"}
+
+
+class DecisionParseError(ValueError):
+    """Model output that isn't a usable decision"""
+
+
+class JsonObjectExtractor:
+    """Incrementally finds the first complete top-level JSON object in streamed text.
+
+    Anything before the opening brace (markdown fences, prose) is skipped,
+    and braces inside strings are ignored, so feed() can tell exactly when
+    the object is complete and the stream can be stopped there.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.result: Optional[str] = None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Add text; returns the object's text once its closing brace arrives"""
+        if self.result is not None:
+            return self.result
+        for ch in chunk:
+            if self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+                    self.buffer.append(ch)
+                continue
+            self.buffer.append(ch)
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.result = "".join(self.buffer)
+                    return self.result
+        return None
+
+
+def validate_decision(data) -> Dict:
+    """Check a decision against the expected schema and normalize it"""
+    if not isinstance(data, dict):
+        raise DecisionParseError("expected a JSON object")
+    action = data.get("action")
+    if action not in ACTIONS:
+        raise DecisionParseError(f"action must be one of {sorted(ACTIONS)}, got {action!r}")
+    tweet_id = data.get("tweet_id")
+    if tweet_id is not None:
+        tweet_id = str(tweet_id)
+    if action in NEEDS_TWEET_ID and not tweet_id:
+        raise DecisionParseError(f"'{action}' needs a tweet_id")
+    text = data.get("text") or ""
+    if not isinstance(text, str):
+        raise DecisionParseError("text must be a string")
+    if action in NEEDS_TEXT and not text.strip():
+        raise DecisionParseError(f"'{action}' needs non-empty text")
+    return {"action": action, "tweet_id": tweet_id, "text": text}
+
+
+def parse_decision(text: str) -> Dict:
+    """Extract and validate the first JSON object in model output"""
+    extractor = JsonObjectExtractor()
+    obj_text = extractor.feed(text)
+    if obj_text is None:
+        raise DecisionParseError("no complete JSON object in response")
+    try:
+        data = json.loads(obj_text)
+    except json.JSONDecodeError as e:
+        raise DecisionParseError(f"invalid JSON: {e}")
+    return validate_decision(data)
@@ -0,0 +1,100 @@
+# duplicate_guard.py
+# faiss and the encoder are only touched once a text action needs checking
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional
+
+from unread_queue import tweet_timestamp
+
+TEXT_ACTIONS = {"post", "reply", "quote"}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class DuplicateGuard:
+    """Drops outgoing actions that repeat what the bot already did.
+
+    Two checks run before a Twitter write: a reply or quote is dropped when
+    the store already holds one by the bot for that target tweet, and any
+    post/reply/quote is dropped when its text has cosine similarity of at
+    least `threshold` with one of the bot's last `window` tweets. The recent
+    outputs live in a small in-memory inner-product FAISS index of
+    normalized embeddings from the store's encoder.
+    """
+
+    def __init__(self, store, user_id: str, threshold: float = 0.92, window: int = 200):
+        self.store = store
+        self.user_id = user_id
+        self.threshold = threshold
+        self.window = window
+        self._index = None
+        self._texts: List[str] = []
+        self.suppressed = {'already_replied': 0, 'already_quoted': 0, 'near_duplicate': 0}
+
+    def _own_recent(self) -> List[Dict]:
+        own = [t for t in self.store.tweets if t.get('author_id') == self.user_id and t.get('text')]
+        own.sort(key=tweet_timestamp)
+        return own[-self.window:]
+
+    def _encode(self, texts: List[str]):
+        return self.store.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).astype('float32')
+
+    def _load(self):
+        """Index the bot's recent outputs on first use"""
+        if self._index is not None:
+            return
+        import faiss
+        self._index = faiss.IndexFlatIP(self.store.embedding_size)
+        self._texts = []
+        recent = self._own_recent()
+        if recent:
+            self._add([t['text'] for t in recent])
+
+    def _add(self, texts: List[str]):
+        self._index.add(self._encode(texts))
+        self._texts.extend(texts)
+        if len(self._texts) > 2 * self.window:
+            # Rebuild from the newest window instead of growing forever
+            keep = self._texts[-self.window:]
+            self._index.reset()
+            self._texts = []
+            self._add(keep)
+
+    def _has_own(self, tweets: List[Dict]) -> bool:
+        return any(t.get('author_id') == self.user_id for t in tweets)
+
+    def check(self, decision: Dict) -> Optional[str]:
+        """Reason to drop the decision ('already_replied', 'already_quoted',
+        'near_duplicate'), or None if it's fine to send"""
+        action = decision.get("action")
+        tweet_id = decision.get("tweet_id")
+        reason = None
+        if action == "reply" and tweet_id and self._has_own(self.store.replies_to(tweet_id)):
+            reason = 'already_replied'
+        elif action == "quote" and tweet_id and self._has_own(self.store.quotes_of(tweet_id)):
+            reason = 'already_quoted'
+        elif action in TEXT_ACTIONS and decision.get("text", "").strip():
+            reason = self._check_text(decision["text"])
+        if reason:
+            self.suppressed[reason] += 1
+        return reason
+
+    def _check_text(self, text: str) -> Optional[str]:
+        self._load()
+        if not self._texts:
+            return None
+        # Exact repeats don't need the encoder
+        if _normalize(text) in {_normalize(t) for t in self._texts}:
+            return 'near_duplicate'
+        scores, _ = self._index.search(self._encode([text]), 1)
+        if scores[0][0] >= self.threshold:
+            return 'near_duplicate'
+        return None
+
+    def record(self, tweet: Dict):
+        """Remember a tweet the bot just sent"""
+        if self._index is not None and tweet.get('text'):
+            self._add([tweet['text']])
@@ -0,0 +1,187 @@
+# embedding_cache.py
+import hashlib
+import json
+import os
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+
+def text_hash(text: str) -> int:
+    """The first 8 bytes of the text's sha1, as a signed 64-bit int"""
+    return int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def as_hash(value: Union[int, str]) -> int:
+    """A stored text hash; caches from before text_hash returned an int hold
+    the sha1 hex digest, whose first 8 bytes give the same value"""
+    if isinstance(value, str):
+        return int.from_bytes(bytes.fromhex(value[:16]), "big", signed=True)
+    return value
+
+
+class EmbeddingCache:
+    """Embeddings persisted next to the tweet store, keyed by tweet id + text hash + model name.
+
+    Vectors live in a raw float32 file that is memory-mapped on load and only
+    ever appended to. The row map is a JSON snapshot plus an append-only log
+    of changes since it was written, so a save costs the changed rows only;
+    the snapshot is rewritten (and the log emptied) once the log outgrows it.
+    """
+
+    def __init__(self, storage_dir: str, model_name: str, dim: int):
+        self.vectors_file = os.path.join(storage_dir, "embeddings.f32")
+        self.meta_file = os.path.join(storage_dir, "embeddings.json")
+        self.log_file = os.path.join(storage_dir, "embeddings.log")
+        self.model_name = model_name
+        self.dim = dim
+        self.rows: Dict[str, int] = {}  # tweet_id -> row
+        self.hashes = array('q')        # row -> hash of the text it was encoded from
+        self.count = 0
+        self.generation = 0  # log lines of an older snapshot are ignored
+        self._vectors = None
+        self._log: List[list] = []  # changes not yet appended to the log
+        self._log_lines = 0
+        self._snapshot_rows = 0  # the log is folded in once it outgrows the snapshot
+        self._rewrite = False
+
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, "r") as f:
+                meta = json.load(f)
+            self.generation = meta.get("generation", 0)
+            if meta.get("model") != model_name or meta.get("dim") != dim:
+                print(f"[EmbeddingCache] Cache built with {meta.get('model')}, rebuilding for {model_name}")
+                self._rewrite = True
+            else:
+                self.count = meta["count"]
+                self.hashes = array('q', bytes(8 * self.count))
+                for tid, (row, h) in meta["rows"].items():
+                    self._set_row(tid, row, h)
+                self._snapshot_rows = len(self.rows)
+                self._replay_log()
+        else:
+            self._rewrite = True
+        self._map_vectors()
+
+    def _replay_log(self):
+        """Apply the changes logged since the snapshot"""
+        if not os.path.exists(self.log_file):
+            return
+        with open(self.log_file, "r") as f:
+            for line in f:
+                try:
+                    generation, tid, row, h = json.loads(line)
+                except ValueError:
+                    break  # a line cut short by a crash ends the log
+                if generation != self.generation:
+                    continue
+                self._log_lines += 1
+                if row is None:
+                    self.rows.pop(tid, None)
+                else:
+                    self._set_row(tid, row, h)
+
+    def _set_row(self, tweet_id: str, row: int, h: Union[int, str]):
+        if row >= len(self.hashes):
+            self.hashes.extend(bytes(8 * (row + 1 - len(self.hashes))))
+        self.hashes[row] = as_hash(h)
+        # Interned so the store, this cache and the vector index share one copy of each id
+        self.rows[sys.intern(tweet_id)] = row
+        self.count = max(self.count, row + 1)
+
+    def _map_vectors(self):
+        if self.count and os.path.exists(self.vectors_file):
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        else:
+            if self.rows:
+                self._rewrite = True  # the vectors file is gone, so is every row
+            self.count = 0
+            self.rows = {}
+            self.hashes = array('q')
+            self._vectors = None
+
+    def get(self, tweet_id: str, text: str) -> Optional[np.ndarray]:
+        """Cached vector for this tweet, or None if missing or the text changed"""
+        row = self.rows.get(tweet_id)
+        if row is None or self.hashes[row] != text_hash(text):
+            return None
+        return self._vectors[row]
+
+    def lookup(self, tweet_ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """Cached vectors by id alone, skipping the text check: the ids that
+        have one and their vectors, row-aligned. For tweets the index is
+        already synced with, whose cached rows are current."""
+        found = [tid for tid in tweet_ids if tid in self.rows]
+        if not found:
+            return [], np.empty((0, self.dim), dtype=np.float32)
+        return found, self._vectors[[self.rows[tid] for tid in found]]
+
+    def put_many(self, tweet_ids: List[str], texts: List[str], vectors: np.ndarray):
+        """Append vectors for (new or edited) tweets"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        # Write at the last committed row so a crash before save() leaves no orphans
+        mode = "r+b" if os.path.exists(self.vectors_file) else "wb"
+        with open(self.vectors_file, mode) as f:
+            f.seek(self.count * self.dim * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+        for tid, text in zip(tweet_ids, texts):
+            row, h = self.count, text_hash(text)
+            self._set_row(tid, row, h)  # advances count
+            self._log.append([self.generation, tid, row, h])
+        self._map_vectors()
+
+    def discard(self, tweet_ids: List[str]):
+        """Forget cached vectors for deleted tweets (their rows are compacted later)"""
+        for tid in tweet_ids:
+            if self.rows.pop(tid, None) is not None:
+                self._log.append([self.generation, tid, None, None])
+
+    def save(self):
+        """Append the pending changes to the log; compact away rows orphaned
+        by edits and rewrite the snapshot once either has grown too large"""
+        if not self._log and not self._rewrite:
+            return
+        if self.count > 2 * len(self.rows):
+            self._compact()
+        if self._rewrite or self._log_lines + len(self._log) > max(1024, self._snapshot_rows):
+            self._write_snapshot()
+            return
+        with open(self.log_file, "a") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in self._log)
+        self._log_lines += len(self._log)
+        self._log = []
+
+    def _write_snapshot(self):
+        """Write the whole row map under a new generation, which retires the log"""
+        self.generation += 1
+        tmp_file = self.meta_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": self.dim,
+                "count": self.count,
+                "generation": self.generation,
+                "rows": {tid: [row, self.hashes[row]] for tid, row in self.rows.items()},
+            }, f)
+        os.replace(tmp_file, self.meta_file)
+        open(self.log_file, "w").close()
+        self._log = []
+        self._log_lines = 0
+        self._snapshot_rows = len(self.rows)
+        self._rewrite = False
+
+    def _compact(self):
+        live = sorted(self.rows.items(), key=lambda item: item[1])
+        rows = [row for _, row in live]
+        tmp_file = self.vectors_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(np.ascontiguousarray(self._vectors[rows]).tobytes())
+        os.replace(tmp_file, self.vectors_file)
+        self.hashes = array('q', (self.hashes[row] for row in rows))
+        self.rows = {tid: i for i, (tid, _) in enumerate(live)}
+        self.count = len(live)
+        self._map_vectors()
+        self._rewrite = True  # row numbers changed
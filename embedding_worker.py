@@ -0,0 +1,233 @@
+# embedding_worker.py
+# sentence_transformers (and torch) are imported by the worker thread on the first request
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+
+class _EncodeJob:
+    def __init__(self, texts: List[str], normalize: bool):
+        self.texts = texts
+        self.normalize = normalize
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class EmbeddingWorker:
+    """One embedding model on one background thread, shared by every caller.
+
+    submit() returns a Future right away, so callers can do network or
+    index work while their texts are encoded. The worker coalesces queued
+    requests into micro-batches: once it is busy (the last batch merged
+    several requests, or more are already waiting) it collects requests for
+    up to max_latency seconds or max_batch texts before one model call;
+    a lone request on an idle worker is encoded at once. Recently encoded
+    texts are kept in an LRU cache of cache_size entries, and a text that
+    is already being encoded isn't queued twice, so prefetching a mention
+    and then storing and retrieving with it costs one encode. threads sets
+    torch's CPU thread count for the model (process-wide, as torch has one
+    pool). encode() blocks on submit() and has SentenceTransformer's
+    signature, so the worker can be passed to TweetStore as its encoder.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", embedding_size: Optional[int] = None,
+                 encoder=None, batch_size: int = 64, max_latency: float = 0.005, max_batch: int = 256,
+                 cache_size: int = 10000, threads: Optional[int] = None):
+        # Any object with SentenceTransformer's encode() can stand in for the model
+        self._model = encoder
+        self.model_name = getattr(encoder, 'model_name', model_name)
+        self.embedding_size = embedding_size or getattr(encoder, 'embedding_size', 384)
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.threads = threads
+        self.load_seconds: Optional[float] = None
+        self._queue: "queue.Queue[Optional[_EncodeJob]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()  # guards the cache, in-flight map and counters
+        self._cache: "OrderedDict[Tuple[bool, str], object]" = OrderedDict()
+        self._inflight: Dict[Tuple[bool, str], Tuple[_EncodeJob, int]] = {}
+        self.counters = {'requests': 0, 'texts': 0, 'cache_hits': 0, 'inflight_hits': 0,
+                         'model_calls': 0, 'encoded': 0}
+
+    @property
+    def model(self):
+        """The SentenceTransformer, loaded on first use (by the worker thread)"""
+        if self._model is None:
+            start = time.perf_counter()
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+            self.load_seconds = time.perf_counter() - start
+            print(f"[EmbeddingWorker] Loaded {self.model_name} in {self.load_seconds:.2f}s")
+        return self._model
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+                self._thread.start()
+
+    def submit(self, sentences, normalize_embeddings: bool = False) -> Future:
+        """Future of the embeddings for one text (1-d) or a list of texts (2-d)"""
+        import numpy as np
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        result: Future = Future()
+        if not texts:
+            result.set_result(np.empty((0, self.embedding_size), dtype=np.float32))
+            return result
+        rows: List = [None] * len(texts)
+        parts: List[Tuple[int, _EncodeJob, int]] = []  # (position, job, row in job)
+        new_job = None
+        with self._lock:
+            self.counters['requests'] += 1
+            self.counters['texts'] += len(texts)
+            misses: Dict[str, List[int]] = {}
+            for i, text in enumerate(texts):
+                key = (normalize_embeddings, text)
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    rows[i] = vector
+                    self.counters['cache_hits'] += 1
+                elif key in self._inflight:
+                    parts.append((i,) + self._inflight[key])
+                    self.counters['inflight_hits'] += 1
+                else:
+                    misses.setdefault(text, []).append(i)
+            if misses:
+                new_job = _EncodeJob(list(misses), normalize_embeddings)
+                for row, (text, positions) in enumerate(misses.items()):
+                    self._inflight[(normalize_embeddings, text)] = (new_job, row)
+                    parts.extend((i, new_job, row) for i in positions)
+        queued = len(new_job.texts) if new_job else 0
+        metrics.inc("embedding_cache_total", len(texts) - queued, result="hit")
+        metrics.inc("embedding_cache_total", queued, result="miss")
+
+        def finish():
+            vectors = np.array(rows, dtype=np.float32).reshape(len(texts), self.embedding_size)
+            result.set_result(vectors[0] if single else vectors)
+
+        if not parts:
+            finish()
+            return result
+
+        jobs = {id(job): job for _, job, _ in parts}
+        remaining = [len(jobs)]
+        countdown = threading.Lock()
+
+        def job_done(_):
+            with countdown:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            for i, job, row in parts:
+                error = job.future.exception()
+                if error is not None:
+                    result.set_exception(error)
+                    return
+                rows[i] = job.future.result()[row]
+            finish()
+
+        if new_job is not None:
+            self._ensure_started()
+            self._queue.put(new_job)
+        for job in jobs.values():
+            job.future.add_done_callback(job_done)
+        return result
+
+    def encode(self, sentences, batch_size: Optional[int] = None, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, **kwargs):
+        """Embeddings for one text or a list of texts, waiting for the worker"""
+        return self.submit(sentences, normalize_embeddings).result()
+
+    def _run(self):
+        if self.threads:
+            try:
+                import torch
+                torch.set_num_threads(self.threads)
+            except ImportError:
+                pass
+        coalesced = False  # did the last batch merge several requests?
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            jobs = [job]
+            count = len(job.texts)
+            busy = coalesced or not self._queue.empty()
+            deadline = time.monotonic() + (self.max_latency if busy else 0.0)
+            stop = False
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True  # finish this batch, then exit
+                    break
+                jobs.append(job)
+                count += len(job.texts)
+            coalesced = len(jobs) > 1
+            for normalize in {j.normalize for j in jobs}:
+                self._encode([j for j in jobs if j.normalize == normalize], normalize)
+            if stop:
+                return
+
+    def _encode(self, jobs: List[_EncodeJob], normalize: bool):
+        import numpy as np
+        texts = [text for job in jobs for text in job.texts]
+        start = time.perf_counter()
+        for job in jobs:
+            metrics.observe("embedding_queue_seconds", start - job.enqueued)
+        metrics.observe("embedding_worker_batch_texts", len(texts))
+        try:
+            with metrics.timer("encode_seconds", kind="worker"):
+                vectors = np.array(self.model.encode(texts, batch_size=self.batch_size,
+                                                     normalize_embeddings=normalize),
+                                   dtype=np.float32).reshape(len(texts), -1)
+        except Exception as e:
+            with self._lock:
+                for job in jobs:
+                    for text in job.texts:
+                        self._inflight.pop((normalize, text), None)
+            for job in jobs:
+                job.future.set_exception(e)
+            return
+        offset = 0
+        with self._lock:
+            self.counters['model_calls'] += 1
+            self.counters['encoded'] += len(texts)
+            for job in jobs:
+                for row, text in enumerate(job.texts):
+                    key = (normalize, text)
+                    self._inflight.pop(key, None)
+                    if self.cache_size:
+                        # Copies, so a cached row doesn't keep its whole batch alive
+                        self._cache[key] = vectors[offset + row].copy()
+                        self._cache.move_to_end(key)
+                offset += len(job.texts)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        offset = 0
+        for job in jobs:
+            job.future.set_result(vectors[offset:offset + len(job.texts)])
+            offset += len(job.texts)
+
+    def close(self):
+        """Stop the worker thread once the queued requests are done"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,302 @@
+# fakes.py
+# Local stand-ins for external APIs, for tests and benchmarks
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+def _default_responder(params: Dict) -> str:
+    return json.dumps({"action": "do_nothing", "tweet_id": None, "text": ""})
+
+
+def _continue_prefill(params: Dict, text: str) -> str:
+    """The API continues a prefilled assistant turn rather than repeating it"""
+    messages = params["messages"]
+    if messages[-1]["role"] == "assistant" and text.startswith(messages[-1]["content"]):
+        return text[len(messages[-1]["content"]):]
+    return text
+
+
+def fake_message(text: str, input_tokens: int = 0, output_tokens: int = 0):
+    """Object shaped like an anthropic Message with a single text block"""
+    return SimpleNamespace(
+        content=[SimpleNamespace(type="text", text=text)],
+        usage=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                              cache_read_input_tokens=0, cache_creation_input_tokens=0),
+        stop_reason="end_turn",
+    )
+
+
+class FakeMessageBatches:
+    """In-memory Message Batches endpoint (create/retrieve/results/cancel).
+
+    A batch reports "in_progress" for polls_until_done retrieve() calls and
+    then "ended". Every request succeeds with responder(params) as its text,
+    except custom_ids listed in fail_ids, which come back "errored".
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict], str]] = None, polls_until_done: int = 1,
+                 fail_ids: Optional[List[str]] = None):
+        self.responder = responder or _default_responder
+        self.polls_until_done = polls_until_done
+        self.fail_ids = set(fail_ids or [])
+        self.batches: Dict[str, Dict] = {}
+        self._ids = itertools.count(1)
+
+    def _status(self, batch_id: str):
+        batch = self.batches[batch_id]
+        status = "ended" if batch["polls"] >= self.polls_until_done or batch["cancelled"] else "in_progress"
+        return SimpleNamespace(id=batch_id, processing_status=status)
+
+    def create(self, requests: List[Dict]):
+        batch_id = f"msgbatch_fake_{next(self._ids)}"
+        self.batches[batch_id] = {"requests": requests, "polls": 0, "cancelled": False}
+        return self._status(batch_id)
+
+    def retrieve(self, batch_id: str):
+        self.batches[batch_id]["polls"] += 1
+        return self._status(batch_id)
+
+    def cancel(self, batch_id: str):
+        self.batches[batch_id]["cancelled"] = True
+        return self._status(batch_id)
+
+    def results(self, batch_id: str):
+        for request in self.batches[batch_id]["requests"]:
+            custom_id = request["custom_id"]
+            if custom_id in self.fail_ids:
+                result = SimpleNamespace(type="errored", error=SimpleNamespace(type="api_error"))
+            else:
+                prompt_chars = sum(len(m["content"]) for m in request["params"]["messages"])
+                text = _continue_prefill(request["params"], self.responder(request["params"]))
+                result = SimpleNamespace(type="succeeded",
+                                         message=fake_message(text, prompt_chars // 4, len(text) // 4))
+            yield SimpleNamespace(custom_id=custom_id, result=result)
+
+
+class _FakeServer:
+    """Serves handle() from a ThreadingHTTPServer on a free localhost port.
+
+    Use as a context manager; .url is the base URL to point a client at and
+    .calls counts requests per "METHOD /path".
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # seconds added to every response
+        self.calls: Counter = Counter()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+            # Headers and body go out as separate writes; without this, delayed
+            # ACKs add ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def _serve(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                fake.calls[f"{method} {parsed.path}"] += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, headers, payload = fake.handle(method, parsed.path, parse_qs(parsed.query), body)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]], body) -> Tuple[int, Dict, bytes]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _json(status: int, data, headers: Optional[Dict] = None) -> Tuple[int, Dict, bytes]:
+        return status, dict(headers or {}, **{"Content-Type": "application/json"}), json.dumps(data).encode("utf-8")
+
+
+def to_v2_tweet(tweet: Dict) -> Dict:
+    """Convert a TweetStore-style dict into a Twitter v2 tweet object"""
+    tweet_id = tweet.get('tweet_id') or tweet.get('id')
+    v2 = {"id": tweet_id, "text": tweet.get('text', ''), "author_id": tweet.get('author_id'),
+          "created_at": tweet.get('created_at'), "conversation_id": tweet.get('conversation_id') or tweet_id}
+    refs = [{"type": "replied_to", "id": tweet['in_reply_to_status_id']}] if tweet.get('in_reply_to_status_id') else []
+    if tweet.get('quoted_tweet_id'):
+        refs.append({"type": "quoted", "id": tweet['quoted_tweet_id']})
+    if refs:
+        v2["referenced_tweets"] = refs
+    return v2
+
+
+class FakeTwitterServer(_FakeServer):
+    """Twitter API v2 stand-in: users/me, mentions (since_id + pagination),
+    bulk tweet lookup with referenced_tweets expansions, and posting.
+
+    Every response carries generous x-rate-limit-* headers; script() queues
+    error statuses or other headers for an endpoint's next responses.
+    """
+
+    def __init__(self, user_id: str = "1000000001", username: str = "bench_bot", latency: float = 0.0):
+        super().__init__(latency)
+        self.user_id = user_id
+        self.username = username
+        self.tweets: Dict[str, Dict] = {}  # id -> v2 tweet
+        self.mention_ids: List[str] = []
+        self.scripted: Dict[str, List[Tuple[int, Dict]]] = {}
+        self._next_id = itertools.count(2 * 10 ** 18)
+        self._lock = threading.Lock()
+
+    def add_tweets(self, tweets: Iterable[Dict]):
+        """Make tweets available to lookups and expansions"""
+        for tweet in tweets:
+            v2 = to_v2_tweet(tweet)
+            self.tweets[v2["id"]] = v2
+
+    def add_mentions(self, tweets: Iterable[Dict]):
+        """Add tweets that show up on the bot's mentions timeline"""
+        tweets = list(tweets)
+        self.add_tweets(tweets)
+        self.mention_ids.extend(t.get('tweet_id') or t.get('id') for t in tweets)
+
+    def script(self, endpoint: str, *responses: Tuple[int, Dict]):
+        """Answer the next requests to endpoint ("GET /2/tweets") with these
+        (status, headers) in order; a 2xx status serves the normal body with
+        the headers added
+        """
+        with self._lock:
+            self.scripted.setdefault(endpoint, []).extend(responses)
+
+    def _headers(self) -> Dict:
+        return {"x-rate-limit-limit": "10000", "x-rate-limit-remaining": "9999",
+                "x-rate-limit-reset": str(int(time.time()) + 900)}
+
+    def _includes(self, tweets: List[Dict]) -> Dict:
+        refs = {ref["id"] for t in tweets for ref in t.get("referenced_tweets", [])}
+        return {"tweets": [self.tweets[r] for r in refs if r in self.tweets]}
+
+    def handle(self, method, path, query, body):
+        with self._lock:
+            queue = self.scripted.get(f"{method} {path}")
+            status, headers = queue.pop(0) if queue else (200, {})
+        if status >= 300:
+            return self._json(status, {"title": "Scripted error", "status": status}, dict(self._headers(), **headers))
+        status, base, payload = self._route(method, path, query, body)
+        return status, dict(base, **headers), payload
+
+    def _route(self, method, path, query, body):
+        if method == "GET" and path == "/2/users/me":
+            return self._json(200, {"data": {"id": self.user_id, "username": self.username, "name": self.username}},
+                              self._headers())
+        if method == "GET" and path == f"/2/users/{self.user_id}/mentions":
+            since_id = int(query.get("since_id", ["0"])[0])
+            page_size = int(query.get("max_results", ["10"])[0])
+            offset = int(query.get("pagination_token", ["0"])[0])
+            ids = sorted((i for i in self.mention_ids if int(i) > since_id), key=int, reverse=True)
+            page = [self.tweets[i] for i in ids[offset:offset + page_size]]
+            meta = {"result_count": len(page)}
+            if page:
+                meta.update(newest_id=page[0]["id"], oldest_id=page[-1]["id"])
+            if offset + page_size < len(ids):
+                meta["next_token"] = str(offset + page_size)
+            data = {"meta": meta}
+            if page:
+                data.update(data=page, includes=self._includes(page))
+            return self._json(200, data, self._headers())
+        if method == "GET" and path == "/2/tweets":
+            ids = query.get("ids", [""])[0].split(",")
+            found = [self.tweets[i] for i in ids if i in self.tweets]
+            return self._json(200, {"data": found, "includes": self._includes(found)}, self._headers())
+        if method == "POST" and path == "/2/tweets":
+            with self._lock:
+                tweet_id = str(next(self._next_id))
+            tweet = {"id": tweet_id, "text": body.get("text", ""), "author_id": self.user_id}
+            if body.get("reply"):
+                tweet["referenced_tweets"] = [{"type": "replied_to", "id": body["reply"]["in_reply_to_tweet_id"]}]
+            elif body.get("quote_tweet_id"):
+                tweet["referenced_tweets"] = [{"type": "quoted", "id": body["quote_tweet_id"]}]
+            self.tweets[tweet_id] = tweet
+            return self._json(201, {"data": {"id": tweet_id, "text": tweet["text"]}}, self._headers())
+        return self._json(404, {"title": "Not Found", "detail": f"{method} {path}"})
+
+
+class FakeAnthropicServer(_FakeServer):
+    """Messages API stand-in (POST /v1/messages, streaming or not).
+
+    responder(params) returns the reply text; a prefilled assistant turn is
+    continued, not repeated. Point the SDK here with ANTHROPIC_BASE_URL.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict], str]] = None, latency: float = 0.0,
+                 chunk_chars: int = 8):
+        super().__init__(latency)
+        self.responder = responder or _default_responder
+        self.chunk_chars = chunk_chars
+
+    def handle(self, method, path, query, body):
+        if method != "POST" or path != "/v1/messages":
+            return self._json(404, {"type": "error", "error": {"type": "not_found_error", "message": path}})
+        text = _continue_prefill(body, self.responder(body))
+        input_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+        output_tokens = max(1, len(text) // 4)
+        message = {"id": "msg_fake", "type": "message", "role": "assistant", "model": body["model"],
+                   "content": [], "stop_reason": None, "stop_sequence": None,
+                   "usage": {"input_tokens": input_tokens, "output_tokens": 1}}
+        if not body.get("stream"):
+            message.update(content=[{"type": "text", "text": text}], stop_reason="end_turn",
+                           usage={"input_tokens": input_tokens, "output_tokens": output_tokens})
+            return self._json(200, message)
+
+        events = [("message_start", {"type": "message_start", "message": message}),
+                  ("content_block_start", {"type": "content_block_start", "index": 0,
+                                           "content_block": {"type": "text", "text": ""}})]
+        for start in range(0, len(text), self.chunk_chars):
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                   "delta": {"type": "text_delta",
+                                                             "text": text[start:start + self.chunk_chars]}}))
+        events += [("content_block_stop", {"type": "content_block_stop", "index": 0}),
+                   ("message_delta", {"type": "message_delta",
+                                      "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": output_tokens}}),
+                   ("message_stop", {"type": "message_stop"})]
+        payload = "".join(f"event: {name}\ndata: {json.dumps(data)}\n\n" for name, data in events)
+        return 200, {"Content-Type": "text/event-stream"}, payload.encode("utf-8")
@@ -0,0 +1,170 @@
+# http_transport.py
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "DELETE"}
+
+
+def endpoint_key(method: str, url: str) -> str:
+    """Rate-limit bucket for a request, e.g. 'GET /2/users/:id/mentions'"""
+    # Numeric ids (but not the /2 API version) share one bucket
+    path = re.sub(r"/\d{3,}(?=/|$)", "/:id", urlparse(url).path)
+    return f"{method.upper()} {path}"
+
+
+class EndpointLimit:
+    """Rate-limit state of one endpoint, driven by x-rate-limit-* response headers.
+
+    Tokens are spent locally as requests go out, so concurrent callers can't
+    overshoot before the next response refreshes the numbers.
+    """
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds until a request would be allowed"""
+        if self.remaining is None or self.remaining > 0:
+            return 0.0
+        return max(0.0, self.reset_at - time.time())
+
+    def spacing(self) -> float:
+        """Seconds per request that spreads the remaining budget over the window"""
+        now = time.time()
+        if self.remaining is None or self.reset_at <= now:
+            return 0.0
+        if self.remaining <= 0:
+            return self.reset_at - now
+        return (self.reset_at - now) / self.remaining
+
+    def acquire(self, max_wait: float):
+        """Wait for a token (at most max_wait; past that, let the request 429)"""
+        with self._lock:
+            wait = self.delay()
+            if 0 < wait <= max_wait:
+                print(f"[HttpTransport] Rate limit exhausted, waiting {wait:.0f}s for reset")
+                time.sleep(wait)
+                self.remaining = None  # unknown until the next response
+            elif self.remaining is not None and self.remaining > 0:
+                self.remaining -= 1
+
+    def update(self, headers):
+        try:
+            if "x-rate-limit-remaining" in headers:
+                self.remaining = int(headers["x-rate-limit-remaining"])
+            if "x-rate-limit-limit" in headers:
+                self.limit = int(headers["x-rate-limit-limit"])
+            if "x-rate-limit-reset" in headers:
+                self.reset_at = float(headers["x-rate-limit-reset"])
+        except ValueError:
+            pass
+
+    def snapshot(self) -> Dict:
+        return {"limit": self.limit, "remaining": self.remaining, "reset_at": self.reset_at}
+
+
+class RateLimitedTransport:
+    """Shared HTTP layer for a requests/OAuth1 session.
+
+    Adds keep-alive connection pooling, timeouts, jittered exponential
+    retries on connection errors, 429 and 5xx (5xx only for idempotent
+    methods, so a POST is never sent twice), and per-endpoint rate limits
+    taken from Twitter's x-rate-limit-* headers.
+    """
+
+    def __init__(self, session: requests.Session, timeout=(5, 30), max_retries: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, pool_maxsize: int = 10,
+                 max_wait: float = 900.0):
+        self.session = session
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait  # longest we'll block for a rate-limit reset
+        self.limits: Dict[str, EndpointLimit] = {}
+        self._limits_lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def _limit(self, key: str) -> EndpointLimit:
+        with self._limits_lock:
+            if key not in self.limits:
+                self.limits[key] = EndpointLimit()
+            return self.limits[key]
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def delay_for(self, method: str, url: str) -> float:
+        """Seconds until a request to this endpoint would be allowed"""
+        return self._limit(endpoint_key(method, url)).delay()
+
+    def spacing_for(self, method: str, url: str) -> float:
+        """Seconds between requests to this endpoint that won't exhaust its limit"""
+        return self._limit(endpoint_key(method, url)).spacing()
+
+    def headroom(self) -> Dict[str, Dict]:
+        """Known rate-limit state per endpoint"""
+        return {key: limit.snapshot() for key, limit in self.limits.items()}
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        method = method.upper()
+        key = endpoint_key(method, url)
+        limit = self._limit(key)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            limit.acquire(self.max_wait)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("http_errors_total", endpoint=key, error=e.__class__.__name__)
+                if attempt == self.max_retries or method not in IDEMPOTENT_METHODS:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"[HttpTransport] {method} {url} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                metrics.inc("http_retries_total", endpoint=key)
+                time.sleep(delay)
+                continue
+
+            metrics.observe("http_request_seconds", time.perf_counter() - start,
+                            endpoint=key, status=str(response.status_code))
+            limit.update(response.headers)
+            retryable = response.status_code == 429 or (
+                response.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS)
+            if not retryable or attempt == self.max_retries:
+                return response
+
+            delay = self._backoff(attempt)
+            if response.status_code == 429:
+                delay = max(delay, limit.delay())
+                retry_after = response.headers.get("retry-after")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                if delay > self.max_wait:
+                    return response
+            print(f"[HttpTransport] {method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            metrics.inc("http_retries_total", endpoint=key)
+            time.sleep(delay)
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
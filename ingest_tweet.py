@@ -1,21 +1,119 @@
 #ingest_tweet.py
 import argparse
+import json
 import os
+from datetime import datetime
+from typing import Dict, Iterator, Optional
 from rag import TweetStore
 
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """Yield one tweet dict per non-empty line"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def iter_archive(path: str, chunk_size: int = 1 << 20) -> Iterator[Dict]:
+    """Stream tweets out of a Twitter archive data/tweets.js without loading the whole file.
+
+    The file is `window.YTD.tweets.part0 = [ {"tweet": {...}}, ... ]`, so we
+    skip to the opening bracket and decode one array element at a time.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        while "[" not in buf:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+        pos = buf.index("[") + 1
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    if buf[pos:].strip():
+                        raise
+                    return
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield obj.get("tweet", obj)
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+def archive_to_tweet(tweet: Dict, author_id: Optional[str]) -> Dict:
+    """Map an archive tweet onto the fields TweetStore understands"""
+    created_at = tweet.get("created_at")
+    if created_at:
+        try:
+            created_at = datetime.strptime(created_at, "%a %b %d %H:%M:%S %z %Y").isoformat()
+        except ValueError:
+            pass
+    return {
+        "tweet_id": tweet.get("id_str") or tweet.get("id"),
+        "author_id": tweet.get("author_id") or author_id,
+        "text": tweet.get("full_text") or tweet.get("text"),
+        "created_at": created_at,
+        "in_reply_to_status_id": tweet.get("in_reply_to_status_id_str") or tweet.get("in_reply_to_status_id"),
+        "quoted_tweet_id": tweet.get("quoted_status_id_str") or tweet.get("quoted_tweet_id"),
+    }
+
+def ingest_file(store: TweetStore, path: str, fmt: str, author_id: Optional[str],
+                batch_size: int, mark_unread: bool) -> int:
+    """Stream a JSONL or archive file into the store in batches"""
+    if fmt == "auto":
+        fmt = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "archive"
+    source = iter_jsonl(path) if fmt == "jsonl" else iter_archive(path)
+
+    def tweets():
+        for raw in source:
+            tweet = archive_to_tweet(raw, author_id) if fmt == "archive" else dict(raw)
+            if author_id and not tweet.get("author_id"):
+                tweet["author_id"] = author_id
+            # Backfilled history is context, not something to reply to
+            tweet.setdefault("is_read", not mark_unread)
+            yield tweet
+
+    return store.store_tweets(tweets(), batch_size=batch_size)
+
 def main():
     parser = argparse.ArgumentParser(description="Manually ingest a tweet into local storage.")
-    parser.add_argument("--tweet_id", required=True, help="The ID of the tweet.")
-    parser.add_argument("--author_id", required=True, help="The ID of the tweet author.")
-    parser.add_argument("--text", required=True, help="The text of the tweet.")
+    parser.add_argument("--tweet_id", help="The ID of the tweet.")
+    parser.add_argument("--author_id", help="The ID of the tweet author.")
+    parser.add_argument("--text", help="The text of the tweet.")
     parser.add_argument("--parent_tweet_id", default=None, help="The parent tweet ID if this is a reply.")
     parser.add_argument("--url", default="", help="Optional URL of the tweet.")
+    parser.add_argument("--file", default=None, help="Bulk mode: JSONL file or Twitter archive tweets.js to ingest.")
+    parser.add_argument("--format", choices=["auto", "jsonl", "archive"], default="auto", help="Format of --file.")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Tweets encoded and saved per batch in bulk mode.")
+    parser.add_argument("--mark_unread", action="store_true", help="Queue bulk-ingested tweets for the bot instead of marking them read.")
 
     args = parser.parse_args()
+    if not args.file and not all([args.tweet_id, args.author_id, args.text]):
+        parser.error("--tweet_id, --author_id and --text are required unless --file is given")
 
     # Initialize the TweetStore
     store = TweetStore()
 
+    if args.file:
+        if not os.path.exists(args.file):
+            parser.error(f"File not found: {args.file}")
+        store.warm_up()
+        count = ingest_file(store, args.file, args.format, args.author_id, args.batch_size, args.mark_unread)
+        print(f"Successfully stored {count} tweets from {args.file}")
+        store.close()
+        return
+
     # Build the tweet data
     new_tweet = {
         "tweet_id": args.tweet_id,
@@ -33,9 +131,11 @@ def main():
         print(f"Successfully stored tweet {args.tweet_id}")
     except Exception as e:
         print(f"Failed to store tweet: {str(e)}")
+    store.close()
 
 if __name__ == "__main__":
     main()
 
 
-#python ingest_tweet.py --tweet_id "1880697005976236285" --author_id "thekitze" --text "I have NO IDEA what cloudflare is or does" --parent_tweet_id "1880697005976236285"
\ No newline at end of file
+#python ingest_tweet.py --tweet_id "1880697005976236285" --author_id "thekitze" --text "I have NO IDEA what cloudflare is or does" --parent_tweet_id "1880697005976236285"
+#python ingest_tweet.py --file data/tweets.js --author_id "1234567890"
@@ -0,0 +1,121 @@
+# lexical_index.py
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Callable, Collection, Dict, List, Optional, Tuple
+
+# URLs, @handles, #hashtags and $tickers stay whole; everything else splits into words
+TOKEN_RE = re.compile(r"https?://[^\s<>\"]+|[@#$][A-Za-z0-9_]+|[^\W_]+(?:'[^\W_]+)*")
+URL_TRAILING = ".,;:!?)]}'\""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased BM25 terms.
+
+    '@handle', '#tag' and '$tick' are kept with their sigil, so a query for
+    $AAPL doesn't match every tweet saying "aapl", and are also indexed as
+    the bare word. URLs are kept as one term without trailing punctuation.
+    """
+    terms = []
+    for match in TOKEN_RE.finditer(text):
+        token = match.group().lower()
+        if token.startswith("http"):
+            terms.append(token.rstrip(URL_TRAILING))
+        elif token[0] in "@#$":
+            terms.append(token)
+            terms.append(token[1:])
+        else:
+            terms.append(token)
+    return terms
+
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over tweet texts, keyed by tweet id.
+
+    Postings map each term to {tweet_id: term frequency}. Scoring a query
+    only walks the postings of its terms, and when a candidate set is given
+    it walks whichever is smaller, the postings or the candidates, so
+    filtered queries cost less than unfiltered ones. Terms in more than
+    common_cutoff of all tweets only add to tweets a rarer query term
+    already matched, so words like "the" don't make every query scan most
+    of the index, and long queries (whole tweets) keep only their
+    max_query_terms rarest terms.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, common_cutoff: float = 0.01,
+                 max_query_terms: int = 8):
+        self.k1 = k1
+        self.b = b
+        self.common_cutoff = common_cutoff
+        self.max_query_terms = max_query_terms
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}  # tweet_id -> number of terms
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, tweet_id: str, text: str):
+        """Index a tweet; call remove() with its old text first when it changes"""
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[tweet_id] = count
+        length = sum(terms.values())
+        self._lengths[tweet_id] = length
+        self._total_length += length
+
+    def remove(self, tweet_id: str, text: str):
+        """Drop a tweet, given the text it was indexed with"""
+        length = self._lengths.pop(tweet_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(tweet_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query: str, k: int, candidates: Optional[Collection[str]] = None,
+               accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """Top k (tweet_id, BM25 score), best first, limited to candidates and
+        to ids accept() returns True for"""
+        if not self._lengths:
+            return []
+        n = len(self._lengths)
+        avg_length = self._total_length / n
+        scores: Dict[str, float] = {}
+        terms = sorted((self._postings[term] for term in set(tokenize(query)) if term in self._postings),
+                       key=len)[:self.max_query_terms]
+        rare = [postings for postings in terms if len(postings) <= self.common_cutoff * n]
+        common = [postings for postings in terms if len(postings) > self.common_cutoff * n] if rare else []
+        for postings in rare or terms:
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            if candidates is None:
+                matches = postings.items()
+            elif len(candidates) < len(postings):
+                matches = ((tid, postings[tid]) for tid in candidates if tid in postings)
+            else:
+                matches = ((tid, tf) for tid, tf in postings.items() if tid in candidates)
+            for tweet_id, tf in matches:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[tweet_id] / avg_length)
+                scores[tweet_id] = scores.get(tweet_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        for postings in common:
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for tweet_id in scores:
+                tf = postings.get(tweet_id)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[tweet_id] / avg_length)
+                    scores[tweet_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        if accept is None:
+            return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        # Check accept() on the best-scored ids first, widening until k pass
+        fetch = k
+        while True:
+            top = heapq.nlargest(fetch, scores.items(), key=lambda item: item[1])
+            hits = [hit for hit in top if accept(hit[0])]
+            if len(hits) >= k or fetch >= len(scores):
+                return hits[:k]
+            fetch *= 4
@@ -1,89 +1,428 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+import argparse
+import json
+import os
+import signal
+import threading
 import time  # Added back for sleep() function
 
+_import_start = time.perf_counter()
 from twitter_client import TwitterClientV2
 from rag import TweetStore
 from model_integration import ModelInterface
+from prompt_builder import PromptBuilder
+from duplicate_guard import DuplicateGuard
+from metrics import metrics
+IMPORT_SECONDS = time.perf_counter() - _import_start
+
+class SerialWriter:
+    """Runs Twitter writes one at a time, spaced at least min_interval apart.
+
+    Rate limits themselves are enforced by the client's transport from the
+    response headers; min_interval is only an optional extra floor.
+    """
+    def __init__(self, min_interval=0.0):
+        self.min_interval = min_interval
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            wait = self._last_write + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._last_write = time.monotonic()
 
 class TwitterBot:
-    def __init__(self, max_actions_per_cycle=3):
-        self.twitter = TwitterClientV2()
-        self.store = TweetStore()
-        self.model = ModelInterface()
+    def __init__(self, max_actions_per_cycle=3, unread_priority="oldest", lease_seconds=3600,
+                 max_concurrency=4, min_write_interval=0.0, max_mentions_per_cycle=500,
+                 context_depth=2, batch_mode=False, batch_threshold=20, batch_max_tweets=500,
+                 prompt_token_budget=1500, context_k=5, duplicate_threshold=0.92,
+                 proactive_interval=0.0, encoder=None, metrics_dir=None,
+                 hot_days=None, max_hot_tweets=None, retention_days=None, compact=None,
+                 storage_dir="storage", twitter_credentials=None, anthropic_api_key=None, anthropic_client=None,
+                 embedding_threads=None):
+        self.startup_timings = {'imports': IMPORT_SECONDS}
+        # Everything the account owns (tweets, index, identity, decision cache)
+        # lives under storage_dir; credentials default to the environment
+        start = time.perf_counter()
+        self.twitter = TwitterClientV2(identity_path=os.path.join(storage_dir, "identity.json"),
+                                       credentials=twitter_credentials)
+        self.startup_timings['twitter_init'] = time.perf_counter() - start
+        # Read tweets past hot_days (or beyond max_hot_tweets) move to archive shards,
+        # only when one of them is set; compact ("fp16"/"int8"/"pq") trades a little
+        # recall for much less memory; embedding_threads caps torch's CPU threads
+        self.store = TweetStore(storage_dir=storage_dir, priority=unread_priority, encoder=encoder,
+                                hot_days=hot_days, max_hot_tweets=max_hot_tweets,
+                                retention_days=retention_days, compact=compact,
+                                embedding_threads=embedding_threads)
+        start = time.perf_counter()
+        self.model = ModelInterface(cache_path=os.path.join(storage_dir, "decision_cache.json"),
+                                    api_key=anthropic_api_key, client=anthropic_client)
+        self.startup_timings['model_client_init'] = time.perf_counter() - start
         self.max_actions_per_cycle = max_actions_per_cycle
+        self.lease_seconds = lease_seconds  # how long a crashed cycle keeps a tweet from being retried
+        self.max_concurrency = max_concurrency  # model calls in flight at once
+        self.max_mentions_per_cycle = max_mentions_per_cycle
+        self.context_depth = context_depth  # bulk lookups per cycle for missing thread context
+        # Backlogs of at least batch_threshold unread tweets go out as one Message Batches job
+        self.batch_mode = batch_mode
+        self.batch_threshold = batch_threshold
+        self.batch_max_tweets = batch_max_tweets
+        self.writer = SerialWriter(min_write_interval)
+        # Thread + related history per prompt, packed into a fixed token budget
+        self.prompt_builder = PromptBuilder(self.store, token_budget=prompt_token_budget, context_k=context_k)
+        # Drops repeat replies and near-duplicate texts before they cost a write
+        self.guard = DuplicateGuard(self.store, self.twitter.user_id, threshold=duplicate_threshold)
+        # Set while running as a daemon, so a pending Message Batch stops on shutdown
+        self.stop_event = None
+        # Minimum seconds between proactive posts (0 = every cycle with free slots)
+        self.proactive_interval = proactive_interval
         self.actions_taken = 0
+        self.last_mention_count = 0
+        # Per-cycle JSON reports and a Prometheus textfile go here when set
+        self.metrics_dir = metrics_dir
+        if metrics_dir:
+            metrics.enable()
+
+    def startup_report(self) -> dict:
+        """Seconds spent per startup stage; the embedding model and index only show up if they were loaded"""
+        report = dict(self.startup_timings)
+        report.update(self.store.timings)
+        if self.store.model.load_seconds is not None:
+            report['model_load'] = self.store.model.load_seconds
+        return {name: round(seconds, 3) for name, seconds in report.items()}
+
+    def _hydrate_context(self, mentions):
+        """Store the parents and quoted tweets of new mentions as (read) context.
+
+        Uses the expansions that came with the mentions first, then one bulk
+        lookup per missing level, up to context_depth levels.
+        """
+        def store_context(tweets):
+            new = {t['tweet_id']: dict(t, is_read=True) for t in tweets if not self.store.get_tweet(t['tweet_id'])}
+            self.store.store_tweets(new.values())
+
+        store_context(self.twitter.referenced_tweets)
+        frontier = list(mentions) + self.twitter.referenced_tweets
+        for _ in range(self.context_depth):
+            missing = self.store.missing_references(frontier)
+            if not missing:
+                break
+            frontier = self.twitter.get_tweets(missing)
+            store_context(frontier)
+
+    def _execute_decision(self, decision: dict):
+        """Carry out one model decision; Twitter writes go through the serial writer"""
+        action = decision.get("action", "do_nothing")
+        tweet_id = decision.get("tweet_id")
+        text = decision.get("text", "")
+
+        reason = self.guard.check(decision)
+        if reason:
+            print(f"[Bot] Dropping {action} ({reason}): {text}")
+            metrics.inc("actions_total", action=action, outcome=reason)
+            return
+        result = None
+
+        if action == "post":
+            print("[Bot] Posting new tweet...")
+            result = self.writer.submit(self.twitter.post_tweet, text)
+            if result:
+                self._store_own(result)
+                print(f"[Bot] Successfully posted: {text}")
+        elif action == "reply" and tweet_id:
+            result = self.writer.submit(self.twitter.reply_tweet, tweet_id, text)
+            if result:
+                self._store_own(result)
+                print(f"[Bot] Successfully replied to {tweet_id}")
+            else:
+                print(f"[Bot] Failed to reply to tweet {tweet_id}")
+        elif action == "quote" and tweet_id:
+            result = self.writer.submit(self.twitter.quote_tweet, tweet_id, text)
+            if result:
+                self._store_own(result)
+                print(f"[Bot] Successfully quoted tweet {tweet_id}")
+            else:
+                print(f"[Bot] Failed to quote tweet {tweet_id}")
+        if action in ("post", "reply", "quote"):
+            metrics.inc("actions_total", action=action, outcome="sent" if result else "failed")
+        else:
+            metrics.inc("actions_total", action=action, outcome="skipped")
+
+    def _store_own(self, result: dict):
+        """Store a tweet the bot just sent as read, so it's never queued as work"""
+        tweet = dict(result, author_id=self.twitter.user_id, is_read=True)
+        self.store.store_tweet(tweet)
+        self.guard.record(tweet)
+
+    def _run_batch(self, jobs):
+        """Decide on a backlog with one Message Batches job and apply the results"""
+        print(f"[Bot] Deciding on {len(jobs)} tweets in batch mode...")
+        tweet_ids = [tweet['tweet_id'] for tweet, _, _ in jobs]
+        renewed = [time.monotonic()]
+
+        def renew_leases():
+            # Batches can take hours; keep the tweets leased until their decisions arrive
+            if time.monotonic() - renewed[0] >= self.lease_seconds / 2:
+                self.store.extend_leases(tweet_ids, self.lease_seconds)
+                renewed[0] = time.monotonic()
+
+        decisions = self.model.decide_on_threads_batch({
+            f"tweet-{tweet['tweet_id']}": (thread, tweet['tweet_id'], context) for tweet, thread, context in jobs
+        }, on_poll=renew_leases, stop_event=self.stop_event)
+        for tweet, _, _ in jobs:
+            decision = decisions.get(f"tweet-{tweet['tweet_id']}")
+            if decision is None:
+                # Failed or unfinished: let a later cycle retry it
+                self.store.release_tweet(tweet['tweet_id'])
+                continue
+            print(f"[Bot] Model decision: {decision}")
+            self._execute_decision(decision)
+            self.actions_taken += 1
+            self.store.mark_tweet_as_read(tweet['tweet_id'])
 
     def run_cycle(self):
         """Main bot cycle with proactive posting"""
+        cycle_start = time.perf_counter()
+        error = None
         try:
             print(f"\n[Bot] Starting cycle at {datetime.now(timezone.utc).isoformat()}")
             self.actions_taken = 0
+            self.last_mention_count = 0
 
-            # 1) Check for new mentions
-            new_mentions = self.twitter.check_notifications()
+            # 1) Check for mentions since the last one we saw, finishing a
+            #    fetch that stopped at the cap first
+            resume = self.store.get_state('mentions_resume')
+            with metrics.timer("cycle_stage_seconds", stage="fetch_mentions"):
+                new_mentions = self.twitter.check_notifications(
+                    since_id=self.store.get_state('mentions_since_id'),
+                    max_total=self.max_mentions_per_cycle,
+                    resume=json.loads(resume) if resume else None
+                )
+            self.last_mention_count = len(new_mentions)
+            metrics.inc("mentions_fetched_total", len(new_mentions))
             if new_mentions:
                 print(f"[Bot] Found {len(new_mentions)} new mention(s)")
-                for mention in new_mentions:
-                    self.store.store_tweet(mention)
-
-            # 2) Process stored tweets or be proactive
-            while self.actions_taken < self.max_actions_per_cycle:
-                # First try to get an unread tweet
-                tweet = self.store.get_next_unread_tweet() if hasattr(self.store, 'get_next_unread_tweet') else None
-                
-                if tweet:
-                    # Process existing tweet
-                    thread = self.store.get_thread(tweet['tweet_id'])
-                    decision = self.model.decide_on_tweet_thread(thread)
-                else:
-                    # No tweets to process, get proactive action
-                    print("[Bot] No unread tweets. Getting proactive action...")
-                    decision = self.model.get_proactive_action()
-
-                print(f"[Bot] Model decision: {decision}")
-                
-                # Execute the decision
-                action = decision.get("action", "do_nothing")
-                tweet_id = decision.get("tweet_id")
-                text = decision.get("text", "")
-
-                if action == "post":
-                    print("[Bot] Posting new tweet...")
-                    result = self.twitter.post_tweet(text)
-                    if result:
-                        self.store.store_tweet(result)
-                        print(f"[Bot] Successfully posted: {text}")
-                elif action == "reply" and tweet_id:
-                    result = self.twitter.reply_tweet(tweet_id, text)
-                    if result:
-                        self.store.store_tweet(result)
-                        print(f"[Bot] Successfully replied to {tweet_id}")
-                    else:
-                        print(f"[Bot] Failed to reply to tweet {tweet_id}")
-                elif action == "quote" and tweet_id:
-                    result = self.twitter.quote_tweet(tweet_id, text)
-                    if result:
-                        self.store.store_tweet(result)
-                        print(f"[Bot] Successfully quoted tweet {tweet_id}")
-                    else:
-                        print(f"[Bot] Failed to quote tweet {tweet_id}")
-
-                self.actions_taken += 1
-
-                # If we were processing a stored tweet, mark it as read
-                if tweet and hasattr(self.store, 'mark_tweet_as_read'):
-                    self.store.mark_tweet_as_read(tweet['tweet_id'])
-
-                # Small delay between actions
-                time.sleep(2)
+                # Embed the mentions and their expanded context in the background
+                # while the missing context is looked up
+                self.store.prefetch([t['text'] for t in new_mentions + self.twitter.referenced_tweets
+                                     if t.get('text')])
+                # One commit for the whole fetch; read marks below commit right away
+                with metrics.timer("cycle_stage_seconds", stage="store_mentions"), self.store.batch():
+                    for mention in new_mentions:
+                        self.store.store_tweet(mention)
+                    self._hydrate_context(new_mentions)
+            # Advance the cursor only after the mentions are safely stored
+            if self.twitter.newest_mention_id:
+                self.store.set_state('mentions_since_id', self.twitter.newest_mention_id)
+                if resume:
+                    self.store.set_state('mentions_resume', "")
+            elif self.twitter.mentions_resume:
+                self.store.set_state('mentions_resume', json.dumps(self.twitter.mentions_resume))
+
+            # 2) Lease unread tweets, or fill the slots with proactive posts
+            limit = self.batch_max_tweets if self.batch_mode else self.max_actions_per_cycle
+            jobs = []
+            with metrics.timer("cycle_stage_seconds", stage="build_prompts"):
+                while len(jobs) < limit:
+                    tweet = self.store.get_next_unread_tweet(lease_seconds=self.lease_seconds)
+                    if not tweet:
+                        break
+                    thread, context = self.prompt_builder.build(tweet, self.store.get_thread(tweet['tweet_id']))
+                    metrics.observe("prompt_tokens", self.prompt_builder.last_usage['total_tokens'])
+                    jobs.append((tweet, thread, context))
+
+            if self.batch_mode and len(jobs) >= self.batch_threshold:
+                with metrics.timer("cycle_stage_seconds", stage="batch"):
+                    self._run_batch(jobs)
+                return
+            for tweet, _, _ in jobs[self.max_actions_per_cycle:]:
+                self.store.release_tweet(tweet['tweet_id'])
+            jobs = jobs[:self.max_actions_per_cycle]
+
+            proactive = self.max_actions_per_cycle - len(jobs)
+            if proactive and self.proactive_interval:
+                last = float(self.store.get_state('last_proactive_at') or 0)
+                if time.time() - last < self.proactive_interval:
+                    proactive = 0
+            if proactive:
+                print("[Bot] No unread tweets. Getting proactive action...")
+                self.store.set_state('last_proactive_at', str(time.time()))
+
+            # 3) Ask the model about all of them at once; post decisions as they arrive
+            decide_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                futures = {
+                    pool.submit(self.model.decide_on_tweet_thread, thread,
+                                focus_id=tweet['tweet_id'], context=context): tweet
+                    for tweet, thread, context in jobs
+                }
+                for _ in range(proactive):
+                    futures[pool.submit(self.model.get_proactive_action)] = None
+
+                for future in as_completed(futures):
+                    tweet = futures[future]
+                    decision = future.result()
+                    print(f"[Bot] Model decision: {decision}")
+                    self._execute_decision(decision)
+                    self.actions_taken += 1
+
+                    # If we were processing a stored tweet, mark it as read
+                    if tweet:
+                        self.store.mark_tweet_as_read(tweet['tweet_id'])
+            metrics.observe("cycle_stage_seconds", time.perf_counter() - decide_start, stage="decide_and_act")
 
         except Exception as e:
+            error = str(e)
             print(f"[Bot] Error in bot cycle: {str(e)}")
             raise  # Re-raise the exception for GitHub Actions to catch failures
+        finally:
+            metrics.observe("cycle_seconds", time.perf_counter() - cycle_start)
+            self._write_metrics(error)
+
+    def _write_metrics(self, error=None):
+        """Append this cycle's report and refresh the Prometheus file"""
+        if not self.metrics_dir:
+            return
+        report = metrics.cycle_report(mentions=self.last_mention_count, actions=self.actions_taken, error=error)
+        try:
+            metrics.write(self.metrics_dir, report)
+        except OSError as e:
+            print(f"[Bot] Could not write metrics: {e}")
+
+    def next_interval(self, interval, min_interval, max_interval):
+        """Seconds until the next poll.
+
+        Back to min_interval while mentions keep arriving or unread tweets
+        are waiting, doubling towards max_interval while it's quiet, and
+        never faster than the mentions rate limit allows.
+        """
+        if self.last_mention_count or self.store.get_next_unread_tweet():
+            interval = min_interval
+        else:
+            interval = min(max_interval, interval * 2)
+        return max(interval, self.twitter.mentions_poll_interval())
+
+    def run_forever(self, stop_event, min_interval=60.0, max_interval=1800.0, tiering_interval=3600.0):
+        """Run cycles until stop_event is set, keeping the model, store and index warm"""
+        self.stop_event = stop_event
+        self.store.warm_up()
+        interval = min_interval
+        last_tiering = time.monotonic()
+        while not stop_event.is_set():
+            try:
+                self.run_cycle()
+                interval = self.next_interval(interval, min_interval, max_interval)
+                if time.monotonic() - last_tiering >= tiering_interval:
+                    self.store.apply_tiering()
+                    last_tiering = time.monotonic()
+            except Exception:
+                # Already logged by run_cycle; back off instead of dying
+                interval = min(max_interval, interval * 2)
+            print(f"[Bot] Next cycle in {interval:.0f}s")
+            stop_event.wait(interval)
 
 def main():
-    bot = TwitterBot(max_actions_per_cycle=3)
-    bot.run_cycle()  # Just run once and exit
+    parser = argparse.ArgumentParser(description="Run the Twitter bot")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep running and poll for mentions instead of a single cycle")
+    parser.add_argument("--min_interval", type=float, default=60.0,
+                        help="Shortest wait between daemon cycles, in seconds")
+    parser.add_argument("--max_interval", type=float, default=1800.0,
+                        help="Longest wait between daemon cycles when it's quiet, in seconds")
+    parser.add_argument("--proactive_interval", type=float, default=None,
+                        help="Minimum seconds between proactive posts (daemon default: 8 hours)")
+    parser.add_argument("--metrics_dir", default=None,
+                        help="Write per-cycle JSON reports (cycles.jsonl) and metrics.prom here")
+    parser.add_argument("--compact", choices=["fp16", "int8", "pq"], default=None,
+                        help="Keep tweets in slotted records and the index quantized (cosine search)")
+    parser.add_argument("--batch_mode", action="store_true",
+                        help="Send backlogs of unread tweets as one Message Batches job (cheaper, slower)")
+    parser.add_argument("--hot_days", type=float, default=None,
+                        help="Archive read tweets older than this many days (default: no tiering)")
+    parser.add_argument("--max_hot_tweets", type=int, default=None,
+                        help="Archive the oldest read tweets beyond this many (default: no limit)")
+    parser.add_argument("--retention_days", type=float, default=None,
+                        help="Drop archived tweets older than this many days (default: keep them)")
+    parser.add_argument("--embedding_threads", type=int, default=None,
+                        help="CPU threads for the embedding model (default: torch's choice)")
+    parser.add_argument("--accounts", default=None,
+                        help="JSON config of several accounts to run in this process (see multi_account.py)")
+    args = parser.parse_args()
+
+    proactive_interval = args.proactive_interval
+    if proactive_interval is None:
+        proactive_interval = 8 * 3600 if args.daemon else 0.0
+    if args.accounts:
+        run_accounts(args, proactive_interval)
+        return
+    bot = TwitterBot(max_actions_per_cycle=3, proactive_interval=proactive_interval,
+                     metrics_dir=args.metrics_dir, compact=args.compact, batch_mode=args.batch_mode,
+                     hot_days=args.hot_days, max_hot_tweets=args.max_hot_tweets, retention_days=args.retention_days,
+                     embedding_threads=args.embedding_threads)
+    try:
+        if args.daemon:
+            # Finish the current cycle, then flush and exit
+            stop_event = threading.Event()
+
+            def request_stop(signum, frame):
+                print(f"[Bot] Received signal {signum}, stopping after this cycle...")
+                stop_event.set()
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            bot.run_forever(stop_event, min_interval=args.min_interval, max_interval=args.max_interval)
+        else:
+            bot.run_cycle()  # Just run once and exit
+    finally:
+        try:
+            bot.store.apply_tiering()
+        finally:
+            bot.store.close()
+        print(f"[Bot] Startup timings (s): {bot.startup_report()}")
+        stats = bot.model.stats()
+        print(f"[Bot] Decision cache: {stats['decision_cache_hits']} hits, "
+              f"~{stats['tokens_saved_by_decision_cache']} tokens saved")
+        print(f"[Bot] Model stats: {stats}")
+        print(f"[Bot] Prompt tokens: {bot.prompt_builder.totals}")
+        print(f"[Bot] Suppressed duplicates: {bot.guard.suppressed}")
+
+def run_accounts(args, proactive_interval):
+    """Multi-account mode: every account in args.accounts, sharing one embedding worker"""
+    from multi_account import MultiAccountRunner, load_accounts
+    config = load_accounts(args.accounts, bot_class=TwitterBot)
+    defaults = config.setdefault("defaults", {})
+    defaults.setdefault("proactive_interval", proactive_interval)
+    for name in ("compact", "hot_days", "max_hot_tweets", "retention_days"):
+        if getattr(args, name) is not None:
+            defaults.setdefault(name, getattr(args, name))
+    if args.batch_mode:
+        defaults.setdefault("batch_mode", True)
+    if args.embedding_threads:
+        config.setdefault("embedding_threads", args.embedding_threads)
+    runner = MultiAccountRunner(config, metrics_dir=args.metrics_dir, bot_class=TwitterBot)
+    try:
+        if args.daemon:
+            stop_event = threading.Event()
+
+            def request_stop(signum, frame):
+                print(f"[MultiAccount] Received signal {signum}, stopping after the running cycles...")
+                stop_event.set()
+            signal.signal(signal.SIGTERM, request_stop)
+            signal.signal(signal.SIGINT, request_stop)
+            runner.run_forever(stop_event, min_interval=args.min_interval, max_interval=args.max_interval)
+        else:
+            runner.run_round()
+    finally:
+        runner.close()
+        print(f"[MultiAccount] Embedding worker: {runner.worker.counters}")
+        for name, bot in runner.bots.items():
+            print(f"[MultiAccount] {name}: model stats {bot.model.stats()}, "
+                  f"suppressed duplicates {bot.guard.suppressed}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
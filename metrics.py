@@ -0,0 +1,143 @@
+# metrics.py
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional, Tuple
+
+_NULL_TIMER = nullcontext()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Process-wide counters and timers.
+
+    Counters add up (requests, tokens); observations keep count/sum/max
+    (latencies, batch sizes). Everything is kept twice: totals since startup
+    for the Prometheus file, and a per-cycle copy that cycle_report() returns
+    and resets. While disabled every call returns right away, so the
+    instrumentation can stay in hot paths.
+    """
+
+    def __init__(self, enabled: bool = False, prefix: str = "bot"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._totals = self._empty()
+        self._cycle = self._empty()
+        self._cycle_start = time.time()
+
+    @staticmethod
+    def _empty() -> Dict[str, Dict]:
+        return {'counters': {}, 'observations': {}}
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            for store in (self._totals, self._cycle):
+                store['counters'][key] = store['counters'].get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        """Record one measurement (seconds, sizes)"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            for store in (self._totals, self._cycle):
+                stats = store['observations'].get(key)
+                if stats is None:
+                    store['observations'][key] = [1, value, value]
+                else:
+                    stats[0] += 1
+                    stats[1] += value
+                    stats[2] = max(stats[2], value)
+
+    def timer(self, name: str, **labels):
+        """Context manager observing the block's wall time in seconds"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timed(name, labels)
+
+    @contextmanager
+    def _timed(self, name: str, labels: Dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _as_dict(self, store: Dict) -> Dict:
+        return {
+            'counters': {_series(name, labels): value for (name, labels), value in store['counters'].items()},
+            'observations': {_series(name, labels): {'count': c, 'sum': round(s, 6), 'max': round(m, 6)}
+                             for (name, labels), (c, s, m) in store['observations'].items()},
+        }
+
+    def cycle_report(self, **extra) -> Dict:
+        """Everything recorded since the last call, then start a new cycle"""
+        with self._lock:
+            report = self._as_dict(self._cycle)
+            self._cycle = self._empty()
+            started, self._cycle_start = self._cycle_start, time.time()
+        report.update(started_at=started, ended_at=self._cycle_start, **extra)
+        return report
+
+    def prometheus(self) -> str:
+        """Totals in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = dict(self._totals['counters'])
+            observations = {k: list(v) for k, v in self._totals['observations'].items()}
+        # Samples of one metric family have to be contiguous, under one TYPE line
+        families: Dict[str, list] = {}
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault(name, []).append((labels, value))
+        for name, samples in families.items():
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f"{_series(metric, labels)} {value}" for labels, value in samples]
+
+        families = {}
+        for (name, labels), stats in sorted(observations.items()):
+            families.setdefault(name, []).append((labels, stats))
+        for name, samples in families.items():
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} summary")
+            for labels, (count, total, _) in samples:
+                lines += [f"{_series(metric + '_count', labels)} {count}",
+                          f"{_series(metric + '_sum', labels)} {total}"]
+            lines.append(f"# TYPE {metric}_max gauge")
+            lines += [f"{_series(metric + '_max', labels)} {peak}" for labels, (_, _, peak) in samples]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory: str, report: Optional[Dict] = None):
+        """Append a cycle report to cycles.jsonl and rewrite metrics.prom"""
+        os.makedirs(directory, exist_ok=True)
+        if report is not None:
+            with open(os.path.join(directory, "cycles.jsonl"), "a") as f:
+                f.write(json.dumps(report) + "\n")
+        prom_file = os.path.join(directory, "metrics.prom")
+        # Written atomically so a node_exporter textfile collector never reads half a file
+        with open(prom_file + ".tmp", "w") as f:
+            f.write(self.prometheus())
+        os.replace(prom_file + ".tmp", prom_file)
+
+
+# Shared by every module; off unless BOT_METRICS=1 or main.py --metrics_dir
+metrics = Metrics(enabled=os.getenv("BOT_METRICS") == "1")
@@ -1,23 +1,103 @@
 # model_integration.py
 import os
-import json
-from typing import Dict, List
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional, Tuple
 from anthropic import Anthropic
 
+from decision_cache import DecisionCache, thread_cache_key
+from decision_parser import DecisionParseError, JsonObjectExtractor, parse_decision
+from metrics import metrics
+from prompt_builder import estimate_tokens
+
+MODEL_NAME = "claude-3-sonnet-20240229"
+
+# Static persona and output format, sent as the system block so the
+# per-call user message carries only the thread
+SYSTEM_PROMPT = """
+You are Claude Sonnet 3.5, an AI Model by Anthropic. You're managing an AI/Tech Twitter account,
+chatting about AI, tech, and interesting ideas.
+Please reply with interesting takes from your perspective which generate curiosity in the readers. Do yourself but do not be preachy.
+
+Always answer with a single JSON object and nothing else:
+{
+  "action": "like"|"retweet"|"quote"|"reply"|"post"|"do_nothing",
+  "tweet_id": "ID if liking/retweeting/replying/quoting, otherwise null",
+  "text": "your text if posting/replying/quoting"
+}
+"""
+
+# Anthropic only caches prefixes of at least this many tokens (Sonnet and
+# Opus); a cache_control marker on anything shorter is silently ignored. The
+# persona alone is far below it, so it is sent uncached and the marker only
+# appears if the prompt grows past the minimum. The decision cache is what
+# saves tokens on repeated threads.
+PROMPT_CACHE_MIN_TOKENS = 1024
+SYSTEM_BLOCK = {"type": "text", "text": SYSTEM_PROMPT}
+if estimate_tokens(SYSTEM_PROMPT) >= PROMPT_CACHE_MIN_TOKENS:
+    SYSTEM_BLOCK["cache_control"] = {"type": "ephemeral"}
+
 class ModelInterface:
-    def __init__(self):
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key:
-            raise ValueError("Missing Anthropic API key in .env file")
-        self.client = Anthropic(api_key=api_key)
-
-    def decide_on_tweet_thread(self, thread: List[Dict]) -> Dict:
-        """Handle tweet thread decisions"""
+    def __init__(self, cache_path: Optional[str] = os.path.join("storage", "decision_cache.json"),
+                 cache_ttl: float = 6 * 3600, cache_size: int = 1000, batches=None,
+                 api_key: Optional[str] = None, client=None):
+        # Accounts with the same API key can share one client and its connection pool
+        if client is None:
+            api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+            if not api_key:
+                raise ValueError("Missing Anthropic API key in .env file")
+            client = Anthropic(api_key=api_key)
+        self.client = client
+        # Message Batches endpoint; tests can pass fakes.FakeMessageBatches instead
+        self.batches = batches or self.client.messages.batches
+        self.decision_cache = DecisionCache(cache_path, ttl_seconds=cache_ttl, max_entries=cache_size)
+        self.counters = {
+            'decision_cache_hits': 0,
+            'decision_cache_misses': 0,
+            'tokens_saved_by_decision_cache': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_read_input_tokens': 0,
+            'cache_creation_input_tokens': 0,
+            'model_calls': 0,
+            'early_aborts': 0,
+            'parse_failures': 0,
+            'repairs_succeeded': 0,
+        }
+        self._counters_lock = threading.Lock()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._counters_lock:
+            self.counters[name] += amount
+
+    def stats(self) -> Dict:
+        """Decision-cache, token and parse counters since startup"""
+        stats = dict(self.counters)
+        parsed = stats['model_calls'] or 1
+        stats['parse_failure_rate'] = round(stats['parse_failures'] / parsed, 4)
+        # Share of prompt tokens served from the prompt cache (stays 0 if the prefix isn't cached)
+        prompt = stats['input_tokens'] + stats['cache_read_input_tokens'] + stats['cache_creation_input_tokens']
+        stats['prompt_cache_read_rate'] = round(stats['cache_read_input_tokens'] / (prompt or 1), 4)
+        return stats
+
+    def decide_on_tweet_thread(self, thread: List[Dict], focus_id: Optional[str] = None,
+                               context: Optional[List[Dict]] = None) -> Dict:
+        """Handle tweet thread decisions; context is related history from the prompt builder"""
         if not thread:
             return self.get_proactive_action()
 
-        # Rest of the thread handling code remains the same
-        top_level_tweet = thread[len(thread)//2] if len(thread) > 0 else None
+        # Identical threads get the same decision without another paid call
+        prompt, cache_key = self._thread_prompt(thread, focus_id, context)
+        return self._get_model_response(prompt, cache_key=cache_key)
+
+    def _thread_prompt(self, thread: List[Dict], focus_id: Optional[str],
+                       context: Optional[List[Dict]] = None) -> Tuple[str, str]:
+        """User prompt for a thread plus its decision-cache key"""
+        # Focus on the given tweet, falling back to the middle of the thread
+        top_level_tweet = next((t for t in thread if t.get('tweet_id', t.get('id')) == focus_id), None)
+        if top_level_tweet is None:
+            top_level_tweet = thread[len(thread)//2]
 
         formatted = []
         for idx, t in enumerate(thread):
@@ -35,62 +115,216 @@ class ModelInterface:
             formatted.append(msg)
         thread_str = "\n".join(formatted)
 
+        context_str = ""
+        if context:
+            related = "\n".join(
+                f"- ({t.get('tweet_id', t.get('id', 'unknown'))}, author {t.get('author_id', 'unknown')}) {t.get('text', '')}"
+                for t in context
+            )
+            context_str = f"""
+Related earlier tweets, for background only (don't act on these):
+
+{related}
+"""
+
         prompt = f"""
-You are Claude Sonnet 3.5, an AI Model by Anthropic. You are chatting on Twitter about AI, tech, and interesting ideas. 
-Please reply with interesting takes from your perspective which generate curiosity in the readers. Do yourself but do not be preachy. 
 Here is a thread to engage with:
 
 {thread_str}
-
-The *main tweet* we are focusing on is marked above.
-
-How would you like to engage? Output JSON only:
-{{
-  "action": "like"|"retweet"|"quote"|"reply"|"post"|"do_nothing",
-  "tweet_id": "ID if liking/retweeting/replying/quoting",
-  "text": "your text if posting/replying/quoting"
-}}
+{context_str}
+The *main tweet* we are focusing on is marked above. How would you like to engage?
 """
 
-        return self._get_model_response(prompt)
+        context_ids = ",".join(str(t.get('tweet_id', t.get('id'))) for t in context or [])
+        return prompt, thread_cache_key(thread, focus_id, salt=MODEL_NAME + SYSTEM_PROMPT + context_ids)
 
     def get_proactive_action(self) -> Dict:
         """Decide what to post when there's no thread to engage with"""
         prompt = """
-ou are Claude Sonnet 3.5, an AI Model by Anthropic. 
-You're managing an AI/Tech Twitter account. There are no new interactions to respond to.
-
-What would you like to post? Consider:
+There are no new interactions to respond to. What would you like to post? Consider:
 - Sharing thoughts about AI developments
 - Starting interesting discussions
 - Asking engaging questions
 - Making observations about tech, politics, cultural trends
 
-Please post interesting takes from your perspective which generate curiosity in the readers. Do yourself but do not be preachy.
-
-Output only JSON:
-{
-  "action": "post",
-  "tweet_id": null,
-  "text": "your tweet text"
-}
+Respond with a "post" action (tweet_id null).
 """
         return self._get_model_response(prompt)
 
-    def _get_model_response(self, prompt: str) -> Dict:
+    def _get_model_response(self, prompt: str, cache_key: Optional[str] = None) -> Dict:
         """Helper to handle model calls and response parsing"""
+        if cache_key:
+            cached = self.decision_cache.get(cache_key)
+            if cached:
+                self._count('decision_cache_hits')
+                self._count('tokens_saved_by_decision_cache', cached['tokens'])
+                metrics.inc("decision_cache_total", result="hit")
+                print(f"[ModelInterface] Decision cache hit: {cached['decision']}")
+                return dict(cached['decision'])
+            self._count('decision_cache_misses')
+            metrics.inc("decision_cache_total", result="miss")
+
         try:
-            response = self.client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=300,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            content = response.content[0].text.strip()
-            print(f"[ModelInterface] Raw response: {content}")  # Debug output
-            data = json.loads(content)
-            return data
+            text, usage = self._stream_text(self._request_params(prompt))
+            return self._finish_decision(prompt, text, usage, cache_key)
         except Exception as e:
             print(f"[ModelInterface] Error getting model response: {e}")
             return {"action": "do_nothing"}
 
+    def _request_params(self, prompt: str, retry: Optional[Tuple[str, str]] = None) -> Dict:
+        """messages.create params; the assistant turn is prefilled with '{' to force JSON.
+
+        retry=(bad_output, error) adds one repair round asking for corrected JSON.
+        """
+        messages = [{"role": "user", "content": prompt}]
+        if retry:
+            bad_output, error = retry
+            messages += [
+                {"role": "assistant", "content": bad_output},
+                {"role": "user", "content": f"That isn't a valid decision ({error}). "
+                                            f"Reply with only the corrected JSON object."},
+            ]
+        messages.append({"role": "assistant", "content": "{"})
+        return {
+            "model": MODEL_NAME,
+            "max_tokens": 300,
+            "system": [SYSTEM_BLOCK],
+            "messages": messages,
+        }
+
+    def _stream_text(self, params: Dict):
+        """Stream a response, stopping as soon as the JSON object is complete.
+
+        Returns the text (including the prefilled '{') and the usage seen so far.
+        """
+        extractor = JsonObjectExtractor()
+        text = extractor.feed("{") or "{"
+        start = time.perf_counter()
+        first_token = True
+        with self.client.messages.stream(**params) as stream:
+            for chunk in stream.text_stream:
+                if first_token:
+                    metrics.observe("model_first_token_seconds", time.perf_counter() - start)
+                    first_token = False
+                text += chunk
+                if extractor.feed(chunk) is not None:
+                    break
+            snapshot = stream.current_message_snapshot
+            usage = snapshot.usage
+            if snapshot.stop_reason is None:
+                # Leaving the context closes the connection and stops generation;
+                # the final output count never arrives, so estimate it
+                self._count('early_aborts')
+                usage = SimpleNamespace(
+                    input_tokens=usage.input_tokens,
+                    output_tokens=max(usage.output_tokens or 0, len(text) // 4),
+                    cache_read_input_tokens=getattr(usage, 'cache_read_input_tokens', 0),
+                    cache_creation_input_tokens=getattr(usage, 'cache_creation_input_tokens', 0),
+                )
+        self._count('model_calls')
+        metrics.observe("model_request_seconds", time.perf_counter() - start, mode="stream")
+        return text, usage
+
+    def _finish_decision(self, prompt: str, text: str, usage, cache_key: Optional[str]) -> Dict:
+        """Validate model output into a decision, with one bounded repair round"""
+        tokens = self._record_usage(usage)
+        print(f"[ModelInterface] Raw response: {text}")  # Debug output
+        try:
+            decision = parse_decision(text)
+        except DecisionParseError as e:
+            self._count('parse_failures')
+            print(f"[ModelInterface] Unusable response ({e}), asking for a repair")
+            repaired_text, repair_usage = self._stream_text(self._request_params(prompt, retry=(text, str(e))))
+            tokens += self._record_usage(repair_usage)
+            try:
+                decision = parse_decision(repaired_text)
+            except DecisionParseError as e:
+                print(f"[ModelInterface] Repair failed ({e}), doing nothing")
+                return {"action": "do_nothing"}
+            self._count('repairs_succeeded')
+        if cache_key:
+            self.decision_cache.put(cache_key, decision, tokens=tokens)
+        return decision
+
+    def decide_on_threads_batch(self, threads: Dict[str, Tuple[List[Dict], Optional[str], Optional[List[Dict]]]],
+                                poll_interval: float = 30.0, timeout: float = 24 * 3600,
+                                on_poll: Optional[Callable[[], None]] = None,
+                                stop_event: Optional[threading.Event] = None) -> Dict[str, Dict]:
+        """Decide on many threads with one Message Batches job.
+
+        threads maps a custom_id ([a-zA-Z0-9_-], max 64 chars) to (thread,
+        focus_id, context). Cached decisions are answered locally; the rest are
+        submitted together, polled until the batch ends, and collected by
+        custom_id. on_poll() runs before every wait (the bot renews its
+        leases there). Setting stop_event cancels the batch at once. Threads
+        whose request failed or didn't finish before the timeout or the stop
+        are missing from the result.
+        """
+        decisions = {}
+        requests = []
+        cache_keys = {}
+        prompts = {}
+        for custom_id, (thread, focus_id, context) in threads.items():
+            prompt, cache_key = self._thread_prompt(thread, focus_id, context)
+            cached = self.decision_cache.get(cache_key)
+            if cached:
+                self._count('decision_cache_hits')
+                self._count('tokens_saved_by_decision_cache', cached['tokens'])
+                metrics.inc("decision_cache_total", result="hit")
+                decisions[custom_id] = dict(cached['decision'])
+                continue
+            self._count('decision_cache_misses')
+            metrics.inc("decision_cache_total", result="miss")
+            cache_keys[custom_id] = cache_key
+            prompts[custom_id] = prompt
+            requests.append({"custom_id": custom_id, "params": self._request_params(prompt)})
+        if not requests:
+            return decisions
+
+        start = time.perf_counter()
+        batch = self.batches.create(requests=requests)
+        print(f"[ModelInterface] Submitted batch {batch.id} with {len(requests)} requests")
+        deadline = time.monotonic() + timeout
+        while batch.processing_status != "ended":
+            if time.monotonic() > deadline:
+                print(f"[ModelInterface] Batch {batch.id} timed out, cancelling")
+                self.batches.cancel(batch.id)
+                return decisions
+            if on_poll:
+                on_poll()
+            if stop_event is None:
+                time.sleep(poll_interval)
+            elif stop_event.wait(poll_interval):
+                print(f"[ModelInterface] Stopping, cancelling batch {batch.id}")
+                self.batches.cancel(batch.id)
+                return decisions
+            batch = self.batches.retrieve(batch.id)
+        metrics.observe("model_request_seconds", time.perf_counter() - start, mode="batch")
+
+        for entry in self.batches.results(batch.id):
+            if entry.result.type != "succeeded":
+                print(f"[ModelInterface] Batch request {entry.custom_id} {entry.result.type}")
+                continue
+            try:
+                self._count('model_calls')
+                message = entry.result.message
+                decisions[entry.custom_id] = self._finish_decision(
+                    prompts[entry.custom_id], "{" + message.content[0].text, message.usage,
+                    cache_keys.get(entry.custom_id))
+            except Exception as e:
+                print(f"[ModelInterface] Error parsing batch result {entry.custom_id}: {e}")
+                decisions[entry.custom_id] = {"action": "do_nothing"}
+        return decisions
+
+    def _record_usage(self, usage) -> int:
+        """Add a response's token usage to the counters; returns tokens billed for the call"""
+        total = 0
+        for name in ('input_tokens', 'output_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens'):
+            amount = getattr(usage, name, None) or 0
+            self._count(name, amount)
+            metrics.inc("model_tokens_total", amount, type=name.replace('_tokens', ''))
+            total += amount
+        print(f"[ModelInterface] Prompt cache: {getattr(usage, 'cache_read_input_tokens', 0) or 0} tokens read, "
+              f"{getattr(usage, 'cache_creation_input_tokens', 0) or 0} written, "
+              f"{getattr(usage, 'input_tokens', 0) or 0} uncached")
+        return total
@@ -0,0 +1,218 @@
+# multi_account.py
+import inspect
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Dict, Optional
+
+from embedding_worker import EmbeddingWorker
+from metrics import metrics
+
+if TYPE_CHECKING:
+    from main import TwitterBot
+
+TWITTER_CREDENTIALS = {
+    "api_key": "TWITTER_API_KEY",
+    "api_secret": "TWITTER_API_SECRET",
+    "access_token": "TWITTER_ACCESS_TOKEN",
+    "access_secret": "TWITTER_ACCESS_SECRET",
+}
+
+
+def _default_bot_class():
+    # Imported on use: when main.py runs as __main__ it passes its own
+    # TwitterBot, and importing main here would load it a second time
+    from main import TwitterBot
+    return TwitterBot
+
+
+# TwitterBot arguments the runner sets itself
+RESERVED_SETTINGS = {"encoder", "storage_dir", "twitter_credentials", "anthropic_api_key",
+                     "anthropic_client", "metrics_dir", "embedding_threads"}
+
+
+def load_accounts(path: str, bot_class=None) -> Dict:
+    """Read and check a multi-account config file.
+
+    {
+      "max_workers": 4,                        # cycles running at once
+      "model_name": "all-MiniLM-L6-v2",        # the one shared embedding model
+      "embedding_threads": 4,                  # its CPU threads (optional)
+      "defaults": {"max_actions_per_cycle": 3},
+      "accounts": [
+        {"name": "claude_on_twt", "env_prefix": "CLAUDE_",
+         "storage_dir": "storage/claude_on_twt", "settings": {"compact": "int8"}}
+      ]
+    }
+
+    Each account reads its credentials from <env_prefix>TWITTER_API_KEY,
+    <env_prefix>TWITTER_API_SECRET, <env_prefix>TWITTER_ACCESS_TOKEN,
+    <env_prefix>TWITTER_ACCESS_SECRET and <env_prefix>ANTHROPIC_API_KEY
+    (falling back to ANTHROPIC_API_KEY). storage_dir defaults to
+    storage/<name>; settings are TwitterBot arguments on top of defaults.
+    """
+    with open(path, "r") as f:
+        config = json.load(f)
+    accounts = config.get("accounts") or []
+    if not accounts:
+        raise ValueError(f"No accounts in {path}")
+    bot_class = bot_class or _default_bot_class()
+    allowed = set(inspect.signature(bot_class.__init__).parameters) - {"self"} - RESERVED_SETTINGS
+    names = set()
+    for account in accounts:
+        name = account.get("name")
+        if not name or name in names:
+            raise ValueError(f"Every account in {path} needs a unique name, got {name!r}")
+        names.add(name)
+        unknown = (set(config.get("defaults", {})) | set(account.get("settings", {}))) - allowed
+        if unknown:
+            raise ValueError(f"Unknown settings for account '{name}': {sorted(unknown)}")
+    return config
+
+
+def account_credentials(account: Dict) -> Dict:
+    """Twitter credentials and Anthropic key for an account, from its env_prefix"""
+    prefix = account.get("env_prefix", "")
+    twitter = {key: os.getenv(prefix + var) for key, var in TWITTER_CREDENTIALS.items()}
+    missing = [prefix + TWITTER_CREDENTIALS[key] for key, value in twitter.items() if not value]
+    if missing:
+        raise ValueError(f"Missing Twitter credentials for account '{account['name']}': {', '.join(missing)}")
+    return {
+        "twitter_credentials": twitter,
+        "anthropic_api_key": os.getenv(prefix + "ANTHROPIC_API_KEY") or os.getenv("ANTHROPIC_API_KEY"),
+    }
+
+
+class MultiAccountRunner:
+    """Runs several bot accounts in one process.
+
+    Every account keeps its own Twitter client (and so its own rate-limit
+    state), store, vector index, decision cache and write queue. What they
+    share is the expensive part: one embedding model behind one
+    EmbeddingWorker, whose queue merges encode calls from accounts running
+    at the same time into single batches, and one Anthropic client per API
+    key. Cycles run on a thread pool; the work is mostly network waits and
+    the worker serializes the CPU-heavy encoding.
+    """
+
+    def __init__(self, config: Dict, encoder=None, metrics_dir: Optional[str] = None, bot_class=None):
+        self.config = config
+        self.max_workers = config.get("max_workers", 4)
+        # Accounts share the process-wide metrics registry, so reports are written per runner
+        self.metrics_dir = metrics_dir
+        if metrics_dir:
+            metrics.enable()
+        self.worker = EmbeddingWorker(model_name=config.get("model_name", "all-MiniLM-L6-v2"), encoder=encoder,
+                                      threads=config.get("embedding_threads"))
+        bot_class = bot_class or _default_bot_class()
+        self.bots: Dict[str, "TwitterBot"] = {}
+        self.errors: Dict[str, str] = {}
+        anthropic_clients = {}
+        defaults = config.get("defaults", {})
+        for account in config["accounts"]:
+            name = account["name"]
+            credentials = account_credentials(account)
+            api_key = credentials["anthropic_api_key"]
+            if api_key and api_key not in anthropic_clients:
+                from anthropic import Anthropic
+                anthropic_clients[api_key] = Anthropic(api_key=api_key)
+            settings = dict(defaults, **account.get("settings", {}))
+            self.bots[name] = bot_class(
+                encoder=self.worker,
+                storage_dir=account.get("storage_dir") or os.path.join("storage", name),
+                anthropic_client=anthropic_clients.get(api_key),
+                **credentials,
+                **settings,
+            )
+            print(f"[MultiAccount] Account '{name}' ready as @{self.bots[name].twitter.handle}")
+
+    def _cycle(self, name: str, tier: bool = False) -> Optional[str]:
+        """One cycle for one account (then tiering, if asked); returns the error instead of raising"""
+        try:
+            self.bots[name].run_cycle()
+            if tier:
+                self.bots[name].store.apply_tiering()
+            return None
+        except Exception as e:
+            return str(e)  # run_cycle already logged it
+
+    def run_round(self) -> Dict[str, Optional[str]]:
+        """One cycle for every account, up to max_workers at a time; account -> error or None"""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {name: pool.submit(self._cycle, name) for name in self.bots}
+            results = {name: future.result() for name, future in futures.items()}
+        self.errors = {name: error for name, error in results.items() if error}
+        metrics.observe("accounts_round_seconds", time.perf_counter() - start)
+        self.write_metrics()
+        return results
+
+    def run_forever(self, stop_event, min_interval: float = 60.0, max_interval: float = 1800.0,
+                    tiering_interval: float = 3600.0):
+        """Poll every account on its own adaptive schedule until stop_event is set"""
+        for bot in self.bots.values():
+            bot.stop_event = stop_event
+            bot.store.warm_up()
+        intervals = {name: min_interval for name in self.bots}
+        due = {name: 0.0 for name in self.bots}
+        last_tiering = {name: time.monotonic() for name in self.bots}
+        running = {}  # future -> account name
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while not stop_event.is_set():
+                now = time.monotonic()
+                busy = set(running.values())
+                for name in self.bots:
+                    if name not in busy and due[name] <= now:
+                        tier = now - last_tiering[name] >= tiering_interval
+                        if tier:
+                            last_tiering[name] = now
+                        running[pool.submit(self._cycle, name, tier)] = name
+                idle = [due[name] for name in self.bots if name not in running.values()]
+                # Wake for the next due account, a finished cycle or (at least every second) a stop
+                timeout = min([max(0.0, t - now) for t in idle] + [1.0])
+                if not running:
+                    stop_event.wait(timeout)  # wait() on no futures would return at once
+                    continue
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    bot = self.bots[name]
+                    if future.result() is None:
+                        intervals[name] = bot.next_interval(intervals[name], min_interval, max_interval)
+                        self.errors.pop(name, None)
+                    else:
+                        intervals[name] = min(max_interval, intervals[name] * 2)
+                        self.errors[name] = future.result()
+                    due[name] = time.monotonic() + intervals[name]
+                    print(f"[MultiAccount] '{name}' next cycle in {intervals[name]:.0f}s")
+                if done:
+                    self.write_metrics()
+            wait(list(running))
+
+    def write_metrics(self):
+        """One report covering all accounts since the last one"""
+        if not self.metrics_dir:
+            return
+        report = metrics.cycle_report(
+            accounts=len(self.bots),
+            mentions={name: bot.last_mention_count for name, bot in self.bots.items()},
+            actions={name: bot.actions_taken for name, bot in self.bots.items()},
+            errors=dict(self.errors),
+            embedding_worker=dict(self.worker.counters),
+        )
+        try:
+            metrics.write(self.metrics_dir, report)
+        except OSError as e:
+            print(f"[MultiAccount] Could not write metrics: {e}")
+
+    def close(self):
+        """Tier and flush every account's store, then stop the embedding worker"""
+        for name, bot in self.bots.items():
+            try:
+                bot.store.apply_tiering()
+            except Exception as e:
+                print(f"[MultiAccount] Tiering failed for '{name}': {e}")
+            finally:
+                bot.store.close()
+        self.worker.close()
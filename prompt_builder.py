@@ -0,0 +1,115 @@
+# prompt_builder.py
+from typing import Dict, List, Tuple
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English tweets)"""
+    return max(1, (len(text) + 3) // 4)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, marking the cut"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 1].rstrip() + "…"
+
+
+# Fixed per-tweet overhead of the prompt formatting (ids, author, separators)
+TWEET_OVERHEAD_TOKENS = 20
+
+
+class PromptBuilder:
+    """Packs a thread and retrieved history into a fixed token budget.
+
+    Thread tweets are ranked by how close they are to the focus tweet (the
+    tweet itself, then its parent and quoted tweet, then the rest of the
+    ancestor chain, then replies), related tweets from retrieve_context by
+    similarity. Each tweet is truncated to max_tweet_tokens and tweets are
+    added in rank order until the budget is spent, so the prompt stays the
+    same size however long threads and history get. The thread keeps its
+    original order in the output.
+    """
+
+    def __init__(self, store, token_budget: int = 1500, context_k: int = 5,
+                 max_tweet_tokens: int = 120, context_share: float = 0.3):
+        self.store = store
+        self.token_budget = token_budget
+        self.context_k = context_k
+        self.max_tweet_tokens = max_tweet_tokens
+        self.context_share = context_share  # budget reserved for retrieved context
+        self.last_usage: Dict[str, int] = {}
+        self.totals = {'prompts': 0, 'total_tokens': 0, 'thread_dropped': 0, 'context_count': 0}
+
+    def _cost(self, tweet: Dict) -> int:
+        return estimate_tokens(tweet.get('text', '')) + TWEET_OVERHEAD_TOKENS
+
+    def _clip(self, tweet: Dict) -> Dict:
+        return dict(tweet, text=truncate(tweet.get('text', ''), self.max_tweet_tokens))
+
+    def _thread_rank(self, thread: List[Dict], focus: Dict) -> List[int]:
+        """Thread positions in order of relevance to the focus tweet"""
+        ids = [t.get('tweet_id') or t.get('id') for t in thread]
+        focus_id = focus.get('tweet_id') or focus.get('id')
+        depth = {}
+        parent_id, d = focus.get('in_reply_to_status_id'), 1
+        while parent_id and parent_id not in depth:
+            depth[parent_id] = d
+            parent = self.store.get_tweet(parent_id)
+            parent_id, d = (parent.get('in_reply_to_status_id') if parent else None), d + 1
+
+        def rank(i):
+            t = thread[i]
+            if ids[i] == focus_id:
+                return (0, 0)
+            if ids[i] in depth:
+                return (1, depth[ids[i]])
+            if ids[i] == focus.get('quoted_tweet_id'):
+                return (1, 1.5)
+            if t.get('in_reply_to_status_id') == focus_id:
+                return (2, i)
+            return (3, i)
+        return sorted(range(len(thread)), key=rank)
+
+    def build(self, focus: Dict, thread: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Trimmed thread (original order) and related context tweets for a prompt"""
+        thread_budget = int(self.token_budget * (1 - self.context_share)) if self.context_k else self.token_budget
+        used = 0
+        kept = set()
+        for i in self._thread_rank(thread, focus):
+            cost = self._cost(self._clip(thread[i]))
+            if used + cost > thread_budget and kept:
+                continue
+            kept.add(i)
+            used += cost
+        packed_thread = [self._clip(t) for i, t in enumerate(thread) if i in kept]
+        thread_tokens = used
+
+        context = []
+        if self.context_k and focus.get('text'):
+            seen = {t.get('tweet_id') or t.get('id') for t in thread}
+            candidates = self.store.retrieve_context(focus['text'], k=self.context_k + len(seen))
+            for t in candidates:
+                if len(context) >= self.context_k:
+                    break
+                tid = t.get('tweet_id') or t.get('id')
+                if tid in seen:
+                    continue
+                seen.add(tid)
+                clipped = self._clip(t)
+                cost = self._cost(clipped)
+                if used + cost > self.token_budget:
+                    continue
+                context.append(clipped)
+                used += cost
+
+        self.last_usage = {
+            'thread_tokens': thread_tokens,
+            'context_tokens': used - thread_tokens,
+            'total_tokens': used,
+            'thread_dropped': len(thread) - len(packed_thread),
+            'context_count': len(context),
+        }
+        for name in self.totals:
+            self.totals[name] += self.last_usage.get(name, 1 if name == 'prompts' else 0)
+        return packed_thread, context
@@ -1,128 +1,802 @@
 # rag.py
-import json
-import faiss
-import numpy as np
+# numpy, faiss and sentence_transformers are imported lazily: a cycle that
+# never embeds or retrieves shouldn't pay for loading the ML stack.
+from __future__ import annotations
+
 import os
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Optional
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterable, List, Dict, Optional, Set, Union
+
+from embedding_worker import EmbeddingWorker
+from lexical_index import LexicalIndex
+from metrics import metrics
+from tweet_archive import TweetArchive
+from tweet_record import TweetRecord
+from tweet_storage import open_backend
+from unread_queue import UnreadQueue, tweet_timestamp
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Fields whose old values _index_tweet needs to move graph and metadata entries
+INDEXED_FIELDS = ('in_reply_to_status_id', 'quoted_tweet_id', 'author_id', 'conversation_id', 'text')
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+# Filtered candidate sets up to this size are scored exactly from cached
+# embeddings instead of through the (approximate) vector index
+EXACT_SEARCH_MAX = 4096
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int, c: int = 60) -> List[str]:
+    """Merge ranked id lists by summing 1 / (c + rank); ids near the top of
+    several lists win, and no scores need to be comparable"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, tweet_id in enumerate(ranking):
+            scores[tweet_id] = scores.get(tweet_id, 0.0) + 1.0 / (c + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+class _EmbeddedTweets:
+    """Embeddings of a list of tweets, produced a slice at a time, so an index
+    rebuild never holds every vector at once"""
+
+    def __init__(self, store: TweetStore, tweets: List[Dict]):
+        self.store = store
+        self.tweets = tweets
+
+    def __len__(self) -> int:
+        return len(self.tweets)
+
+    def __getitem__(self, key: Union[slice, List[int]]) -> np.ndarray:
+        if isinstance(key, slice):
+            return self.store._embed_tweets(self.tweets[key])
+        return self.store._embed_tweets([self.tweets[i] for i in key])
+
 
 class TweetStore:
-    def __init__(self, storage_dir: str = "storage"):
+    def __init__(self, storage_dir: str = "storage", backend: str = "sqlite",
+                 priority: str = "oldest", author_weights: Optional[Dict[str, float]] = None,
+                 score_fn: Optional[Callable[[Dict], float]] = None, index_kind: str = "auto",
+                 encoder=None, hot_days: Optional[float] = None, max_hot_tweets: Optional[int] = None,
+                 retention_days: Optional[float] = None, compact: Optional[str] = None,
+                 embedding_threads: Optional[int] = None):
         self.storage_dir = storage_dir
-        self.tweets_file = os.path.join(storage_dir, "tweets.json")
+        self.timings: Dict[str, float] = {}  # startup cost per stage, in seconds
+        start = time.perf_counter()
 
         # Create storage directory if needed
         if not os.path.exists(self.storage_dir):
             os.makedirs(self.storage_dir)
 
         # Load or init tweets
-        if os.path.exists(self.tweets_file):
-            with open(self.tweets_file, "r") as f:
-                self.tweets = json.load(f)
-        else:
-            self.tweets = []
+        self.backend = open_backend(backend, storage_dir)
+        self.tweets = self.backend.load()
+        # Compact mode ("fp16", "int8" or "pq"): slotted tweet records and a
+        # quantized cosine index, for histories of millions of tweets
+        self.compact = compact
+        if compact:
+            for i, tweet in enumerate(self.tweets):
+                self.tweets[i] = TweetRecord(tweet)  # one at a time, so the dicts are freed as we go
+        self._batch_depth = 0
+        self._pending: Dict[str, Dict] = {}  # changed tweets waiting for the next save
+
+        # Cold tier: read tweets older than hot_days (or beyond max_hot_tweets)
+        # move to archive shards in apply_tiering(); retention_days drops them
+        self.archive = TweetArchive(storage_dir)
+        self.hot_days = hot_days
+        self.max_hot_tweets = max_hot_tweets
+        self.retention_days = retention_days
+
+        # Id and reply/quote graph indexes, plus the metadata indexes that
+        # retrieve_context's prefilters use (the time index and BM25 index
+        # are built on first use)
+        self._by_id: Dict[str, Dict] = {}
+        self._replies: Dict[str, List[str]] = {}  # parent id -> reply ids
+        self._quotes: Dict[str, List[str]] = {}   # quoted id -> quoting ids
+        self._by_author: Dict[str, Set[str]] = {}
+        self._by_conversation: Dict[str, Set[str]] = {}
+        self._times: Optional[array] = None       # sorted timestamps...
+        self._time_ids: List[str] = []            # ...and the tweet ids they belong to
+        self._lexical: Optional[LexicalIndex] = None
+        for tweet in self.tweets:
+            self._index_tweet(tweet)
 
-        # Initialize embedding model
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
-        self.embedding_size = 384
+        # Unread work queue; tweets still under a lease wait until it expires
+        self.unread = UnreadQueue(priority, author_weights, score_fn, activity_fn=self._thread_activity)
+        now = time.time()
+        ready = []
+        for tweet in self.tweets:
+            if tweet.get('is_read'):
+                continue
+            if tweet.get('leased_until', 0) > now:
+                self.unread.hold(tweet.get('tweet_id') or tweet.get('id'), tweet['leased_until'])
+            else:
+                ready.append(tweet)
+        self.unread.build(ready)
 
-        # Initialize FAISS index
-        self.index = faiss.IndexFlatL2(self.embedding_size)
-        if self.tweets:
-            embeddings = [self.model.encode(t["text"]) for t in self.tweets]
-            self.index.add(np.array(embeddings))
+        # Embedding model and FAISS index are loaded on first use. Any object
+        # with SentenceTransformer's encode() can stand in for the model
+        # (benchmarks use a hashing encoder); its model_name keeps cached
+        # vectors from mixing with the real model's. Every encode goes
+        # through an EmbeddingWorker: passed in to share one between stores,
+        # or a private one around the encoder.
+        self.model_name = getattr(encoder, 'model_name', "all-MiniLM-L6-v2")
+        self.embedding_size = getattr(encoder, 'embedding_size', 384)
+        self.index_kind = index_kind
+        self._owns_model = not isinstance(encoder, EmbeddingWorker)
+        self._model = encoder if not self._owns_model else EmbeddingWorker(
+            self.model_name, self.embedding_size, encoder=encoder, threads=embedding_threads)
+        self._index = None
+        self.embeddings = None
 
+        self.timings['store_load'] = time.perf_counter() - start
         print(f"[TweetStore] Loaded {len(self.tweets)} tweets from storage")
 
-    def _save_tweets(self):
-        """Save tweets to JSON file"""
-        with open(self.tweets_file, "w") as f:
-            json.dump(self.tweets, f, indent=2)
-        print(f"[TweetStore] Saved {len(self.tweets)} tweets to storage")
+    @property
+    def model(self) -> EmbeddingWorker:
+        """The embedding worker (the model itself loads on the first encode)"""
+        return self._model
 
-    def store_tweet(self, tweet_data: Dict):
-        """Store a tweet, handling both id and tweet_id fields"""
+    def prefetch(self, texts: List[str]):
+        """Start encoding texts in the background; storing or searching with
+        them later picks the vectors up from the worker's cache"""
+        if texts:
+            self._model.submit(texts)
+
+    @property
+    def index(self):
+        """The vector index, loaded and synced with the store on first use"""
+        if self._index is None:
+            start = time.perf_counter()
+            from embedding_cache import EmbeddingCache
+            from vector_index import VectorIndex
+            self.embeddings = EmbeddingCache(self.storage_dir, self.model_name, self.embedding_size)
+            self._index = VectorIndex(self.embedding_size, os.path.join(self.storage_dir, "tweets"),
+                                      self.model_name, kind=self.index_kind, quantization=self.compact)
+            # Only tweets missing from the embedding cache get encoded
+            self._sync_index()
+            self.embeddings.save()
+            self.timings['index_load'] = time.perf_counter() - start
+        return self._index
+
+    @property
+    def lexical(self) -> LexicalIndex:
+        """The BM25 index over tweet texts: the backend's persisted one if it
+        keeps one (SQLite's FTS5 table), else built in memory on first use"""
+        if self._lexical is None:
+            start = time.perf_counter()
+            self._lexical = self.backend.lexical_index()
+            if self._lexical is None:
+                self._lexical = LexicalIndex()
+                for tweet in self.tweets:
+                    self._lexical.add(tweet.get('tweet_id') or tweet.get('id'), tweet['text'])
+            self.timings['lexical_load'] = time.perf_counter() - start
+        return self._lexical
+
+    def _time_index(self):
+        """Tweet timestamps in sorted order, built on first use"""
+        if self._times is None:
+            entries = sorted((tweet_timestamp(t), t.get('tweet_id') or t.get('id')) for t in self.tweets)
+            self._times = array('d', (ts for ts, _ in entries))
+            self._time_ids = [tid for _, tid in entries]
+        return self._times
+
+    def _index_tweet(self, tweet: Dict, old: Optional[Dict] = None):
+        """Add a tweet to the id, graph and metadata indexes, moving its entries
+        if an update changed them; old holds its INDEXED_FIELDS values from before"""
+        tweet_id = tweet.get('tweet_id') or tweet.get('id')
+        self._by_id[tweet_id] = tweet
+        old = old or {}
+        for key, edges in (('in_reply_to_status_id', self._replies), ('quoted_tweet_id', self._quotes)):
+            new, previous = tweet.get(key), old.get(key)
+            if new == previous:
+                continue
+            if previous and tweet_id in edges.get(previous, ()):
+                edges[previous].remove(tweet_id)
+            if new:
+                edges.setdefault(new, []).append(tweet_id)
+        for key, groups in (('author_id', self._by_author), ('conversation_id', self._by_conversation)):
+            new, previous = tweet.get(key), old.get(key)
+            if new == previous:
+                continue
+            if previous:
+                groups.get(previous, set()).discard(tweet_id)
+            if new:
+                groups.setdefault(new, set()).add(tweet_id)
+        if self._lexical is not None and tweet['text'] != old.get('text'):
+            if 'text' in old:
+                self._lexical.remove(tweet_id, old['text'])
+            self._lexical.add(tweet_id, tweet['text'])
+        if self._times is not None and not old:
+            position = bisect_right(self._times, tweet_timestamp(tweet))
+            self._times.insert(position, tweet_timestamp(tweet))
+            self._time_ids.insert(position, tweet_id)
+
+    def _thread_activity(self, tweet: Dict) -> float:
+        """Replies around a tweet: its own plus its parent's"""
+        activity = len(self._replies.get(tweet.get('tweet_id') or tweet.get('id'), ()))
+        if tweet.get('in_reply_to_status_id'):
+            activity += len(self._replies.get(tweet['in_reply_to_status_id'], ()))
+        return float(activity)
+
+    def get_tweet(self, tweet_id: str) -> Optional[Dict]:
+        """Look up a stored tweet by id, falling back to the archive"""
+        tweet = self._by_id.get(tweet_id)
+        if tweet is None and self.archive.shards:
+            tweet = self.archive.get(tweet_id)
+        return tweet
+
+    def _reply_ids(self, tweet_id: str) -> List[str]:
+        """Ids of replies to a tweet, archived ones first"""
+        hot = self._replies.get(tweet_id, [])
+        archived = [tid for tid in self.archive.reply_ids(tweet_id) if tid not in self._by_id]
+        return archived + hot if archived else hot
+
+    def _quote_ids(self, tweet_id: str) -> List[str]:
+        """Ids of tweets quoting a tweet, archived ones first"""
+        hot = self._quotes.get(tweet_id, [])
+        archived = [tid for tid in self.archive.quote_ids(tweet_id) if tid not in self._by_id]
+        return archived + hot if archived else hot
+
+    def replies_to(self, tweet_id: str) -> List[Dict]:
+        """Stored replies to a tweet, including archived ones"""
+        return [t for t in map(self.get_tweet, self._reply_ids(tweet_id)) if t is not None]
+
+    def quotes_of(self, tweet_id: str) -> List[Dict]:
+        """Stored tweets quoting a tweet, including archived ones"""
+        return [t for t in map(self.get_tweet, self._quote_ids(tweet_id)) if t is not None]
+
+    def missing_references(self, tweets: Iterable[Dict]) -> List[str]:
+        """Parent and quoted tweet ids these tweets point to that aren't stored yet"""
+        missing = []
+        for tweet in tweets:
+            for ref in (tweet.get('in_reply_to_status_id'), tweet.get('quoted_tweet_id')):
+                if ref and ref not in missing and self.get_tweet(ref) is None:
+                    missing.append(ref)
+        return missing
+
+    def warm_up(self):
+        """Load the index now so new tweets are embedded as they are stored"""
+        return self.index
+
+    def _sync_index(self):
+        """Add missing or edited tweets to the index and drop ones no longer stored"""
+        from embedding_cache import text_hash
+        indexed = self._index.hashes()
+        gone = [tid for tid in indexed if tid not in self._by_id]
+        if gone:
+            self._index.remove(gone)
+        self.embeddings.discard([tid for tid in self.embeddings.rows if tid not in self._by_id])
+        if not indexed and self.tweets:
+            # A new index, or one saved for another compact mode: build it at
+            # the right type in one pass instead of adding and then rebuilding
+            self._index.rebuild([t.get('tweet_id') or t.get('id') for t in self.tweets],
+                                _EmbeddedTweets(self, self.tweets), [text_hash(t['text']) for t in self.tweets])
+            return
+        stale = [t for t in self.tweets if indexed.get(t.get('tweet_id') or t.get('id')) != text_hash(t['text'])]
+        if stale:
+            self._index_tweets(stale, self._embed_tweets(stale))
+
+    def _index_tweets(self, tweets: List[Dict], vectors: np.ndarray):
+        """Add or update tweets in the vector index, rebuilding it when it outgrows its type"""
+        from embedding_cache import text_hash
+        self._index.add([t.get('tweet_id') or t.get('id') for t in tweets], vectors,
+                        [text_hash(t['text']) for t in tweets])
+        if self._index.needs_rebuild():
+            self._index.rebuild([t.get('tweet_id') or t.get('id') for t in self.tweets],
+                                _EmbeddedTweets(self, self.tweets),
+                                [text_hash(t['text']) for t in self.tweets])
+
+    def _embed_tweets(self, tweets: List[Dict]) -> np.ndarray:
+        """Embeddings for tweets, encoding only cache misses in one batch"""
+        import numpy as np
+        vectors = np.empty((len(tweets), self.embedding_size), dtype=np.float32)
+        missing = []
+        for i, tweet in enumerate(tweets):
+            cached = self.embeddings.get(tweet.get('tweet_id') or tweet.get('id'), tweet["text"])
+            if cached is None:
+                missing.append(i)
+            else:
+                vectors[i] = cached
+        if missing:
+            ids = [tweets[i].get('tweet_id') or tweets[i].get('id') for i in missing]
+            texts = [tweets[i]["text"] for i in missing]
+            metrics.observe("encode_batch_size", len(texts))
+            with metrics.timer("encode_seconds", kind="tweets"):
+                encoded = self.model.encode(texts, batch_size=64)
+            self.embeddings.put_many(ids, texts, encoded)
+            vectors[missing] = encoded
+            print(f"[TweetStore] Encoded {len(missing)} new or edited tweets")
+        return vectors
+
+    def _save_tweets(self, changed: List[Dict]):
+        """Persist changed tweets, or hold them until the enclosing batch() ends"""
+        for tweet in changed:
+            self._pending[tweet.get('tweet_id') or tweet.get('id')] = tweet
+        if self._batch_depth == 0:
+            self.flush()
+
+    def flush(self):
+        """Write all pending changes to the storage backend"""
+        if not self._pending:
+            return
+        changed = list(self._pending.values())
+        with metrics.timer("store_save_seconds", backend=type(self.backend).__name__):
+            self.backend.save(self.tweets, changed)
+            if self.embeddings is not None:
+                self.embeddings.save()
+        metrics.observe("store_save_tweets", len(changed))
+        self._pending = {}
+        print(f"[TweetStore] Saved {len(changed)} changed tweets to storage")
+
+    def get_state(self, key: str) -> Optional[str]:
+        """Small persisted values kept alongside the tweets (e.g. fetch cursors)"""
+        return self.backend.get_state(key)
+
+    def set_state(self, key: str, value: str):
+        self.backend.set_state(key, value)
+
+    @contextmanager
+    def batch(self):
+        """Group saves (e.g. for a whole bot cycle) into one commit"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def close(self):
+        """Flush pending changes, save the vector index and release the storage backend"""
+        self.flush()
+        if self._index is not None:
+            self._index.save()
+        self.backend.close()
+        if self._owns_model:
+            self._model.close()
+
+    def _normalize_tweet(self, tweet_data: Dict) -> Dict:
+        """Standardize a tweet dict, handling both id and tweet_id fields"""
         # Ensure we have required fields
         tweet_id = tweet_data.get('tweet_id') or tweet_data.get('id')
         if not tweet_id or 'text' not in tweet_data:
             raise ValueError("Tweet data must have ID and text fields")
 
-        # Standardize the data structure
-        normalized_tweet = {
+        return {
             'tweet_id': tweet_id,
             'id': tweet_id,  # Keep both for compatibility
             'text': tweet_data['text'],
             'author_id': tweet_data.get('author_id'),
             'created_at': tweet_data.get('created_at'),
-            'in_reply_to_status_id': tweet_data.get('in_reply_to_status_id'),
+            'in_reply_to_status_id': tweet_data.get('in_reply_to_status_id') or tweet_data.get('parent_tweet_id'),
             'quoted_tweet_id': tweet_data.get('quoted_tweet_id'),
-            'is_read': tweet_data.get('is_read', False)
+            'conversation_id': tweet_data.get('conversation_id'),
+            # None means "not given": new tweets default to unread, stored ones keep their state
+            'is_read': tweet_data.get('is_read')
         }
 
-        # Update existing or add new
-        existing_idx = None
-        for i, t in enumerate(self.tweets):
-            if t.get('tweet_id') == tweet_id or t.get('id') == tweet_id:
-                existing_idx = i
-                break
+    def store_tweet(self, tweet_data: Dict):
+        """Store a tweet, handling both id and tweet_id fields"""
+        self._store_batch([self._normalize_tweet(tweet_data)])
 
-        if existing_idx is not None:
-            self.tweets[existing_idx].update(normalized_tweet)
-        else:
-            self.tweets.append(normalized_tweet)
-            # Add new embedding
-            embedding = self.model.encode(normalized_tweet['text'])
-            self.index.add(np.array([embedding]))
+    def store_tweets(self, tweets: Iterable[Dict], batch_size: int = 256) -> int:
+        """Bulk-store tweets: one encode call and one save per batch.
 
-        self._save_tweets()
+        Invalid records are skipped and duplicates within a batch collapse to
+        the last one seen. Returns the number of tweets stored.
+        """
+        stored = 0
+        skipped = 0
+        batch: Dict[str, Dict] = {}
+        for tweet_data in tweets:
+            try:
+                normalized_tweet = self._normalize_tweet(tweet_data)
+            except ValueError:
+                skipped += 1
+                continue
+            batch[normalized_tweet['tweet_id']] = normalized_tweet
+            if len(batch) >= batch_size:
+                stored += self._store_batch(list(batch.values()))
+                batch = {}
+        if batch:
+            stored += self._store_batch(list(batch.values()))
+        if skipped:
+            print(f"[TweetStore] Skipped {skipped} tweets without ID or text")
+        return stored
 
-    def get_next_unread_tweet(self) -> Optional[Dict]:
-        """Get oldest unread tweet"""
-        for tweet in self.tweets:
-            if not tweet.get('is_read', False):
-                return tweet
-        return None
+    def _store_batch(self, batch: List[Dict]) -> int:
+        """Update existing or add new tweets, then persist once"""
+        changed = []
+        added = []
+        for normalized_tweet in batch:
+            existing = self._by_id.get(normalized_tweet['tweet_id'])
+            if existing is None and self.archive.shards:
+                archived = self.archive.get(normalized_tweet['tweet_id'])
+                if archived is not None:
+                    normalized_tweet = self._unarchive(archived, normalized_tweet)
+                    if normalized_tweet is None:
+                        continue
+            if existing is not None:
+                old = {key: existing.get(key) for key in INDEXED_FIELDS}
+                # Only overwrite fields we actually got, so a re-fetched
+                # mention doesn't lose its read state or thread links
+                existing.update({k: v for k, v in normalized_tweet.items() if v is not None})
+                self._index_tweet(existing, old)
+                if normalized_tweet['is_read'] is False:
+                    self.unread.push(existing)
+                changed.append(existing)
+            else:
+                normalized_tweet['is_read'] = bool(normalized_tweet['is_read'])
+                if self.compact:
+                    normalized_tweet = TweetRecord(normalized_tweet)
+                self.tweets.append(normalized_tweet)
+                self._index_tweet(normalized_tweet)
+                if not normalized_tweet['is_read']:
+                    self.unread.push(normalized_tweet)
+                added.append(normalized_tweet)
+
+        # Encode new and edited tweets together; unchanged texts are skipped by the index.
+        # If the index isn't loaded yet they are picked up when it is.
+        if self._index is not None and (added or changed):
+            self._index_tweets(added + changed, self._embed_tweets(added + changed))
+
+        self._save_tweets(added + changed)
+        return len(batch)
+
+    @staticmethod
+    def _unarchive(archived: Dict, normalized_tweet: Dict) -> Optional[Dict]:
+        """An archived tweet stored again: None if it brings nothing new, else
+        the merged tweet to keep hot, with the archived read state (a re-fetched
+        mention mustn't come back unread)"""
+        merged = dict(archived)
+        merged.update({k: v for k, v in normalized_tweet.items() if v is not None and k != 'is_read'})
+        if merged == archived:
+            return None
+        merged['is_read'] = archived.get('is_read', True)
+        merged.pop('leased_until', None)
+        return merged
+
+    def _is_ready(self, tweet_id: str) -> bool:
+        tweet = self._by_id.get(tweet_id)
+        return bool(tweet) and not tweet.get('is_read') and tweet.get('leased_until', 0) <= time.time()
+
+    def get_next_unread_tweet(self, lease_seconds: Optional[float] = None) -> Optional[Dict]:
+        """Get the highest-priority unread tweet in O(log n).
+
+        With lease_seconds the tweet is taken off the queue and leased (the
+        lease is persisted), so it isn't handed out again, even by a later
+        run, until it is marked read, released or the lease expires.
+        Without it this is a peek.
+        """
+        now = time.time()
+        self.unread.release_expired(now, self._by_id.get)
+        if lease_seconds is None:
+            tweet_id = self.unread.peek(self._is_ready)
+            return self._by_id[tweet_id] if tweet_id is not None else None
+
+        tweet_id = self.unread.pop(self._is_ready)
+        if tweet_id is None:
+            return None
+        tweet = self._by_id[tweet_id]
+        tweet['leased_until'] = now + lease_seconds
+        self.unread.hold(tweet_id, tweet['leased_until'])
+        self._save_tweets([tweet])
+        return tweet
+
+    def extend_leases(self, tweet_ids: List[str], lease_seconds: float):
+        """Renew the leases of tweets still being worked on, so they aren't
+        handed out again while a slow job (a Message Batch) decides on them"""
+        until = time.time() + lease_seconds
+        renewed = []
+        for tweet_id in tweet_ids:
+            tweet = self._by_id.get(tweet_id)
+            if tweet and not tweet.get('is_read') and tweet.get('leased_until'):
+                tweet['leased_until'] = until
+                self.unread.hold(tweet_id, until)
+                renewed.append(tweet)
+        self._save_tweets(renewed)
+
+    def release_tweet(self, tweet_id: str):
+        """Give a leased tweet back to the queue without marking it read"""
+        tweet = self._by_id.get(tweet_id)
+        if tweet and tweet.pop('leased_until', None) is not None:
+            if not tweet.get('is_read'):
+                self.unread.push(tweet)
+            self._save_tweets([tweet])
 
     def mark_tweet_as_read(self, tweet_id: str):
         """Mark tweet as read"""
-        for tweet in self.tweets:
-            if tweet.get('tweet_id') == tweet_id or tweet.get('id') == tweet_id:
-                tweet['is_read'] = True
-                break
-        self._save_tweets()
+        tweet = self._by_id.get(tweet_id)
+        if tweet:
+            tweet['is_read'] = True
+            tweet.pop('leased_until', None)
+            self._save_tweets([tweet])
+
+    def get_thread(self, tweet_id: str, max_depth: int = 10, max_fanout: int = 5) -> List[Dict]:
+        """Get a tweet's thread: ancestor chain, sibling replies, quoted tweets and replies.
 
-    def get_thread(self, tweet_id: str) -> List[Dict]:
-        """Get a tweet's thread (original tweet + context)"""
-        # Find the tweet
-        tweet = next((t for t in self.tweets if t.get('tweet_id') == tweet_id or t.get('id') == tweet_id), None)
+        Walks the reply/quote indexes, so the cost depends on the thread size
+        (bounded by max_depth and max_fanout) rather than the store size.
+        """
+        tweet = self.get_tweet(tweet_id)
         if not tweet:
             print(f"[TweetStore] Tweet {tweet_id} not found")
             return []
 
-        thread = [tweet]  # Start with the tweet itself
+        seen = {tweet_id}
+
+        # Ancestors, nearest first, stopping at gaps in what we've stored
+        ancestors = []
+        parent_id = tweet.get('in_reply_to_status_id')
+        while parent_id and parent_id not in seen and len(ancestors) < max_depth:
+            parent = self.get_tweet(parent_id)
+            if not parent:
+                break
+            seen.add(parent_id)
+            ancestors.append(parent)
+            parent_id = parent.get('in_reply_to_status_id')
+
+        thread = ancestors[::-1] + [tweet]
 
-        # Add reply-to tweet if it exists
+        # Other replies to the same parent
         if tweet.get('in_reply_to_status_id'):
-            parent = next((t for t in self.tweets if 
-                t.get('tweet_id') == tweet['in_reply_to_status_id'] or 
-                t.get('id') == tweet['in_reply_to_status_id']), None)
-            if parent:
-                thread.insert(0, parent)
-
-        # Add quoted tweet if it exists
-        if tweet.get('quoted_tweet_id'):
-            quoted = next((t for t in self.tweets if 
-                t.get('tweet_id') == tweet['quoted_tweet_id'] or 
-                t.get('id') == tweet['quoted_tweet_id']), None)
-            if quoted:
-                thread.append(quoted)
+            thread.extend(self._collect(self._reply_ids(tweet['in_reply_to_status_id']), seen, max_fanout))
+
+        # Tweets quoted anywhere along the chain
+        for t in thread[:len(ancestors) + 1]:
+            quoted_id = t.get('quoted_tweet_id')
+            if quoted_id:
+                thread.extend(self._collect([quoted_id], seen, 1))
+
+        # Replies below the tweet, level by level
+        level = [tweet_id]
+        for _ in range(max_depth):
+            replies = []
+            for parent_id in level:
+                replies.extend(self._collect(self._reply_ids(parent_id), seen, max_fanout))
+            if not replies:
+                break
+            thread.extend(replies)
+            level = [r.get('tweet_id') or r.get('id') for r in replies]
 
         return thread
 
-    def retrieve_context(self, query: str, k: int = 5) -> List[Dict]:
-        """Find similar tweets"""
-        if not self.tweets:
+    def _collect(self, ids: List[str], seen: set, limit: int) -> List[Dict]:
+        """Up to `limit` stored tweets from ids that aren't in the thread yet"""
+        found = []
+        for tid in ids:
+            if len(found) >= limit:
+                break
+            if tid in seen:
+                continue
+            tweet = self.get_tweet(tid)
+            if tweet is None:
+                continue
+            seen.add(tid)
+            found.append(tweet)
+        return found
+
+    def delete_tweet(self, tweet_id: str):
+        """Remove a tweet from the store, its indexes and the vector index"""
+        self._remove_hot([tweet_id])
+
+    def _remove_hot(self, tweet_ids: List[str]):
+        """Drop tweets from memory, the graph indexes, the vector index and the backend"""
+        removed = []
+        for tweet_id in tweet_ids:
+            tweet = self._by_id.pop(tweet_id, None)
+            if not tweet:
+                continue
+            removed.append(tweet_id)
+            for key, edges in (('in_reply_to_status_id', self._replies), ('quoted_tweet_id', self._quotes)):
+                if tweet.get(key) and tweet_id in edges.get(tweet[key], ()):
+                    edges[tweet[key]].remove(tweet_id)
+            for key, groups in (('author_id', self._by_author), ('conversation_id', self._by_conversation)):
+                if tweet.get(key) in groups:
+                    groups[tweet[key]].discard(tweet_id)
+                    if not groups[tweet[key]]:
+                        del groups[tweet[key]]
+            if self._lexical is not None:
+                self._lexical.remove(tweet_id, tweet['text'])
+            self._pending.pop(tweet_id, None)
+        if not removed:
+            return
+        gone = set(removed)
+        self.tweets = [t for t in self.tweets if (t.get('tweet_id') or t.get('id')) not in gone]
+        if self._times is not None:
+            keep = [i for i, tid in enumerate(self._time_ids) if tid not in gone]
+            self._times = array('d', (self._times[i] for i in keep))
+            self._time_ids = [self._time_ids[i] for i in keep]
+        if self._index is not None:
+            self._index.remove(removed)
+            self.embeddings.discard(removed)
+        self.backend.delete(removed, self.tweets)
+
+    def apply_tiering(self, now: Optional[float] = None) -> int:
+        """Move old read tweets to the archive and apply retention; returns how many moved.
+
+        Unread and leased tweets always stay hot. Archived tweets keep their
+        embeddings when the index is loaded, so archive search needn't re-encode.
+        """
+        now = now or time.time()
+        if self.hot_days is None and self.max_hot_tweets is None and self.retention_days is None:
+            return 0
+        movable = [t for t in self.tweets if t.get('is_read') and t.get('leased_until', 0) <= now]
+        cold = []
+        if self.hot_days is not None:
+            cutoff = now - self.hot_days * 86400
+            cold = [t for t in movable if tweet_timestamp(t) < cutoff]
+        if self.max_hot_tweets is not None and len(self.tweets) - len(cold) > self.max_hot_tweets:
+            chosen = {id(t) for t in cold}
+            rest = sorted((t for t in movable if id(t) not in chosen), key=tweet_timestamp)
+            cold += rest[:len(self.tweets) - len(cold) - self.max_hot_tweets]
+
+        if cold:
+            self.flush()
+            vectors = None
+            if self.embeddings is not None:
+                cached = [self.embeddings.get(t.get('tweet_id') or t.get('id'), t['text']) for t in cold]
+                if all(v is not None for v in cached):
+                    import numpy as np
+                    vectors = np.array(cached, dtype=np.float32)
+            self.archive.append(cold, vectors, self.model_name)
+            self._remove_hot([t.get('tweet_id') or t.get('id') for t in cold])
+            print(f"[TweetStore] Moved {len(cold)} tweets to the archive, {len(self.tweets)} stay hot")
+        if self.retention_days is not None:
+            self.archive.compact(self.retention_days * 86400, now)
+        return len(cold)
+
+    def _candidates(self, author_id: Optional[str], conversation_id: Optional[str], since: Optional[float],
+                    until: Optional[float], is_read: Optional[bool]) -> Optional[Set[str]]:
+        """Hot tweet ids passing the prefilters, or None when no filter narrows the set.
+
+        Starts from the smallest metadata index that applies (author,
+        conversation, unread queue or time range) and checks the remaining
+        filters tweet by tweet, so the cost follows the result, not the store.
+        Filters that keep most of the store (e.g. is_read=True) also give
+        None; the searches then check hits as they go instead.
+        """
+        groups = []
+        if author_id is not None:
+            groups.append(self._by_author.get(author_id, set()))
+        if conversation_id is not None:
+            groups.append(self._by_conversation.get(conversation_id, set()))
+        if is_read is False:
+            groups.append(self.unread.ids())
+        if groups:
+            groups.sort(key=len)
+            ids = groups[0]
+        elif since is not None or until is not None:
+            times = self._time_index()
+            lo = bisect_left(times, since) if since is not None else 0
+            hi = bisect_right(times, until) if until is not None else len(times)
+            ids = self._time_ids[lo:hi]
+            since = until = None  # the slice already is the time range
+        else:
+            return None
+        if len(ids) > max(EXACT_SEARCH_MAX, len(self._by_id) // 20):
+            return None
+        matches = self._prefilter(author_id, conversation_id, since, until, is_read)
+        return {tid for tid in ids if tid in self._by_id and matches(self._by_id[tid])}
+
+    @staticmethod
+    def _prefilter(author_id: Optional[str], conversation_id: Optional[str], since: Optional[float],
+                   until: Optional[float], is_read: Optional[bool]) -> Callable[[Dict], bool]:
+        """Predicate for the retrieve_context filters, for tweets found some other way"""
+        def matches(tweet: Dict) -> bool:
+            if author_id is not None and tweet.get('author_id') != author_id:
+                return False
+            if conversation_id is not None and tweet.get('conversation_id') != conversation_id:
+                return False
+            if is_read is not None and bool(tweet.get('is_read')) != is_read:
+                return False
+            if since is not None or until is not None:
+                ts = tweet_timestamp(tweet)
+                if (since is not None and ts < since) or (until is not None and ts > until):
+                    return False
+            return True
+        return matches
+
+    def _exact_search(self, query_emb, tweet_ids: Set[str], k: int) -> List[tuple]:
+        """(tweet, distance) for the k nearest of a small candidate set, from cached embeddings"""
+        import numpy as np
+        ids, vectors = self.embeddings.lookup(list(tweet_ids))
+        tweets = [self._by_id[tid] for tid in ids]
+        if len(ids) < len(tweet_ids):
+            # Not embedded yet (e.g. stored before the index was loaded)
+            found = set(ids)
+            missing = [self._by_id[tid] for tid in tweet_ids if tid not in found]
+            tweets += missing
+            vectors = np.concatenate([vectors, self._embed_tweets(missing)])
+        query = np.asarray(query_emb, dtype=np.float32).reshape(-1)
+        if self.compact:
+            # Same distances as the cosine index: squared L2 between unit vectors
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        top = np.argsort(distances)[:k]
+        return [(tweets[i], float(distances[i])) for i in top]
+
+    def _vector_hits(self, query_future, k: int, candidates: Optional[Set[str]], matches: Callable[[Dict], bool],
+                     filtered: bool, search_archive: Optional[bool], archive_since: Optional[float]) -> List[Dict]:
+        """Hot (and, if needed, archived) tweets nearest to the query embedding"""
+        index = self.index
+        with metrics.timer("encode_seconds", kind="query"):
+            query_emb = query_future.result()
+        with metrics.timer("index_search_seconds", tier="hot"):
+            if candidates is not None and len(candidates) <= EXACT_SEARCH_MAX:
+                hits = self._exact_search(query_emb, candidates, k) if candidates else []
+            else:
+                # A broad filter without a candidate set: fetch deeper until k hits pass it
+                fetch = k
+                while True:
+                    hits = [(self._by_id[tid], dist) for tid, dist in index.search(query_emb, fetch, restrict=candidates)
+                            if tid in self._by_id and matches(self._by_id[tid])][:k]
+                    if len(hits) >= k or not filtered or candidates is not None or fetch >= len(index):
+                        break
+                    fetch *= 4
+        if search_archive is None:
+            search_archive = len(hits) < k
+        if search_archive and self.archive.shards:
+            with metrics.timer("index_search_seconds", tier="archive"):
+                cold = self.archive.search(query_emb, k, lambda texts: self.model.encode(texts, batch_size=64),
+                                           self.model_name, since=archive_since, normalize=self.compact is not None,
+                                           accept=matches if filtered else None)
+                # Hot tweets (including ones updated since they were archived) win over archived copies
+                hits += [(t, d) for t, d in cold if (t.get('tweet_id') or t.get('id')) not in self._by_id]
+            hits.sort(key=lambda hit: hit[1])
+        return [t for t, _ in hits[:k]]
+
+    def retrieve_context(self, query: str, k: int = 5, search_archive: Optional[bool] = None,
+                         archive_days: Optional[float] = None, author_id: Optional[str] = None,
+                         conversation_id: Optional[str] = None, since: Optional[float] = None,
+                         until: Optional[float] = None, is_read: Optional[bool] = None,
+                         mode: str = "hybrid") -> List[Dict]:
+        """Find tweets related to a query.
+
+        mode "hybrid" fuses BM25 over the tweet texts, which matches handles,
+        tickers and URLs exactly, with embedding similarity by reciprocal
+        rank; "vector" and "lexical" use just one of them. author_id,
+        conversation_id, since/until (epoch seconds) and is_read narrow the
+        candidates through metadata indexes before anything is scored.
+
+        The archive is searched too (by embedding only) when search_archive
+        is True, or by default when the hot tier has fewer than k tweets to
+        offer; archive_days skips shards with nothing newer than that many days.
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        if not self.tweets and not self.archive.shards:
             return []
-        query_emb = self.model.encode(query)
-        D, I = self.index.search(np.array([query_emb]), min(k, len(self.tweets)))
-        return [self.tweets[i] for i in I[0] if i < len(self.tweets)]
\ No newline at end of file
+        # The query encodes on the worker while the lexical side is scored
+        query_future = self._model.submit(query) if mode != "lexical" else None
+        filtered = any(f is not None for f in (author_id, conversation_id, since, until, is_read))
+        candidates = self._candidates(author_id, conversation_id, since, until, is_read)
+        matches = self._prefilter(author_id, conversation_id, since, until, is_read)
+        # Fused lists go deeper than k so tweets ranked well by both sides surface
+        depth = 4 * k if mode == "hybrid" else k
+
+        rankings = []
+        if mode != "lexical":
+            archive_since = time.time() - archive_days * 86400 if archive_days else None
+            if since is not None:
+                archive_since = max(since, archive_since or since)
+            if is_read is False:
+                search_archive = False  # archived tweets are all read
+            hits = self._vector_hits(query_future, depth, candidates, matches, filtered, search_archive, archive_since)
+            rankings.append(hits)
+        if mode != "vector":
+            with metrics.timer("index_search_seconds", tier="lexical"):
+                accept = (lambda tid: matches(self._by_id[tid])) if filtered and candidates is None else None
+                hits = self.lexical.search(query, depth, candidates, accept)
+                rankings.append([self._by_id[tid] for tid, _ in hits if tid in self._by_id])
+        if len(rankings) == 1:
+            return rankings[0][:k]
+
+        tweets = {t.get('tweet_id') or t.get('id'): t for ranking in rankings for t in ranking}
+        fused = reciprocal_rank_fusion([[t.get('tweet_id') or t.get('id') for t in ranking] for ranking in rankings], k)
+        return [tweets[tid] for tid in fused]
@@ -0,0 +1,82 @@
+# tests/test_batch_mode.py
+import json
+import threading
+import time
+
+from fakes import FakeMessageBatches
+from model_integration import ModelInterface
+from rag import TweetStore
+
+
+def reply_to_focus(params):
+    """Replies to the tweet the prompt marks as the main one"""
+    prompt = params["messages"][0]["content"]
+    tweet_id = prompt.split("Tweet ID: ")[1].split("\n")[0]
+    return json.dumps({"action": "reply", "tweet_id": tweet_id, "text": f"reply to {tweet_id}"})
+
+
+def make_model(tmp_path, batches):
+    return ModelInterface(cache_path=str(tmp_path / "decision_cache.json"), batches=batches, api_key="test-key")
+
+
+def thread(tweet_id):
+    return [{"tweet_id": tweet_id, "text": f"tweet number {tweet_id}", "author_id": "42"}]
+
+
+def test_decisions_come_back_by_custom_id(tmp_path):
+    batches = FakeMessageBatches(reply_to_focus, polls_until_done=3, fail_ids=["tweet-2"])
+    model = make_model(tmp_path, batches)
+    polls = []
+    decisions = model.decide_on_threads_batch(
+        {f"tweet-{i}": (thread(str(i)), str(i), None) for i in (1, 2, 3)},
+        poll_interval=0, on_poll=lambda: polls.append(1))
+    assert decisions == {
+        "tweet-1": {"action": "reply", "tweet_id": "1", "text": "reply to 1"},
+        "tweet-3": {"action": "reply", "tweet_id": "3", "text": "reply to 3"},
+    }
+    assert len(polls) == 3
+    assert len(batches.batches) == 1
+
+
+def test_cached_decisions_skip_the_batch(tmp_path):
+    batches = FakeMessageBatches(reply_to_focus)
+    model = make_model(tmp_path, batches)
+    threads = {"tweet-1": (thread("1"), "1", None)}
+    first = model.decide_on_threads_batch(threads, poll_interval=0)
+    second = model.decide_on_threads_batch(threads, poll_interval=0)
+    assert first == second
+    assert len(batches.batches) == 1
+    assert model.stats()['decision_cache_hits'] == 1
+
+
+def test_timeout_cancels_the_batch(tmp_path):
+    batches = FakeMessageBatches(reply_to_focus, polls_until_done=1000)
+    model = make_model(tmp_path, batches)
+    decisions = model.decide_on_threads_batch({"tweet-1": (thread("1"), "1", None)}, poll_interval=0, timeout=0)
+    assert decisions == {}
+    assert all(batch["cancelled"] for batch in batches.batches.values())
+
+
+def test_leases_outlive_a_slow_batch(tmp_path):
+    store = TweetStore(storage_dir=str(tmp_path / "store"))
+    store.store_tweets([{"id": str(i), "text": f"tweet number {i}"} for i in (1, 2)])
+    leased = [store.get_next_unread_tweet(lease_seconds=60)['tweet_id'] for _ in range(2)]
+    model = make_model(tmp_path, FakeMessageBatches(reply_to_focus, polls_until_done=2))
+    model.decide_on_threads_batch({f"tweet-{tid}": (thread(tid), tid, None) for tid in leased}, poll_interval=0,
+                                  on_poll=lambda: store.extend_leases(leased, 3600))
+    assert all(store.get_tweet(tid)['leased_until'] > time.time() + 3000 for tid in leased)
+    assert store.get_next_unread_tweet(lease_seconds=60) is None
+    store.close()
+
+
+def test_stop_event_cancels_a_pending_batch(tmp_path):
+    batches = FakeMessageBatches(reply_to_focus, polls_until_done=1000)
+    model = make_model(tmp_path, batches)
+    stop = threading.Event()
+    threading.Timer(0.1, stop.set).start()
+    start = time.monotonic()
+    decisions = model.decide_on_threads_batch({"tweet-1": (thread("1"), "1", None)}, poll_interval=30,
+                                              stop_event=stop)
+    assert decisions == {}
+    assert time.monotonic() - start < 5
+    assert all(batch["cancelled"] for batch in batches.batches.values())
@@ -0,0 +1,103 @@
+# tests/test_decision_parser.py
+import json
+
+import pytest
+from anthropic import Anthropic
+
+from decision_parser import DecisionParseError, JsonObjectExtractor, parse_decision, validate_decision
+from fakes import FakeAnthropicServer
+from model_integration import ModelInterface
+
+
+def test_fenced_json():
+    text = 'Sure, here you go:\n```json\n{"action": "like", "tweet_id": 123, "text": null}\n```\nAnything else?'
+    assert parse_decision(text) == {"action": "like", "tweet_id": "123", "text": ""}
+
+
+def test_braces_and_quotes_inside_strings():
+    decision = {"action": "reply", "tweet_id": "7", "text": 'use {braces} and "quotes" \\ } freely'}
+    assert parse_decision(json.dumps(decision) + ' {"action": "like"}') == decision
+
+
+def test_streamed_chunks_complete_on_the_closing_brace():
+    text = json.dumps({"action": "post", "tweet_id": None, "text": "a } inside {"})
+    extractor = JsonObjectExtractor()
+    chunks = ["```json\n"] + [text[i:i + 3] for i in range(0, len(text), 3)] + ["\n``` trailing prose"]
+    results = [extractor.feed(chunk) for chunk in chunks]
+    done = results.index(text)
+    assert results[:done] == [None] * done
+    assert all(result == text for result in results[done:])
+
+
+def test_incomplete_object_is_an_error():
+    with pytest.raises(DecisionParseError, match="no complete JSON object"):
+        parse_decision('{"action": "reply", "tweet_id": "1", "text": "cut off')
+
+
+def test_invalid_json_is_an_error():
+    with pytest.raises(DecisionParseError, match="invalid JSON"):
+        parse_decision("{'action': 'like'}")
+
+
+@pytest.mark.parametrize("data, message", [
+    (["like"], "expected a JSON object"),
+    ({"action": "dance"}, "action must be one of"),
+    ({"action": "reply", "text": "hi"}, "needs a tweet_id"),
+    ({"action": "quote", "tweet_id": "1", "text": "   "}, "needs non-empty text"),
+    ({"action": "post", "text": ["not", "a", "string"]}, "text must be a string"),
+])
+def test_validate_rejects(data, message):
+    with pytest.raises(DecisionParseError, match=message):
+        validate_decision(data)
+
+
+def test_validate_normalizes():
+    assert validate_decision({"action": "do_nothing"}) == {"action": "do_nothing", "tweet_id": None, "text": ""}
+
+
+class Responder:
+    """Replies from a script, one entry per model call, recording the requests"""
+
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    def __call__(self, params):
+        self.requests.append(params)
+        return self.replies.pop(0)
+
+
+def ask(tmp_path, responder):
+    with FakeAnthropicServer(responder, chunk_chars=4) as server:
+        model = ModelInterface(cache_path=str(tmp_path / "decision_cache.json"),
+                               client=Anthropic(api_key="test-key", base_url=server.url))
+        decision = model.decide_on_tweet_thread([{"tweet_id": "9", "text": "hello", "author_id": "1"}], "9")
+    return decision, model.stats()
+
+
+def test_stream_stops_at_the_end_of_the_object(tmp_path):
+    responder = Responder('{"action": "like", "tweet_id": "9", "text": ""}' + " and then a long explanation" * 20)
+    decision, stats = ask(tmp_path, responder)
+    assert decision == {"action": "like", "tweet_id": "9", "text": ""}
+    assert stats['early_aborts'] == 1
+    assert stats['parse_failures'] == 0
+
+
+def test_repair_round_fixes_a_bad_decision(tmp_path):
+    responder = Responder('{"action": "reply", "tweet_id": "9"}',
+                          '{"action": "reply", "tweet_id": "9", "text": "fixed"}')
+    decision, stats = ask(tmp_path, responder)
+    assert decision == {"action": "reply", "tweet_id": "9", "text": "fixed"}
+    assert stats['parse_failures'] == 1
+    assert stats['repairs_succeeded'] == 1
+    # The repair request shows the model its output and the error
+    repair = responder.requests[1]["messages"]
+    assert repair[1] == {"role": "assistant", "content": '{"action": "reply", "tweet_id": "9"}'}
+    assert "needs non-empty text" in repair[2]["content"]
+
+
+def test_failed_repair_does_nothing(tmp_path):
+    responder = Responder('{"action": "dance"}', "still not JSON")
+    decision, stats = ask(tmp_path, responder)
+    assert decision == {"action": "do_nothing"}
+    assert stats['repairs_succeeded'] == 0
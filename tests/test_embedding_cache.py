@@ -0,0 +1,95 @@
+# tests/test_embedding_cache.py
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+DIM = 4
+
+
+def vectors(*values):
+    return np.array([[v] * DIM for v in values], dtype=np.float32)
+
+
+def reopen(tmp_path, model="stub"):
+    return EmbeddingCache(str(tmp_path), model, DIM)
+
+
+def test_saves_append_to_the_log(tmp_path):
+    cache = reopen(tmp_path)
+    cache.put_many([str(i) for i in range(2000)], [f"text {i}" for i in range(2000)], vectors(*range(2000)))
+    cache.save()
+    snapshot = os.path.getmtime(cache.meta_file), os.path.getsize(cache.meta_file)
+    assert os.path.getsize(cache.log_file) == 0
+
+    cache.put_many(["2000"], ["text 2000"], vectors(2000))
+    cache.put_many(["5"], ["text 5 (edited)"], vectors(-5))
+    cache.discard(["7"])
+    cache.save()
+    assert (os.path.getmtime(cache.meta_file), os.path.getsize(cache.meta_file)) == snapshot
+    with open(cache.log_file) as f:
+        assert len(f.readlines()) == 3
+
+    reopened = reopen(tmp_path)
+    assert len(reopened.rows) == 2000 and reopened.count == 2002
+    assert reopened.get("2000", "text 2000")[0] == 2000
+    assert reopened.get("5", "text 5") is None
+    assert reopened.get("5", "text 5 (edited)")[0] == -5
+    assert "7" not in reopened.rows
+
+
+def test_long_log_is_folded_into_the_snapshot(tmp_path):
+    cache = reopen(tmp_path)
+    cache.put_many(["a"], ["a"], vectors(1))
+    cache.save()
+    for i in range(1100):
+        cache.put_many([f"t{i}"], [f"text {i}"], vectors(i))
+        cache.save()
+    assert os.path.getsize(cache.log_file) < os.path.getsize(cache.meta_file)
+    reopened = reopen(tmp_path)
+    assert len(reopened.rows) == 1101
+    assert reopened.get("t1099", "text 1099")[0] == 1099
+
+
+def test_compaction_starts_a_new_generation(tmp_path):
+    cache = reopen(tmp_path)
+    cache.put_many(["a", "b", "c"], ["a", "b", "c"], vectors(1, 2, 3))
+    cache.save()
+    cache.discard(["a", "b"])
+    cache.save()
+    assert cache.count == 1
+    # Lines logged before the compaction no longer apply
+    reopened = reopen(tmp_path)
+    assert reopened.rows == {"c": 0}
+    assert reopened.get("c", "c")[0] == 3
+
+
+def test_model_change_drops_the_log(tmp_path):
+    cache = reopen(tmp_path)
+    cache.put_many(["a"], ["a"], vectors(1))
+    cache.save()
+    cache.put_many(["b"], ["b"], vectors(2))
+    cache.save()
+    other = reopen(tmp_path, model="other")
+    assert other.rows == {}
+    other.put_many(["c"], ["c"], vectors(3))
+    other.save()
+    assert set(reopen(tmp_path, model="other").rows) == {"c"}
+
+
+def test_legacy_hex_hashes_still_match(tmp_path):
+    cache = reopen(tmp_path)
+    cache.put_many(["a"], ["a"], vectors(1))
+    cache.save()
+    # Caches written before text_hash returned an int hold the sha1 hex digest
+    with open(cache.meta_file) as f:
+        meta = json.load(f)
+    meta["rows"] = {"a": [0, hashlib.sha1(b"a").hexdigest()]}
+    with open(cache.meta_file, "w") as f:
+        json.dump(meta, f)
+    reopened = reopen(tmp_path)
+    assert reopened.get("a", "a")[0] == 1
+    assert reopened.get("a", "b") is None
@@ -0,0 +1,166 @@
+# tests/test_embedding_worker.py
+import sys
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from embedding_worker import EmbeddingWorker
+
+DIM = 4
+
+
+class StubEncoder:
+    """Records every encode call; can hold calls until released and fail on chosen texts"""
+
+    model_name = "stub"
+    embedding_size = DIM
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.fail_on = fail_on
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        self.calls.append(list(sentences))
+        self.entered.set()
+        self.release.wait(5)
+        if self.fail_on and any(self.fail_on in text for text in sentences):
+            raise RuntimeError("encoder failed")
+        vectors = np.array([[len(text), sum(map(ord, text)), 1.0, 2.0] for text in sentences], dtype=np.float32)
+        if normalize_embeddings:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+
+def expected(text):
+    return np.array([len(text), sum(map(ord, text)), 1.0, 2.0], dtype=np.float32)
+
+
+@pytest.fixture
+def make_worker():
+    workers = []
+
+    def make(encoder, **kwargs):
+        worker = EmbeddingWorker(encoder=encoder, **kwargs)
+        workers.append(worker)
+        return worker
+
+    yield make
+    for worker in workers:
+        worker.close()
+
+
+def block(encoder, worker, text="first"):
+    """Keep the worker busy on one text so later requests queue up behind it"""
+    encoder.release.clear()
+    future = worker.submit([text])
+    assert encoder.entered.wait(5)
+    return future
+
+
+def test_results_match_the_encoder(make_worker):
+    worker = make_worker(StubEncoder())
+    assert np.array_equal(worker.encode("abc"), expected("abc"))
+    vectors = worker.encode(["abc", "de", "abc"])
+    assert vectors.shape == (3, DIM)
+    assert np.array_equal(vectors, np.stack([expected("abc"), expected("de"), expected("abc")]))
+    assert worker.encode([]).shape == (0, DIM)
+
+
+def test_concurrent_requests_coalesce_into_one_call(make_worker):
+    encoder = StubEncoder()
+    worker = make_worker(encoder, max_latency=0.05)
+    first = block(encoder, worker)
+    futures = {f"text {i}": worker.submit(f"text {i}") for i in range(10)}
+    encoder.release.set()
+    first.result(5)
+    for text, future in futures.items():
+        assert np.array_equal(future.result(5), expected(text))
+    assert encoder.calls == [["first"], list(futures)]
+    assert worker.counters['model_calls'] == 2
+
+
+def test_batches_stop_at_max_batch(make_worker):
+    encoder = StubEncoder()
+    worker = make_worker(encoder, max_batch=4)
+    first = block(encoder, worker)
+    futures = [worker.submit([f"a{i}", f"b{i}"]) for i in range(4)]
+    encoder.release.set()
+    first.result(5)
+    for future in futures:
+        future.result(5)
+    assert [len(call) for call in encoder.calls] == [1, 4, 4]
+
+
+def test_cache_hits_skip_the_encoder(make_worker):
+    encoder = StubEncoder()
+    worker = make_worker(encoder)
+    worker.encode(["a", "b"])
+    vectors = worker.encode(["b", "c", "a"])
+    assert np.array_equal(vectors, np.stack([expected("b"), expected("c"), expected("a")]))
+    assert encoder.calls == [["a", "b"], ["c"]]
+    assert worker.counters['cache_hits'] == 2
+    # Normalized vectors are cached separately
+    worker.encode(["a"], normalize_embeddings=True)
+    assert encoder.calls[-1] == ["a"]
+
+
+def test_lru_evicts_the_least_recently_used(make_worker):
+    encoder = StubEncoder()
+    worker = make_worker(encoder, cache_size=2)
+    worker.encode(["a", "b"])
+    worker.encode("a")  # b is now the oldest
+    worker.encode("c")
+    worker.encode(["a", "c", "b"])
+    assert encoder.calls == [["a", "b"], ["c"], ["b"]]
+
+
+def test_texts_in_flight_are_encoded_once(make_worker):
+    encoder = StubEncoder()
+    worker = make_worker(encoder)
+    first = block(encoder, worker, text="shared")
+    second = worker.submit(["shared", "other"])
+    encoder.release.set()
+    assert np.array_equal(first.result(5)[0], second.result(5)[0])
+    assert encoder.calls == [["shared"], ["other"]]
+    assert worker.counters['inflight_hits'] == 1
+
+
+def test_errors_reach_every_waiting_future(make_worker):
+    encoder = StubEncoder(fail_on="bad")
+    worker = make_worker(encoder, max_latency=0.05)
+    first = block(encoder, worker)
+    failing = [worker.submit("bad one"), worker.submit(["fine", "bad two"]), worker.submit("fine too")]
+    duplicate = worker.submit("bad one")  # waits on the first request's job
+    encoder.release.set()
+    first.result(5)
+    for future in failing + [duplicate]:
+        with pytest.raises(RuntimeError, match="encoder failed"):
+            future.result(5)
+    # Nothing from the failed batch was cached or left in flight
+    encoder.fail_on = None
+    assert np.array_equal(worker.encode("bad one"), expected("bad one"))
+    assert encoder.calls[-1] == ["bad one"]
+
+
+def test_threads_sets_torch_thread_count(make_worker, monkeypatch):
+    calls = []
+    monkeypatch.setitem(sys.modules, "torch", SimpleNamespace(set_num_threads=calls.append))
+    worker = make_worker(StubEncoder(), threads=3)
+    worker.encode("a")
+    assert calls == [3]
+
+
+def test_close_finishes_queued_requests(make_worker):
+    encoder = StubEncoder()
+    worker = make_worker(encoder)
+    first = block(encoder, worker)
+    queued = worker.submit("queued")
+    encoder.release.set()
+    worker.close()
+    assert first.done() and queued.done()
+    assert np.array_equal(queued.result(), expected("queued"))
@@ -0,0 +1,147 @@
+# tests/test_http_transport.py
+import socket
+
+import pytest
+import requests
+
+import http_transport
+from fakes import FakeTwitterServer
+from http_transport import RateLimitedTransport
+
+
+class FakeClock:
+    """Stands in for the time module: sleeps are recorded and advance the clock"""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(http_transport, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def server():
+    with FakeTwitterServer() as server:
+        yield server
+
+
+def transport(**kwargs):
+    return RateLimitedTransport(requests.Session(), **kwargs)
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}/2/tweets"
+
+
+def test_get_retries_5xx_with_backoff(server, clock):
+    server.script("GET /2/tweets", (503, {}), (502, {}))
+    response = transport(backoff_base=1.0).get(f"{server.url}/2/tweets", params={"ids": "1"})
+    assert response.status_code == 200
+    assert server.calls["GET /2/tweets"] == 3
+    assert len(clock.sleeps) == 2
+    assert 0 <= clock.sleeps[0] <= 1 and 0 <= clock.sleeps[1] <= 2
+
+
+def test_retries_stop_at_max_retries(server, clock):
+    server.script("GET /2/tweets", *[(503, {})] * 5)
+    response = transport(max_retries=2).get(f"{server.url}/2/tweets", params={"ids": "1"})
+    assert response.status_code == 503
+    assert server.calls["GET /2/tweets"] == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_429_waits_for_retry_after(server, clock):
+    server.script("GET /2/tweets", (429, {"retry-after": "7"}))
+    response = transport(backoff_base=0.001).get(f"{server.url}/2/tweets", params={"ids": "1"})
+    assert response.status_code == 200
+    assert clock.sleeps == [7.0]
+
+
+def test_429_waits_for_the_rate_limit_reset(server, clock):
+    reset = str(int(clock.now) + 20)
+    server.script("GET /2/tweets", (429, {"x-rate-limit-remaining": "0", "x-rate-limit-reset": reset}))
+    response = transport(backoff_base=0.001).get(f"{server.url}/2/tweets", params={"ids": "1"})
+    assert response.status_code == 200
+    assert clock.sleeps == [20.0]
+
+
+def test_429_past_max_wait_is_returned(server, clock):
+    server.script("GET /2/tweets", (429, {"retry-after": "600"}))
+    response = transport(max_wait=60).get(f"{server.url}/2/tweets", params={"ids": "1"})
+    assert response.status_code == 429
+    assert server.calls["GET /2/tweets"] == 1
+    assert clock.sleeps == []
+
+
+def test_exhausted_bucket_waits_before_the_next_request(server, clock):
+    reset = str(int(clock.now) + 30)
+    server.script("GET /2/tweets", (200, {"x-rate-limit-remaining": "0", "x-rate-limit-reset": reset}))
+    client = transport()
+    url = f"{server.url}/2/tweets"
+    assert client.get(url, params={"ids": "1"}).status_code == 200
+    assert clock.sleeps == []
+    assert client.delay_for("GET", url) == 30
+    # Other endpoints keep their own bucket
+    assert client.delay_for("GET", f"{server.url}/2/users/me") == 0
+
+    assert client.get(url, params={"ids": "1"}).status_code == 200
+    assert clock.sleeps == [30.0]
+    assert server.calls["GET /2/tweets"] == 2
+    assert client.headroom()["GET /2/tweets"]["remaining"] == 9999
+
+
+def test_buckets_spend_tokens_locally(server, clock):
+    reset = str(int(clock.now) + 30)
+    server.script("GET /2/tweets", (200, {"x-rate-limit-remaining": "2", "x-rate-limit-reset": reset}))
+    client = transport()
+    url = f"{server.url}/2/tweets"
+    client.get(url, params={"ids": "1"})
+    limit = client.limits["GET /2/tweets"]
+    limit.acquire(client.max_wait)
+    limit.acquire(client.max_wait)
+    assert limit.remaining == 0
+    assert client.delay_for("GET", url) == 30
+
+
+def test_post_is_not_retried_on_5xx(server, clock):
+    server.script("POST /2/tweets", (503, {}))
+    response = transport().post(f"{server.url}/2/tweets", json={"text": "hello"})
+    assert response.status_code == 503
+    assert server.calls["POST /2/tweets"] == 1
+    assert clock.sleeps == []
+
+
+def test_post_is_retried_on_429(server, clock):
+    server.script("POST /2/tweets", (429, {"retry-after": "3"}))
+    response = transport(backoff_base=0.001).post(f"{server.url}/2/tweets", json={"text": "hello"})
+    assert response.status_code == 201
+    assert server.calls["POST /2/tweets"] == 2
+    assert clock.sleeps == [3.0]
+
+
+def test_connection_errors(clock):
+    url = closed_port_url()
+    with pytest.raises(requests.ConnectionError):
+        transport(max_retries=2).get(url)
+    assert len(clock.sleeps) == 2
+    clock.sleeps.clear()
+    with pytest.raises(requests.ConnectionError):
+        transport(max_retries=2).post(url, json={"text": "hello"})
+    assert clock.sleeps == []
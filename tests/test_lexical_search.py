@@ -0,0 +1,86 @@
+# tests/test_lexical_search.py
+import pytest
+
+from lexical_index import LexicalIndex
+from rag import TweetStore
+from tweet_storage import SQLiteBackend
+
+TWEETS = [
+    {"tweet_id": "1", "text": "Earnings day for $AAPL, calls printing", "author_id": "a"},
+    {"tweet_id": "2", "text": "aapl pie recipe, apples and cinnamon", "author_id": "b"},
+    {"tweet_id": "3", "text": "@jack what do you think of https://example.com/post?id=7.", "author_id": "a"},
+    {"tweet_id": "4", "text": "GPUs are sold out again", "author_id": "c"},
+    {"tweet_id": "5", "text": "\"quoted\" words and (parens) OR NOT AND", "author_id": "c"},
+] + [{"tweet_id": str(100 + i), "text": f"filler tweet number {i} about nothing", "author_id": "z"} for i in range(200)]
+
+
+def ids(hits):
+    return [tid for tid, _ in hits]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TweetStore(storage_dir=str(tmp_path))
+    store.store_tweets(TWEETS)
+    yield store
+    store.close()
+
+
+def test_search_matches_the_in_memory_index(store):
+    memory = LexicalIndex()
+    for tweet in TWEETS:
+        memory.add(tweet['tweet_id'], tweet['text'])
+    for query in ("$AAPL earnings", "@jack", "https://example.com/post?id=7", "sold out gpus", "filler tweet 7"):
+        assert ids(store.lexical.search(query, 3)) == ids(memory.search(query, 3))
+    assert ids(store.lexical.search("$AAPL", 2)) == ["1", "2"]
+
+
+def test_query_syntax_is_matched_as_text(store):
+    assert ids(store.lexical.search('"quoted" (parens) OR NOT', 1)) == ["5"]
+    assert store.lexical.search("", 5) == []
+    assert store.lexical.search("nowhere to be found", 5) == []
+
+
+def test_candidates_and_accept(store):
+    assert ids(store.lexical.search("aapl", 5, candidates={"2", "4"})) == ["2"]
+    assert ids(store.lexical.search("aapl", 5, accept=lambda tid: tid != "1")) == ["2"]
+    hits = store.lexical.search("filler tweet", 3, accept=lambda tid: int(tid) % 50 == 0)
+    assert sorted(ids(hits)) == ["100", "150", "200"]
+
+
+def test_edits_and_deletes_are_saved_with_the_store(store, tmp_path):
+    store.store_tweet({"id": "4", "text": "TPUs are in stock"})
+    store.delete_tweet("1")
+    assert ids(store.lexical.search("tpus", 5)) == ["4"]
+    assert store.lexical.search("gpus", 5) == []
+    assert ids(store.lexical.search("$aapl", 5)) == ["2"]
+    assert store.retrieve_context("tpus stock", k=1, mode="lexical")[0]['tweet_id'] == "4"
+    store.close()
+
+    reopened = TweetStore(storage_dir=str(tmp_path))
+    assert ids(reopened.lexical.search("tpus", 5)) == ["4"]
+    assert ids(reopened.lexical.search("$aapl", 5)) == ["2"]
+    assert len(reopened.lexical) == len(TWEETS) - 1
+    reopened.close()
+
+
+def test_existing_stores_are_indexed_once(tmp_path, capsys):
+    backend = SQLiteBackend(str(tmp_path))
+    backend.save(TWEETS, TWEETS)
+    backend.conn.execute("DELETE FROM meta WHERE key = 'fts_version'")  # a store from before the FTS table
+    backend.conn.commit()
+    backend.close()
+    backend = SQLiteBackend(str(tmp_path))
+    assert f"Built the lexical index for {len(TWEETS)} tweets" in capsys.readouterr().out
+    assert ids(backend.lexical_index().search("@jack", 1)) == ["3"]
+    backend.close()
+    SQLiteBackend(str(tmp_path)).close()
+    assert "Built the lexical index" not in capsys.readouterr().out
+
+
+def test_json_backend_keeps_the_in_memory_index(tmp_path):
+    store = TweetStore(storage_dir=str(tmp_path), backend="json")
+    store.store_tweets(TWEETS)
+    assert isinstance(store.lexical, LexicalIndex)
+    assert ids(store.lexical.search("$AAPL", 2)) == ["1", "2"]
+    store.close()
@@ -0,0 +1,53 @@
+# tests/test_mentions_cursor.py
+import pytest
+
+from fakes import FakeTwitterServer
+from twitter_client import TwitterClientV2
+
+
+def mention(i):
+    return {"tweet_id": str(1000 + i), "text": f"@bot mention {i}", "author_id": "7"}
+
+
+@pytest.fixture
+def twitter(monkeypatch):
+    for name in ("TWITTER_API_KEY", "TWITTER_API_SECRET", "TWITTER_ACCESS_TOKEN", "TWITTER_ACCESS_SECRET"):
+        monkeypatch.setenv(name, "test")
+    with FakeTwitterServer() as server:
+        client = TwitterClientV2(identity_path=None, api_base=server.url)
+        yield server, client
+
+
+def test_capped_fetch_resumes_next_call(twitter):
+    server, client = twitter
+    server.add_mentions([mention(i) for i in range(23)])
+    since_id, resume, seen = "999", None, []
+    for _ in range(4):
+        seen += [m['tweet_id'] for m in client.check_notifications(since_id=since_id, max_total=10, resume=resume)]
+        if client.newest_mention_id:
+            since_id, resume = client.newest_mention_id, None
+        else:
+            resume = client.mentions_resume
+    assert sorted(seen) == [str(1000 + i) for i in range(23)]
+    assert since_id == "1022"
+
+    server.add_mentions([mention(30)])
+    assert [m['tweet_id'] for m in client.check_notifications(since_id=since_id, max_total=10)] == ["1030"]
+    assert client.newest_mention_id == "1030"
+
+
+def test_uncapped_fetch_sets_the_cursor(twitter):
+    server, client = twitter
+    server.add_mentions([mention(i) for i in range(5)])
+    assert len(client.check_notifications(since_id="999", max_total=10)) == 5
+    assert client.newest_mention_id == "1004"
+    assert client.mentions_resume is None
+
+
+def test_first_fetch_skips_the_mention_history(twitter):
+    server, client = twitter
+    server.add_mentions([mention(i) for i in range(60)])
+    fetched = client.check_notifications(max_total=500, bootstrap=10)
+    assert [m['tweet_id'] for m in fetched] == [str(1000 + i) for i in range(59, 49, -1)]
+    assert client.newest_mention_id == "1059"
+    assert client.mentions_resume is None
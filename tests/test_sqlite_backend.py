@@ -0,0 +1,95 @@
+# tests/test_sqlite_backend.py
+import json
+import time
+
+from rag import TweetStore
+from tweet_storage import SQLiteBackend
+
+
+def tweet(i, **fields):
+    return dict({"tweet_id": str(i), "text": f"tweet number {i}", "author_id": "7", "is_read": False}, **fields)
+
+
+def trace_writes(conn):
+    """Writes to the tweets and FTS tables from here on, one entry per row"""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    return lambda table: [sql for sql in statements if sql.startswith(("INSERT INTO " + table + " ",
+                                                                       "UPDATE " + table + " ",
+                                                                       "DELETE FROM " + table + " "))]
+
+
+def write_legacy(tmp_path, tweets):
+    with open(tmp_path / "tweets.json", "w") as f:
+        json.dump(tweets, f)
+
+
+def test_tweets_json_is_migrated_once(tmp_path):
+    write_legacy(tmp_path, [tweet(i) for i in range(3)])
+    backend = SQLiteBackend(str(tmp_path))
+    assert backend.load() == [tweet(i) for i in range(3)]
+    backend.save([], [tweet(1, is_read=True)])
+    backend.close()
+
+    # The legacy file is left alone but never imported again
+    write_legacy(tmp_path, [tweet(i) for i in range(5)])
+    backend = SQLiteBackend(str(tmp_path))
+    assert backend.load() == [tweet(0), tweet(1, is_read=True), tweet(2)]
+    backend.close()
+
+
+def test_saves_write_only_the_changed_tweets(tmp_path):
+    backend = SQLiteBackend(str(tmp_path))
+    tweets = [tweet(i) for i in range(100)]
+    backend.save(tweets, tweets)
+    writes = trace_writes(backend.conn)
+    backend.save(tweets, [])
+    assert writes("tweets") == []
+    # A read mark rewrites the tweet's row but not its indexed terms
+    tweets[5]['is_read'] = True
+    backend.save(tweets, [tweets[5]])
+    assert len(writes("tweets")) == 1 and writes("tweets_fts") == []
+
+    backend.delete(["7", "8"], tweets)
+    assert len(writes("tweets")) == 3 and len(writes("tweets_fts")) == 2
+    assert [t['tweet_id'] for t in backend.load()] == [str(i) for i in range(100) if i not in (7, 8)]
+    assert backend.load()[5]['is_read'] is True
+    backend.close()
+
+
+def test_store_saves_one_row_per_change(tmp_path):
+    store = TweetStore(storage_dir=str(tmp_path))
+    store.store_tweets([tweet(i) for i in range(50)])
+    writes = trace_writes(store.backend.conn)
+    store.mark_tweet_as_read("3")
+    store.store_tweet(tweet(50))
+    assert len(writes("tweets")) == 2 and len(writes("tweets_fts")) == 1
+    store.close()
+
+
+def test_leases_survive_reopening_the_store(tmp_path):
+    store = TweetStore(storage_dir=str(tmp_path))
+    store.store_tweets([tweet(i, created_at=f"2024-01-0{i + 1}T00:00:00Z") for i in range(3)])
+    assert store.get_next_unread_tweet(lease_seconds=600)['tweet_id'] == "0"
+    store.close()
+
+    reopened = TweetStore(storage_dir=str(tmp_path))
+    assert reopened.get_tweet("0")['leased_until'] > time.time()
+    assert reopened.get_next_unread_tweet(lease_seconds=600)['tweet_id'] == "1"
+    assert reopened.get_next_unread_tweet(lease_seconds=600)['tweet_id'] == "2"
+    assert reopened.get_next_unread_tweet(lease_seconds=600) is None
+    # A released tweet is handed out again
+    reopened.release_tweet("0")
+    assert reopened.get_next_unread_tweet(lease_seconds=600)['tweet_id'] == "0"
+    reopened.close()
+
+
+def test_expired_leases_are_handed_out_again(tmp_path):
+    store = TweetStore(storage_dir=str(tmp_path))
+    store.store_tweets([tweet(0)])
+    store.get_next_unread_tweet(lease_seconds=0.05)
+    store.close()
+    time.sleep(0.1)
+    reopened = TweetStore(storage_dir=str(tmp_path))
+    assert reopened.get_next_unread_tweet(lease_seconds=600)['tweet_id'] == "0"
+    reopened.close()
@@ -0,0 +1,63 @@
+# tests/test_tiering.py
+import sys
+
+import pytest
+
+from rag import TweetStore
+
+OLD = "2020-01-01T00:00:00Z"
+THREAD = [
+    {"tweet_id": "100", "text": "root tweet about gpus", "author_id": "a", "created_at": OLD, "is_read": True},
+    {"tweet_id": "101", "text": "first reply", "author_id": "b", "created_at": OLD, "is_read": True,
+     "in_reply_to_status_id": "100"},
+    {"tweet_id": "102", "text": "the bot's reply", "author_id": "bot", "created_at": OLD, "is_read": True,
+     "in_reply_to_status_id": "100"},
+    {"tweet_id": "103", "text": "reply to the first reply", "author_id": "c", "created_at": OLD, "is_read": True,
+     "in_reply_to_status_id": "101"},
+    {"tweet_id": "104", "text": "the bot quoting the root", "author_id": "bot", "created_at": OLD, "is_read": True,
+     "quoted_tweet_id": "100"},
+]
+
+
+@pytest.fixture
+def archived(tmp_path):
+    """A store whose whole thread has been moved to the archive"""
+    store = TweetStore(storage_dir=str(tmp_path), hot_days=30)
+    store.store_tweets(THREAD)
+    assert store.apply_tiering() == len(THREAD)
+    assert not store.tweets
+    yield store
+    store.close()
+
+
+def ids(tweets):
+    return [t['tweet_id'] for t in tweets]
+
+
+def test_threads_keep_archived_replies(archived, tmp_path):
+    assert ids(archived.get_thread("101")) == ["100", "101", "102", "103"]
+    assert ids(archived.replies_to("100")) == ["101", "102"]
+    assert ids(archived.quotes_of("100")) == ["104"]
+    # Edges come back from the shard's edges file after a restart
+    reopened = TweetStore(storage_dir=str(tmp_path), hot_days=30)
+    assert ids(reopened.get_thread("100")) == ["100", "101", "102", "103"]
+    reopened.close()
+
+
+def test_restoring_an_archived_tweet_keeps_it_read(archived):
+    archived.store_tweet({"id": "101", "text": "first reply", "author_id": "b", "is_read": False})
+    assert archived.get_next_unread_tweet() is None
+    assert not archived.tweets
+
+    # An edit brings it back hot, still read
+    archived.store_tweet({"id": "101", "text": "first reply (edited)", "is_read": False})
+    assert archived.get_next_unread_tweet() is None
+    assert archived.get_tweet("101")['text'] == "first reply (edited)"
+    assert archived.get_tweet("101")['is_read'] is True
+
+
+def test_import_rag_leaves_numpy_unloaded():
+    import subprocess
+    code = "import sys, rag; print('numpy' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,289 @@
+# tweet_archive.py
+# numpy is imported by the methods that touch vectors: rag imports this
+# module at load time and shouldn't pull in numpy with it
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from unread_queue import tweet_timestamp
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def _numeric_id(tweet_id: str) -> Optional[int]:
+    return int(tweet_id) if tweet_id and tweet_id.isdigit() else None
+
+
+class TweetArchive:
+    """Cold tier: old read tweets in gzipped, append-only JSONL shards.
+
+    Each shard may have a .npy file with its embeddings next to it. A small
+    manifest records each shard's tweet-id range and time span, so lookups
+    only open shards that can hold the id, and they do it lazily. At most
+    max_loaded shards stay in memory, least recently used first out, so the
+    resident set doesn't depend on the archive's size. Each shard's reply
+    and quote edges are also saved in a small .edges.json file; they are
+    loaded into one parent -> children map on first use, so threads keep
+    their archived replies. compact() applies retention and merges small
+    shards.
+    """
+
+    def __init__(self, storage_dir: str, shard_size: int = 50000, max_loaded: int = 4):
+        self.dir = os.path.join(storage_dir, "archive")
+        self.manifest_file = os.path.join(self.dir, "manifest.json")
+        self.shard_size = shard_size
+        self.max_loaded = max_loaded
+        self.shards: List[Dict] = []
+        self._next_shard = 1
+        self._loaded: "OrderedDict[str, Dict[str, Dict]]" = OrderedDict()  # shard name -> id -> tweet
+        self._edges: Optional[Dict[str, Dict[str, List[str]]]] = None  # 'replies'/'quotes' -> parent -> children
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, "r") as f:
+                manifest = json.load(f)
+            self.shards = manifest["shards"]
+            self._next_shard = manifest["next_shard"]
+
+    def __len__(self) -> int:
+        return sum(shard['count'] for shard in self.shards)
+
+    def _path(self, name: str, ext: str) -> str:
+        return os.path.join(self.dir, name + ext)
+
+    def _save_manifest(self):
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"shards": self.shards, "next_shard": self._next_shard}, f)
+        os.replace(tmp_file, self.manifest_file)
+
+    def _write_shard(self, tweets: List[Dict], vectors: Optional[np.ndarray], model_name: Optional[str]) -> Dict:
+        import numpy as np
+        name = f"shard-{self._next_shard:06d}"
+        self._next_shard += 1
+        tmp_file = self._path(name, ".jsonl.gz.tmp")
+        with gzip.open(tmp_file, "wt", encoding="utf-8") as f:
+            for tweet in tweets:
+                f.write(json.dumps(tweet, default=dict) + "\n")
+        os.replace(tmp_file, self._path(name, ".jsonl.gz"))
+        self._save_edges(name, tweets)
+        if vectors is not None:
+            with open(self._path(name, ".npy.tmp"), "wb") as f:
+                np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+            os.replace(self._path(name, ".npy.tmp"), self._path(name, ".npy"))
+        ids = [_numeric_id(t.get('tweet_id') or t.get('id')) for t in tweets]
+        numeric = [i for i in ids if i is not None]
+        times = [tweet_timestamp(t) for t in tweets]
+        return {
+            "name": name,
+            "count": len(tweets),
+            "min_id": min(numeric) if numeric else None,
+            "max_id": max(numeric) if numeric else None,
+            "all_numeric": len(numeric) == len(ids),
+            "oldest": min(times),
+            "newest": max(times),
+            "model": model_name if vectors is not None else None,
+        }
+
+    @staticmethod
+    def _shard_edges(tweets: List[Dict]) -> Dict[str, Dict[str, List[str]]]:
+        edges: Dict[str, Dict[str, List[str]]] = {'replies': {}, 'quotes': {}}
+        for tweet in tweets:
+            tweet_id = tweet.get('tweet_id') or tweet.get('id')
+            for key, kind in (('in_reply_to_status_id', 'replies'), ('quoted_tweet_id', 'quotes')):
+                if tweet.get(key):
+                    edges[kind].setdefault(tweet[key], []).append(tweet_id)
+        return edges
+
+    def _merge_edges(self, edges: Dict[str, Dict[str, List[str]]]):
+        for kind, parents in edges.items():
+            known = self._edges[kind]
+            for parent, children in parents.items():
+                merged = known.setdefault(parent, [])
+                merged.extend(child for child in children if child not in merged)
+
+    def _save_edges(self, name: str, tweets: List[Dict]) -> Dict[str, Dict[str, List[str]]]:
+        edges = self._shard_edges(tweets)
+        tmp_file = self._path(name, ".edges.json.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(edges, f)
+        os.replace(tmp_file, self._path(name, ".edges.json"))
+        if self._edges is not None:
+            self._merge_edges(edges)
+        return edges
+
+    def _load_edges(self) -> Dict[str, Dict[str, List[str]]]:
+        if self._edges is None:
+            self._edges = {'replies': {}, 'quotes': {}}
+            for shard in self.shards:
+                path = self._path(shard['name'], ".edges.json")
+                if os.path.exists(path):
+                    with open(path, "r") as f:
+                        self._merge_edges(json.load(f))
+                else:
+                    # Shards archived before edges were saved: read them once
+                    self._save_edges(shard['name'], self._read(shard))
+        return self._edges
+
+    def reply_ids(self, tweet_id: str) -> List[str]:
+        """Ids of archived replies to a tweet"""
+        if not self.shards:
+            return []
+        return self._load_edges()['replies'].get(tweet_id, [])
+
+    def quote_ids(self, tweet_id: str) -> List[str]:
+        """Ids of archived tweets quoting a tweet"""
+        if not self.shards:
+            return []
+        return self._load_edges()['quotes'].get(tweet_id, [])
+
+    def append(self, tweets: List[Dict], vectors: Optional[np.ndarray] = None, model_name: Optional[str] = None):
+        """Write tweets (sorted by id) to new shards; vectors are row-aligned with tweets"""
+        if not tweets:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        order = sorted(range(len(tweets)), key=lambda i: _numeric_id(tweets[i].get('tweet_id') or tweets[i].get('id')) or 0)
+        for start in range(0, len(order), self.shard_size):
+            rows = order[start:start + self.shard_size]
+            chunk_vectors = vectors[rows] if vectors is not None else None
+            self.shards.append(self._write_shard([tweets[i] for i in rows], chunk_vectors, model_name))
+        self._save_manifest()
+        print(f"[TweetArchive] Archived {len(tweets)} tweets ({len(self)} in {len(self.shards)} shards)")
+
+    def _read(self, shard: Dict) -> List[Dict]:
+        with gzip.open(self._path(shard['name'], ".jsonl.gz"), "rt", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _load(self, shard: Dict) -> Dict[str, Dict]:
+        name = shard['name']
+        if name in self._loaded:
+            self._loaded.move_to_end(name)
+            return self._loaded[name]
+        tweets = {t.get('tweet_id') or t.get('id'): t for t in self._read(shard)}
+        self._loaded[name] = tweets
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return tweets
+
+    def _may_contain(self, shard: Dict, tweet_id: str) -> bool:
+        numeric = _numeric_id(tweet_id)
+        if numeric is None or shard['min_id'] is None:
+            return not shard['all_numeric']
+        return shard['min_id'] <= numeric <= shard['max_id']
+
+    def get(self, tweet_id: str) -> Optional[Dict]:
+        """An archived tweet, loading the shards whose id range covers it"""
+        for shard in reversed(self.shards):
+            if self._may_contain(shard, tweet_id):
+                tweet = self._load(shard).get(tweet_id)
+                if tweet is not None:
+                    return tweet
+        return None
+
+    def vectors(self, shard: Dict, encode: Callable[[List[str]], np.ndarray],
+                model_name: str) -> Tuple[List[str], np.ndarray]:
+        """A shard's tweet ids and embeddings, encoding (and saving) them once if
+        none were saved for this model"""
+        import numpy as np
+        tweets = list(self._load(shard).values())
+        ids = [t.get('tweet_id') or t.get('id') for t in tweets]
+        vectors_file = self._path(shard['name'], ".npy")
+        if shard.get('model') == model_name and os.path.exists(vectors_file):
+            # Saved rows follow the shard file's order, which _load preserves
+            return ids, np.load(vectors_file, mmap_mode="r")
+        vectors = np.ascontiguousarray(encode([t['text'] for t in tweets]), dtype=np.float32)
+        with open(vectors_file + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        os.replace(vectors_file + ".tmp", vectors_file)
+        shard['model'] = model_name
+        self._save_manifest()
+        return ids, vectors
+
+    def search(self, query: np.ndarray, k: int, encode: Callable[[List[str]], np.ndarray], model_name: str,
+               since: Optional[float] = None, normalize: bool = False,
+               accept: Optional[Callable[[Dict], bool]] = None) -> List[Tuple[Dict, float]]:
+        """Brute-force L2 search over shards newer than `since` (all of them if None).
+
+        With normalize the query and vectors are scaled to unit length first,
+        so distances match a cosine VectorIndex's (2 - 2*cosine). accept()
+        filters tweets before ranking.
+        """
+        import numpy as np
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if normalize:
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+        hits: List[Tuple[Dict, float]] = []
+        for shard in reversed(self.shards):
+            if since is not None and shard['newest'] < since:
+                continue
+            ids, vectors = self.vectors(shard, encode, model_name)
+            if not ids:
+                continue
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if normalize:
+                vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            distances = ((vectors - query) ** 2).sum(axis=1)
+            tweets = self._load(shard)
+            if accept is not None:
+                distances[[not accept(tweets[tid]) for tid in ids]] = np.inf
+            top = [i for i in np.argsort(distances)[:k] if np.isfinite(distances[i])]
+            hits.extend((tweets[ids[i]], float(distances[i])) for i in top)
+        hits.sort(key=lambda hit: hit[1])
+        return hits[:k]
+
+    def compact(self, retention_seconds: Optional[float] = None, now: Optional[float] = None) -> int:
+        """Drop tweets older than retention_seconds and merge undersized shards.
+
+        Only shards that hold expired tweets or are under half full get
+        rewritten; returns the number of tweets dropped.
+        """
+        import numpy as np
+        cutoff = (now or time.time()) - retention_seconds if retention_seconds else None
+        small = [s for s in self.shards if s['count'] < self.shard_size // 2]
+        rewrite = [s for s in self.shards
+                   if (cutoff is not None and s['oldest'] < cutoff) or (len(small) > 1 and s in small)]
+        if not rewrite:
+            return 0
+
+        survivors, vectors, dropped = [], [], 0
+        positions: Dict[str, int] = {}  # id -> row in survivors
+        model_names = {s.get('model') for s in rewrite}
+        keep_vectors = len(model_names) == 1 and None not in model_names
+        for shard in rewrite:
+            if cutoff is not None and shard['newest'] < cutoff:
+                dropped += shard['count']  # wholly expired, no need to read it
+                continue
+            tweets = self._read(shard)
+            shard_vectors = np.load(self._path(shard['name'], ".npy")) if keep_vectors else None
+            for row, tweet in enumerate(tweets):
+                if cutoff is not None and tweet_timestamp(tweet) < cutoff:
+                    dropped += 1
+                    continue
+                tweet_id = tweet.get('tweet_id') or tweet.get('id')
+                if tweet_id in positions:
+                    # Archived again after an update; the later shard's copy wins
+                    survivors[positions[tweet_id]] = tweet
+                    if keep_vectors:
+                        vectors[positions[tweet_id]] = shard_vectors[row]
+                    continue
+                positions[tweet_id] = len(survivors)
+                survivors.append(tweet)
+                if keep_vectors:
+                    vectors.append(shard_vectors[row])
+
+        self.shards = [s for s in self.shards if s not in rewrite]
+        self._loaded.clear()
+        self._edges = None  # dropped tweets take their edges with them; reloaded on next use
+        self.append(survivors, np.array(vectors) if keep_vectors and vectors else None,
+                    model_names.pop() if keep_vectors else None)
+        self._save_manifest()
+        for shard in rewrite:
+            for ext in (".jsonl.gz", ".npy", ".edges.json"):
+                if os.path.exists(self._path(shard['name'], ext)):
+                    os.remove(self._path(shard['name'], ext))
+        print(f"[TweetArchive] Compacted {len(rewrite)} shards, dropped {dropped} tweets")
+        return dropped
@@ -0,0 +1,101 @@
+# tweet_record.py
+import sys
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, Optional
+
+FIELDS = ('tweet_id', 'text', 'author_id', 'created_at', 'in_reply_to_status_id',
+          'quoted_tweet_id', 'conversation_id', 'is_read', 'leased_until')
+_SLOTS = frozenset(FIELDS)
+_INTERNED = frozenset(('tweet_id', 'author_id', 'conversation_id'))
+
+
+class TweetRecord(MutableMapping):
+    """Dict-compatible tweet with fixed slots instead of a per-tweet hash table.
+
+    The known fields live in __slots__ (an unset slot is a missing key), the
+    'id' key is an alias of tweet_id rather than a second copy, and author
+    ids are interned so the thousands of tweets by one author share a
+    string. Unknown keys go to a small overflow dict created on first use.
+    Code that reads tweets with t['text'] or t.get(...) works unchanged;
+    json.dumps needs default=dict.
+    """
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, data: Optional[Dict] = None, **kwargs):
+        self.extra = None
+        if data:
+            self.update(data)
+        if kwargs:
+            self.update(kwargs)
+
+    def __getitem__(self, key):
+        if key == 'id':
+            key = 'tweet_id'
+        if key in _SLOTS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is None:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def get(self, key, default=None):
+        # Hot path (unread queue, graph walks); skips Mapping.get's try/except
+        if key in _SLOTS:
+            return getattr(self, key, default)
+        if key == 'id':
+            return getattr(self, 'tweet_id', default)
+        return self.extra.get(key, default) if self.extra else default
+
+    def __setitem__(self, key, value):
+        if key == 'id':
+            key = 'tweet_id'
+        if key in _SLOTS:
+            if key in _INTERNED and type(value) is str:
+                value = sys.intern(value)
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key == 'id':
+            key = 'tweet_id'
+        if key in _SLOTS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra and key in self.extra:
+            del self.extra[key]
+            if not self.extra:
+                self.extra = None
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _ABSENT) is not _ABSENT
+
+    def __iter__(self) -> Iterator[str]:
+        for name in FIELDS:
+            if hasattr(self, name):
+                yield name
+                if name == 'tweet_id':
+                    yield 'id'
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        count = sum(1 for name in FIELDS if hasattr(self, name))
+        if hasattr(self, 'tweet_id'):
+            count += 1
+        return count + (len(self.extra) if self.extra else 0)
+
+    def __repr__(self) -> str:
+        return f"TweetRecord({dict(self)!r})"
+
+
+_ABSENT = object()
@@ -0,0 +1,263 @@
+# tweet_storage.py
+import json
+import os
+import sqlite3
+from typing import Callable, Collection, Dict, List, Optional, Tuple
+
+from lexical_index import tokenize
+
+# The FTS table holds each tweet's terms from lexical_index.tokenize(), space
+# separated; this tokenizer splits on whitespace only so the terms (handles,
+# tickers, URLs) survive as they are
+FTS_TOKENIZER = "unicode61 remove_diacritics 0 categories 'L* N* Co M* P* S*'"
+FTS_VERSION = "1"  # bump when tokenize() changes, to reindex existing stores
+
+
+class JsonFileBackend:
+    """Legacy storage: the whole tweet list in one JSON file, rewritten on every save"""
+
+    def __init__(self, storage_dir: str):
+        self.tweets_file = os.path.join(storage_dir, "tweets.json")
+        self.state_file = os.path.join(storage_dir, "state.json")
+
+    def load(self) -> List[Dict]:
+        if os.path.exists(self.tweets_file):
+            with open(self.tweets_file, "r") as f:
+                return json.load(f)
+        return []
+
+    def save(self, tweets: List[Dict], changed: List[Dict]):
+        """Rewrite the file atomically so a crash can't leave it half-written"""
+        tmp_file = self.tweets_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(tweets, f, indent=2, default=dict)
+        os.replace(tmp_file, self.tweets_file)
+
+    def delete(self, tweet_ids: List[str], tweets: List[Dict]):
+        self.save(tweets, [])
+
+    def lexical_index(self):
+        """No persisted BM25 index; the store builds one in memory"""
+        return None
+
+    def get_state(self, key: str) -> Optional[str]:
+        if not os.path.exists(self.state_file):
+            return None
+        with open(self.state_file, "r") as f:
+            return json.load(f).get(key)
+
+    def set_state(self, key: str, value: str):
+        state = {}
+        if os.path.exists(self.state_file):
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+        state[key] = value
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Embedded SQLite store that only writes the tweets that changed.
+
+    Runs in WAL mode so each save is a small crash-safe transaction. On first
+    use it imports an existing tweets.json in one shot. An FTS5 table of the
+    tweets' BM25 terms is kept in step by save/delete, so lexical search
+    needs no index build at startup.
+    """
+
+    def __init__(self, storage_dir: str):
+        self.db_file = os.path.join(storage_dir, "tweets.db")
+        self.legacy_file = os.path.join(storage_dir, "tweets.json")
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS tweets ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "tweet_id TEXT NOT NULL UNIQUE, "
+            "data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self._fts = False  # saves index terms once the FTS table is set up
+        self._migrate_json()
+        self._init_fts()
+
+    def _migrate_json(self):
+        """One-shot import of storage/tweets.json"""
+        done = self.conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+        if done or not os.path.exists(self.legacy_file):
+            return
+        with open(self.legacy_file, "r") as f:
+            tweets = json.load(f)
+        with self.conn:
+            self._upsert(tweets)
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)", (str(len(tweets)),))
+        print(f"[SQLiteBackend] Migrated {len(tweets)} tweets from {self.legacy_file}")
+
+    def _init_fts(self):
+        """Create the FTS5 table, indexing the stored tweets when it is new
+        or was built by an older tokenize()"""
+        self._fts = True
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'fts_version'").fetchone()
+        if version and version[0] == FTS_VERSION:
+            return
+        with self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS tweets_fts")
+            self.conn.execute(f"CREATE VIRTUAL TABLE tweets_fts USING fts5(terms, tokenize=\"{FTS_TOKENIZER}\")")
+            self.conn.execute("DROP TABLE IF EXISTS tweets_fts_vocab")
+            self.conn.execute("CREATE VIRTUAL TABLE tweets_fts_vocab USING fts5vocab(tweets_fts, 'row')")
+            rows = self.conn.execute("SELECT seq, data FROM tweets")
+            self.conn.executemany("INSERT INTO tweets_fts (rowid, terms) VALUES (?, ?)",
+                                  ((seq, fts_terms(json.loads(data).get('text', ''))) for seq, data in rows))
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fts_version', ?)", (FTS_VERSION,))
+        count = self.conn.execute("SELECT count(*) FROM tweets").fetchone()[0]
+        if count:
+            print(f"[SQLiteBackend] Built the lexical index for {count} tweets")
+
+    def _upsert(self, tweets: List[Dict]):
+        self.conn.executemany(
+            "INSERT INTO tweets (tweet_id, data) VALUES (?, ?) "
+            "ON CONFLICT(tweet_id) DO UPDATE SET data = excluded.data",
+            [(t.get('tweet_id') or t.get('id'), json.dumps(t, default=dict)) for t in tweets]
+        )
+        if not self._fts:
+            return
+        # Reindex only the tweets whose text changed (not read marks or leases)
+        rows = self.conn.execute(
+            "SELECT tweets.tweet_id, tweets.seq, tweets_fts.terms FROM tweets "
+            "LEFT JOIN tweets_fts ON tweets_fts.rowid = tweets.seq "
+            "WHERE tweets.tweet_id IN (SELECT value FROM json_each(?))",
+            (json.dumps([t.get('tweet_id') or t.get('id') for t in tweets]),))
+        indexed = {tweet_id: (seq, terms) for tweet_id, seq, terms in rows}
+        added, edited = [], []
+        for tweet in tweets:
+            seq, old_terms = indexed[tweet.get('tweet_id') or tweet.get('id')]
+            terms = fts_terms(tweet.get('text', ''))
+            if old_terms is None:
+                added.append((seq, terms))
+            elif old_terms != terms:
+                edited.append((terms, seq))
+        self.conn.executemany("INSERT INTO tweets_fts (rowid, terms) VALUES (?, ?)", added)
+        self.conn.executemany("UPDATE tweets_fts SET terms = ? WHERE rowid = ?", edited)
+
+    def load(self) -> List[Dict]:
+        return [json.loads(row[0]) for row in self.conn.execute("SELECT data FROM tweets ORDER BY seq")]
+
+    def save(self, tweets: List[Dict], changed: List[Dict]):
+        """Upsert just the changed tweets in a single transaction"""
+        if not changed:
+            return
+        with self.conn:
+            self._upsert(changed)
+
+    def delete(self, tweet_ids: List[str], tweets: List[Dict]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM tweets_fts WHERE rowid = (SELECT seq FROM tweets WHERE tweet_id = ?)",
+                                  [(tid,) for tid in tweet_ids])
+            self.conn.executemany("DELETE FROM tweets WHERE tweet_id = ?", [(tid,) for tid in tweet_ids])
+
+    def lexical_index(self) -> "FtsLexicalIndex":
+        """BM25 search over the persisted FTS5 table"""
+        return FtsLexicalIndex(self.conn)
+
+    def get_state(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", ("state:" + key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", ("state:" + key, value))
+
+    def close(self):
+        self.conn.close()
+
+
+def fts_terms(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+def fts_phrase(term: str) -> str:
+    """A term as an FTS5 string, so its punctuation isn't read as query syntax"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+class FtsLexicalIndex:
+    """LexicalIndex's search() over SQLiteBackend's FTS5 table, scored by bm25().
+
+    Like LexicalIndex, long queries keep their max_query_terms rarest terms
+    and terms in more than common_cutoff of all tweets are dropped when a
+    rarer one is present (FTS5 can't score them only for tweets the rare
+    terms matched). add() and remove() are no-ops: the backend updates the
+    table as tweets are saved and deleted.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, common_cutoff: float = 0.01, max_query_terms: int = 8):
+        self.conn = conn
+        self.common_cutoff = common_cutoff
+        self.max_query_terms = max_query_terms
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT count(*) FROM tweets").fetchone()[0]
+
+    def add(self, tweet_id: str, text: str):
+        pass
+
+    def remove(self, tweet_id: str, text: str):
+        pass
+
+    def _query_terms(self, query: str) -> List[str]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        counts = dict(self.conn.execute(
+            "SELECT term, doc FROM tweets_fts_vocab WHERE term IN (SELECT value FROM json_each(?))",
+            (json.dumps(terms),)))
+        terms = sorted((term for term in terms if term in counts), key=counts.get)[:self.max_query_terms]
+        cutoff = self.common_cutoff * len(self)
+        if terms and counts[terms[0]] <= cutoff:
+            terms = [term for term in terms if counts[term] <= cutoff]
+        return terms
+
+    def search(self, query: str, k: int, candidates: Optional[Collection[str]] = None,
+               accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """Top k (tweet_id, BM25 score), best first, limited to candidates and
+        to ids accept() returns True for"""
+        terms = self._query_terms(query)
+        if not terms:
+            return []
+        # Rank inside the FTS table and look up the ids of just the top rows
+        match = "tweets_fts MATCH ?"
+        params: list = [" OR ".join(fts_phrase(term) for term in terms)]
+        if candidates is not None:
+            match += " AND rowid IN (SELECT seq FROM tweets WHERE tweet_id IN (SELECT value FROM json_each(?)))"
+            params.append(json.dumps(list(candidates)))
+        sql = ("SELECT tweets.tweet_id, -top.score FROM (SELECT rowid AS seq, bm25(tweets_fts) AS score "
+               f"FROM tweets_fts WHERE {match} ORDER BY score LIMIT ?) AS top "
+               "JOIN tweets ON tweets.seq = top.seq ORDER BY top.score")
+        # Check accept() on the best-scored ids first, widening until k pass
+        fetch = k
+        while True:
+            top = self.conn.execute(sql, params + [fetch]).fetchall()
+            hits = top if accept is None else [hit for hit in top if accept(hit[0])]
+            if len(hits) >= k or len(top) < fetch:
+                return hits[:k]
+            fetch *= 4
+
+
+BACKENDS = {
+    "json": JsonFileBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def open_backend(name: str, storage_dir: str):
+    """Create a storage backend by name"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](storage_dir)
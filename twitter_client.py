@@ -1,19 +1,45 @@
 # twitter_client.py
 import os
 import json
+import hashlib
 import requests
 from requests_oauthlib import OAuth1Session
 from datetime import datetime, timezone
 from typing import List, Dict, Optional
 
+from http_transport import RateLimitedTransport
+
+# Ask for thread links so stored tweets can be stitched into threads
+TWEET_FIELDS = "created_at,author_id,conversation_id,referenced_tweets"
+TWEET_EXPANSIONS = "referenced_tweets.id,author_id"
+
+def parse_tweet(tweet: Dict) -> Dict:
+    """Convert a v2 tweet object into the dict TweetStore stores"""
+    refs = {ref['type']: ref['id'] for ref in tweet.get('referenced_tweets', [])}
+    return {
+        'id': tweet['id'],
+        'tweet_id': tweet['id'],
+        'author_id': tweet.get('author_id'),
+        'text': tweet['text'],
+        'created_at': tweet.get('created_at'),
+        'conversation_id': tweet.get('conversation_id'),
+        'in_reply_to_status_id': refs.get('replied_to'),
+        'quoted_tweet_id': refs.get('quoted')
+    }
+
 class TwitterClientV2:
-    def __init__(self):
+    def __init__(self, identity_path: Optional[str] = os.path.join("storage", "identity.json"),
+                 api_base: Optional[str] = None, credentials: Optional[Dict[str, str]] = None):
+        # TWITTER_API_BASE lets benchmarks point the client at a local stand-in
+        self.api_base = (api_base or os.getenv("TWITTER_API_BASE") or "https://api.twitter.com").rstrip("/")
         
-        # Load credentials
-        self.api_key = os.getenv("TWITTER_API_KEY")
-        self.api_secret = os.getenv("TWITTER_API_SECRET")
-        self.access_token = os.getenv("TWITTER_ACCESS_TOKEN")
-        self.access_secret = os.getenv("TWITTER_ACCESS_SECRET")
+        # Load credentials: passed in (one set per account in multi-account
+        # mode) or from the environment
+        credentials = credentials or {}
+        self.api_key = credentials.get("api_key") or os.getenv("TWITTER_API_KEY")
+        self.api_secret = credentials.get("api_secret") or os.getenv("TWITTER_API_SECRET")
+        self.access_token = credentials.get("access_token") or os.getenv("TWITTER_ACCESS_TOKEN")
+        self.access_secret = credentials.get("access_secret") or os.getenv("TWITTER_ACCESS_SECRET")
         
         if not all([self.api_key, self.api_secret, self.access_token, self.access_secret]):
             raise ValueError("Missing Twitter API credentials in .env file")
@@ -25,75 +51,165 @@ class TwitterClientV2:
             resource_owner_key=self.access_token,
             resource_owner_secret=self.access_secret
         )
+        # Pooled, rate-limit-aware transport shared by every call below
+        self.http = RateLimitedTransport(self.oauth)
         
-        # Get and store user ID on initialization
-        self.user_id = self._get_my_user_id()
+        # Cursor for incremental mention fetching, set by check_notifications,
+        # and where to resume a fetch that stopped at its cap
+        self.newest_mention_id = None
+        self.mentions_resume: Optional[Dict] = None
+        # Parent/quoted tweets that came back as expansions of the last fetch
+        self.referenced_tweets: List[Dict] = []
+
+        # Who we are: cached on disk so restarts don't spend a /2/users/me call
+        self.identity_path = identity_path
+        identity = self._load_identity()
+        self.user_id = identity.get('id')
         if not self.user_id:
             raise ValueError("Could not get user ID. Please check your credentials.")
-        
-        # Get user handle
-        user_info = self._get_my_info()
-        self.handle = user_info.get('username', 'unknown')
+        self.handle = identity.get('username', 'unknown')
         print(f"[TwitterClientV2] Initialized. user_id={self.user_id}, handle={self.handle}")
-            
-    def _get_my_user_id(self) -> Optional[str]:
-        """Get the authenticated user's ID"""
-        url = "https://api.twitter.com/2/users/me"
-        response = self.oauth.get(url)
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data['data']['id']
-        return None
-    
+
+    def _load_identity(self) -> Dict:
+        """The authenticated user's info, from the identity cache or one API call.
+
+        The cache is keyed by the access token, so switching accounts refetches.
+        """
+        token_hash = hashlib.sha256(self.access_token.encode("utf-8")).hexdigest()
+        if self.identity_path and os.path.exists(self.identity_path):
+            try:
+                with open(self.identity_path, "r") as f:
+                    cached = json.load(f)
+                if cached.get('token_hash') == token_hash:
+                    return cached['user']
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[TwitterClientV2] Ignoring unreadable identity cache: {e}")
+
+        user = self._get_my_info()
+        if user.get('id') and self.identity_path:
+            os.makedirs(os.path.dirname(self.identity_path) or ".", exist_ok=True)
+            tmp_file = self.identity_path + ".tmp"
+            with open(tmp_file, "w") as f:
+                json.dump({'token_hash': token_hash, 'user': user}, f)
+            os.replace(tmp_file, self.identity_path)
+        return user
+
     def _get_my_info(self) -> Dict:
-        """Get the authenticated user's info"""
-        url = "https://api.twitter.com/2/users/me"
+        """Get the authenticated user's info (id, username, name, description)"""
+        url = f"{self.api_base}/2/users/me"
         params = {
             "user.fields": "username,name,description"
         }
-        response = self.oauth.get(url, params=params)
+        response = self.http.get(url, params=params)
         
         if response.status_code == 200:
             return response.json()['data']
         return {}
 
-    def check_notifications(self, max_results: int = 5) -> List[Dict]:
-        """Get mentions using v2 mentions endpoint"""
+    def mentions_poll_interval(self) -> float:
+        """Seconds between mention polls that keep within the endpoint's rate limit"""
+        return self.http.spacing_for("GET", f"{self.api_base}/2/users/{self.user_id}/mentions")
+
+    def check_notifications(self, max_results: int = 100, since_id: Optional[str] = None,
+                            max_total: int = 500, resume: Optional[Dict] = None,
+                            bootstrap: int = 20) -> List[Dict]:
+        """Get mentions newer than since_id using the v2 mentions endpoint.
+
+        Follows pagination_token until everything since the cursor is fetched
+        or about max_total mentions were collected. newest_mention_id is set
+        to the cursor for the next call once the fetch completes; if it
+        stopped early (the cap or an error), it is None and mentions_resume
+        holds where to pick up: pass it back as resume, with the same
+        since_id, so older mentions past the cap aren't lost.
+
+        With no since_id (a fresh store) only the newest bootstrap mentions
+        are fetched and the cursor starts there, rather than walking back
+        through the account's whole mention history.
+        """
+        self.newest_mention_id = None
+        self.mentions_resume = None
+        self.referenced_tweets = []
         if not self.user_id:
             print("[TwitterClientV2] No user ID available")
             return []
 
-        url = f"https://api.twitter.com/2/users/{self.user_id}/mentions"
+        url = f"{self.api_base}/2/users/{self.user_id}/mentions"
         params = {
-            "tweet.fields": "created_at,author_id",
+            "tweet.fields": TWEET_FIELDS,
+            "expansions": TWEET_EXPANSIONS,
             "user.fields": "username",
-            "max_results": max_results
+            "max_results": max(5, min(max_results, 100))
         }
-        
-        response = self.oauth.get(url, params=params)
-        print(f"[TwitterClientV2] Mentions check status: {response.status_code}")
-        
-        if response.status_code == 200:
+        if since_id:
+            params["since_id"] = since_id
+        elif not resume:
+            max_results = max_total = min(max_total, bootstrap)
+        newest_id = None
+        if resume:
+            # The newest id of the interrupted fetch becomes the cursor once it finishes
+            params["pagination_token"] = resume['pagination_token']
+            newest_id = resume.get('newest_id')
+
+        mentions = []
+        while True:
+            # Whole pages only, so the resume token points just past the last mention kept
+            params["max_results"] = max(5, min(max_results, 100, max_total - len(mentions)))
+            response = self.http.get(url, params=params)
+            print(f"[TwitterClientV2] Mentions check status: {response.status_code}")
+            if response.status_code != 200:
+                if resume and not mentions and response.status_code == 400:
+                    # Expired token: skip the rest of the old fetch rather than retry it forever
+                    print("[TwitterClientV2] Could not resume the last mentions fetch, skipping its older mentions")
+                    self.newest_mention_id = newest_id
+                elif "pagination_token" in params:
+                    self.mentions_resume = {'pagination_token': params["pagination_token"], 'newest_id': newest_id}
+                return mentions
+
+            data = response.json()
+            meta = data.get('meta', {})
+            newest_id = newest_id or meta.get('newest_id')
+            mentions.extend(parse_tweet(tweet) for tweet in data.get('data', []))
+            self.referenced_tweets.extend(parse_tweet(tweet) for tweet in data.get('includes', {}).get('tweets', []))
+            if not meta.get('next_token') or not (since_id or resume):
+                break
+            params["pagination_token"] = meta['next_token']
+            if len(mentions) >= max_total:
+                print(f"[TwitterClientV2] Stopped at {len(mentions)} mentions, the rest come next cycle")
+                self.mentions_resume = {'pagination_token': meta['next_token'], 'newest_id': newest_id}
+                return mentions
+
+        self.newest_mention_id = newest_id
+        return mentions
+
+    def get_tweets(self, tweet_ids: List[str]) -> List[Dict]:
+        """Look up tweets in bulk, 100 ids per request.
+
+        Returns the requested tweets plus any tweets they reference that came
+        back as expansions, so one call also covers the next level up a thread.
+        """
+        url = f"{self.api_base}/2/tweets"
+        tweets = []
+        for start in range(0, len(tweet_ids), 100):
+            params = {
+                "ids": ",".join(tweet_ids[start:start + 100]),
+                "tweet.fields": TWEET_FIELDS,
+                "expansions": TWEET_EXPANSIONS
+            }
+            response = self.http.get(url, params=params)
+            print(f"[TwitterClientV2] Tweet lookup status: {response.status_code}")
+            if response.status_code != 200:
+                continue
             data = response.json()
-            return [
-                {
-                    'id': tweet['id'],
-                    'tweet_id': tweet['id'],
-                    'author_id': tweet['author_id'],
-                    'text': tweet['text'],
-                    'created_at': tweet.get('created_at')
-                }
-                for tweet in data.get('data', [])
-            ]
-        return []
+            tweets.extend(parse_tweet(tweet) for tweet in data.get('data', []))
+            tweets.extend(parse_tweet(tweet) for tweet in data.get('includes', {}).get('tweets', []))
+        return tweets
 
     def post_tweet(self, text: str) -> Optional[Dict]:
         """Post a new tweet"""
-        url = "https://api.twitter.com/2/tweets"
+        url = f"{self.api_base}/2/tweets"
         payload = {"text": text}
         
-        response = self.oauth.post(url, json=payload)
+        response = self.http.post(url, json=payload)
         print(f"[TwitterClientV2] Post tweet status: {response.status_code}")
         
         if response.status_code == 201:
@@ -108,7 +224,7 @@ class TwitterClientV2:
 
     def reply_tweet(self, parent_id: str, text: str) -> Optional[Dict]:
         """Reply to a tweet"""
-        url = "https://api.twitter.com/2/tweets"
+        url = f"{self.api_base}/2/tweets"
         payload = {
             "text": text,
             "reply": {
@@ -116,7 +232,7 @@ class TwitterClientV2:
             }
         }
         
-        response = self.oauth.post(url, json=payload)
+        response = self.http.post(url, json=payload)
         print(f"[TwitterClientV2] Reply tweet status: {response.status_code}")
         
         if response.status_code == 201:
@@ -132,13 +248,13 @@ class TwitterClientV2:
 
     def quote_tweet(self, tweet_id: str, text: str) -> Optional[Dict]:
         """Quote a tweet"""
-        url = "https://api.twitter.com/2/tweets"
+        url = f"{self.api_base}/2/tweets"
         payload = {
             "quote_tweet_id": tweet_id,
             "text": text
         }
         
-        response = self.oauth.post(url, json=payload)
+        response = self.http.post(url, json=payload)
         print(f"[TwitterClientV2] Quote tweet status: {response.status_code}")
         
         if response.status_code == 201:
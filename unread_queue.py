@@ -0,0 +1,108 @@
+# unread_queue.py
+import heapq
+import itertools
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+TWITTER_EPOCH_MS = 1288834974657
+
+
+def tweet_timestamp(tweet: Dict) -> float:
+    """Seconds since the epoch from created_at, or from the snowflake id if that's missing"""
+    created_at = tweet.get('created_at')
+    if created_at:
+        try:
+            return datetime.fromisoformat(created_at.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            pass
+    try:
+        return ((int(tweet.get('tweet_id') or tweet.get('id')) >> 22) + TWITTER_EPOCH_MS) / 1000
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class UnreadQueue:
+    """Heap of unread tweet ids with a configurable priority.
+
+    Lower priority tuples pop first. Entries are removed lazily: the caller
+    decides at pop time whether an id is still unread, so marking a tweet
+    read never has to touch the heap.
+
+    priority is one of:
+      - "oldest": created_at ascending (the old list-order behaviour)
+      - "recency": newest first
+      - "author_weight": highest author_weights[author_id] first
+      - "thread_activity": busiest thread first, via activity_fn(tweet)
+      - "score": highest score_fn(tweet) first, e.g. a retrieval score
+    """
+
+    PRIORITIES = ("oldest", "recency", "author_weight", "thread_activity", "score")
+
+    def __init__(self, priority: str = "oldest", author_weights: Optional[Dict[str, float]] = None,
+                 score_fn: Optional[Callable[[Dict], float]] = None,
+                 activity_fn: Optional[Callable[[Dict], float]] = None):
+        if priority not in self.PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {self.PRIORITIES}")
+        if priority == "score" and score_fn is None:
+            raise ValueError("priority='score' needs a score_fn")
+        self.priority = priority
+        self.author_weights = author_weights or {}
+        self.score_fn = score_fn
+        self.activity_fn = activity_fn
+        self._heap: List[Tuple[tuple, int, str]] = []
+        self._leased: List[Tuple[float, str]] = []  # (lease expiry, tweet id)
+        self._seq = itertools.count()
+
+    def _key(self, tweet: Dict) -> tuple:
+        ts = tweet_timestamp(tweet)
+        if self.priority == "recency":
+            return (-ts,)
+        if self.priority == "author_weight":
+            return (-self.author_weights.get(tweet.get('author_id'), 0.0), ts)
+        if self.priority == "thread_activity":
+            return (-(self.activity_fn(tweet) if self.activity_fn else 0.0), ts)
+        if self.priority == "score":
+            return (-self.score_fn(tweet), ts)
+        return (ts,)
+
+    def build(self, tweets: List[Dict]):
+        """(Re)build the heap from unread tweets in O(n)"""
+        self._heap = [(self._key(t), next(self._seq), t.get('tweet_id') or t.get('id')) for t in tweets]
+        heapq.heapify(self._heap)
+
+    def push(self, tweet: Dict):
+        heapq.heappush(self._heap, (self._key(tweet), next(self._seq), tweet.get('tweet_id') or tweet.get('id')))
+
+    def hold(self, tweet_id: str, until: float):
+        """Keep a leased tweet out of the queue until its lease expires"""
+        heapq.heappush(self._leased, (until, tweet_id))
+
+    def release_expired(self, now: float, lookup: Callable[[str], Optional[Dict]]):
+        """Requeue tweets whose lease ran out without being marked read"""
+        while self._leased and self._leased[0][0] <= now:
+            _, tweet_id = heapq.heappop(self._leased)
+            tweet = lookup(tweet_id)
+            if tweet and not tweet.get('is_read') and tweet.get('leased_until', 0) <= now:
+                self.push(tweet)
+
+    def peek(self, is_ready: Callable[[str], bool]) -> Optional[str]:
+        """Highest-priority id that is_ready() accepts, dropping stale entries on the way"""
+        while self._heap:
+            tweet_id = self._heap[0][2]
+            if is_ready(tweet_id):
+                return tweet_id
+            heapq.heappop(self._heap)
+        return None
+
+    def pop(self, is_ready: Callable[[str], bool]) -> Optional[str]:
+        tweet_id = self.peek(is_ready)
+        if tweet_id is not None:
+            heapq.heappop(self._heap)
+        return tweet_id
+
+    def ids(self) -> Set[str]:
+        """Ids that may still be unread: queued or leased (stale entries included)"""
+        return {entry[2] for entry in self._heap} | {tweet_id for _, tweet_id in self._leased}
+
+    def __len__(self) -> int:
+        return len(self._heap)
@@ -0,0 +1,318 @@
+# vector_index.py
+import json
+import os
+import sys
+from array import array
+from typing import Collection, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+class VectorIndex:
+    """FAISS index addressed by tweet id instead of list position.
+
+    The index type follows corpus size: exact flat search for small stores,
+    IVF once brute force gets slow, HNSW for very large ones. Every vector
+    gets its own int64 label, so updates and deletes never shift other
+    entries. Labels are handed out in order, so label -> tweet id and label
+    -> text hash are plain arrays next to the one tweet id -> label dict. HNSW can't remove vectors, so removed labels there become
+    tombstones that are filtered at search time until the next rebuild.
+
+    Recall/latency knobs:
+      - nprobe (IVF): inverted lists scanned per query; higher = better recall, slower
+      - ef_search (HNSW): candidate list size per query; same trade-off
+
+    quantization ("fp16", "int8" or "pq") stores compressed codes instead of
+    float32 (2x, 4x and 32x smaller) and searches by cosine similarity on
+    L2-normalized vectors. Codecs that need training start out as fp16 and
+    switch once there is enough data to train them. search() keeps
+    returning smaller-is-closer distances (2 - 2*cosine, the squared L2
+    distance between unit vectors).
+    """
+
+    FLAT_MAX = 20_000
+    IVF_MAX = 500_000
+    HNSW_M = 32
+    SQ_TRAIN_MIN = 1_000    # vectors needed to train int8 ranges
+    PQ_TRAIN_MIN = 10_000   # ~39 points per centroid for 8-bit PQ codebooks
+    QUANTIZATIONS = (None, "fp16", "int8", "pq")
+    ADD_CHUNK = 10_000      # vectors a rebuild normalizes and adds at a time
+
+    def __init__(self, dim: int, path_prefix: str, model_name: str, kind: str = "auto",
+                 nprobe: int = 16, ef_search: int = 64, quantization: Optional[str] = None):
+        if kind not in ("auto", "flat", "ivf", "hnsw"):
+            raise ValueError(f"Unknown index kind '{kind}'")
+        if quantization not in self.QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {self.QUANTIZATIONS[1:]}")
+        self.dim = dim
+        self.model_name = model_name
+        self.index_file = path_prefix + ".faiss"
+        self.meta_file = path_prefix + ".faiss.json"
+        self.requested_kind = kind
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.quantization = quantization
+        self.cosine = quantization is not None
+        self.metric = faiss.METRIC_INNER_PRODUCT if self.cosine else faiss.METRIC_L2
+        self.kind = "flat"
+        self.codec = None
+        self._labels: Dict[str, int] = {}      # tweet_id -> label
+        self._ids: List[Optional[str]] = []    # label -> tweet_id, None once removed
+        self._hashes = array('q')              # label -> text hash
+        self._tombstones = 0
+        self._dirty = False
+        self.index = self._new_index("flat", 0)
+        self._load()
+
+    def _kind_for(self, n: int) -> str:
+        if self.requested_kind != "auto":
+            kind = self.requested_kind
+        elif n <= self.FLAT_MAX:
+            kind = "flat"
+        elif n <= self.IVF_MAX:
+            kind = "ivf"
+        else:
+            kind = "hnsw"
+        # IVF needs enough points to train its coarse quantizer
+        if kind == "ivf" and n < 40 * 16:
+            return "flat"
+        return kind
+
+    def _codec_for(self, n: int) -> Optional[str]:
+        """The requested quantization, or the closest one n vectors can train"""
+        codec = self.quantization
+        if codec == "pq" and (n < self.PQ_TRAIN_MIN or self.dim % 8):
+            codec = "int8"
+        if codec == "int8" and n < self.SQ_TRAIN_MIN:
+            codec = "fp16"
+        return codec
+
+    def _new_index(self, kind: str, n: int):
+        codec = self._codec_for(n)
+        sq_type = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}.get(codec)
+        pq_m = self.dim // 8  # 8 dims per 8-bit sub-quantizer
+        if kind == "ivf":
+            # ~4*sqrt(n) lists, keeping at least 39 training points per list
+            nlist = int(max(16, min(65536, 4 * np.sqrt(max(n, 1)), n // 39)))
+            coarse = faiss.IndexFlatIP(self.dim) if self.cosine else faiss.IndexFlatL2(self.dim)
+            if codec == "pq":
+                index = faiss.IndexIVFPQ(coarse, self.dim, nlist, pq_m, 8, self.metric)
+            elif sq_type is not None:
+                index = faiss.IndexIVFScalarQuantizer(coarse, self.dim, nlist, sq_type, self.metric)
+            else:
+                index = faiss.IndexIVFFlat(coarse, self.dim, nlist)
+        elif kind == "hnsw":
+            if codec == "pq":
+                hnsw = faiss.IndexHNSWPQ(self.dim, pq_m, self.HNSW_M, 8, self.metric)
+            elif sq_type is not None:
+                hnsw = faiss.IndexHNSWSQ(self.dim, sq_type, self.HNSW_M, self.metric)
+            else:
+                hnsw = faiss.IndexHNSWFlat(self.dim, self.HNSW_M)
+            hnsw.hnsw.efConstruction = 40
+            index = faiss.IndexIDMap2(hnsw)
+        else:
+            if codec == "pq":
+                flat = faiss.IndexPQ(self.dim, pq_m, 8, self.metric)
+            elif sq_type is not None:
+                flat = faiss.IndexScalarQuantizer(self.dim, sq_type, self.metric)
+            else:
+                flat = faiss.IndexFlatL2(self.dim)
+            index = faiss.IndexIDMap2(flat)
+        self.kind = kind
+        self.codec = codec
+        return index
+
+    def _prepare(self, vectors: np.ndarray, copy: bool = True) -> np.ndarray:
+        """float32, contiguous and (for cosine search) unit length; copy=False
+        normalizes in place, for arrays nobody else holds"""
+        if copy:
+            vectors = np.array(vectors, dtype=np.float32, order="C")
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.cosine:
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    def _apply_search_params(self):
+        if self.kind == "ivf":
+            self.index.nprobe = self.nprobe
+        elif self.kind == "hnsw":
+            faiss.downcast_index(self.index.index).hnsw.efSearch = self.ef_search
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Tune recall vs latency for IVF (nprobe) and HNSW (ef_search)"""
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        self._apply_search_params()
+
+    def describe(self) -> Dict:
+        """Current index type, size and search knobs"""
+        info = {
+            "kind": self.kind,
+            "codec": self.codec or "fp32",
+            "metric": "cosine" if self.cosine else "l2",
+            "ntotal": int(self.index.ntotal),
+            "live": len(self._labels),
+            "tombstones": self._tombstones,
+        }
+        if self.kind == "ivf":
+            info.update(nlist=int(self.index.nlist), nprobe=self.nprobe)
+        elif self.kind == "hnsw":
+            info.update(M=self.HNSW_M, ef_search=self.ef_search)
+        return info
+
+    def hashes(self) -> Dict[str, str]:
+        """tweet_id -> hash of the text each indexed vector was built from"""
+        return {tid: self._hashes[label] for tid, label in self._labels.items()}
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def needs_rebuild(self) -> bool:
+        """True when the corpus outgrew the index type or tombstones pile up"""
+        live = len(self._labels)
+        return (self._kind_for(live) != self.kind or self._codec_for(live) != self.codec
+                or self._tombstones > max(1000, live // 5))
+
+    def rebuild(self, tweet_ids: List[str], vectors: np.ndarray, hashes: List[int]):
+        """Build a fresh index of the right type for this corpus.
+
+        vectors can also be any sequence that returns a new array for a slice
+        or a list of positions, so a caller can produce them a chunk at a time
+        instead of holding all of them.
+        """
+        self.index = self._new_index(self._kind_for(len(tweet_ids)), len(tweet_ids))
+        if not self.index.is_trained:
+            # Train on an evenly spaced sample: 40 points per IVF list, or
+            # enough for the PQ codebooks
+            sample = min(len(tweet_ids), max(self.PQ_TRAIN_MIN, 40 * getattr(self.index, "nlist", 0)))
+            picks = np.linspace(0, len(tweet_ids) - 1, sample).astype(np.int64).tolist()
+            self.index.train(self._prepare(vectors[picks], copy=False))
+        self._apply_search_params()
+        self._labels = {}
+        self._ids = []
+        self._hashes = array('q')
+        self._tombstones = 0
+        for start in range(0, len(tweet_ids), self.ADD_CHUNK):
+            end = start + self.ADD_CHUNK
+            self.add(tweet_ids[start:end], vectors[start:end], hashes[start:end])
+        print(f"[VectorIndex] Rebuilt {self.kind} ({self.codec or 'fp32'}) index with {len(tweet_ids)} vectors")
+
+    def add(self, tweet_ids: List[str], vectors: np.ndarray, hashes: List[int]):
+        """Add or update vectors; ids whose text hash is unchanged are skipped"""
+        keep = [i for i, (tid, h) in enumerate(zip(tweet_ids, hashes))
+                if tid not in self._labels or self._hashes[self._labels[tid]] != h]
+        if not keep:
+            return
+        self.remove([tweet_ids[i] for i in keep if tweet_ids[i] in self._labels])
+        first = len(self._ids)
+        vectors = vectors if len(keep) == len(tweet_ids) else np.asarray(vectors)[keep]
+        self.index.add_with_ids(self._prepare(vectors), np.arange(first, first + len(keep), dtype=np.int64))
+        for label, i in enumerate(keep, first):
+            tweet_id = sys.intern(tweet_ids[i])
+            self._labels[tweet_id] = label
+            self._ids.append(tweet_id)
+            self._hashes.append(hashes[i])
+        self._dirty = True
+
+    def remove(self, tweet_ids: List[str]):
+        """Drop vectors for these tweets"""
+        labels = [self._labels.pop(tid) for tid in tweet_ids if tid in self._labels]
+        if not labels:
+            return
+        for label in labels:
+            self._ids[label] = None
+        if self.kind == "hnsw":
+            self._tombstones += len(labels)
+        else:
+            self.index.remove_ids(np.array(labels, dtype=np.int64))
+        self._dirty = True
+
+    def _restricted_params(self, tweet_ids: Collection[str]):
+        """Search parameters that only admit these tweets' labels, or None if
+        the index can't filter while searching"""
+        labels = np.fromiter((self._labels[tid] for tid in tweet_ids if tid in self._labels), dtype=np.int64)
+        selector = faiss.IDSelectorBatch(labels)
+        if self.kind == "ivf":
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if self.kind == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        if self.codec == "pq":
+            return None  # IndexPQ takes no search parameters
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, vector: np.ndarray, k: int,
+               restrict: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """Nearest tweet ids with their (squared) L2 distances, optionally only
+        among the tweet ids in restrict (a set)"""
+        if not self._labels:
+            return []
+        fetch = min(k + self._tombstones, int(self.index.ntotal))
+        params = None
+        if restrict is not None:
+            params = self._restricted_params(restrict)
+            if params is None:
+                fetch = int(self.index.ntotal)  # filter afterwards instead
+        D, I = self.index.search(self._prepare(vector), fetch, params=params)
+        results = []
+        for dist, label in zip(D[0].tolist(), I[0].tolist()):
+            tweet_id = self._ids[label] if label >= 0 else None
+            if tweet_id is not None and (restrict is None or tweet_id in restrict):
+                if self.cosine:
+                    dist = 2.0 - 2.0 * dist
+                results.append((tweet_id, dist))
+                if len(results) == k:
+                    break
+        return results
+
+    def _load(self):
+        if not (os.path.exists(self.index_file) and os.path.exists(self.meta_file)):
+            return
+        try:
+            with open(self.meta_file, "r") as f:
+                meta = json.load(f)
+            if (meta.get("dim") != self.dim or meta.get("model") != self.model_name
+                    or meta.get("quantization") != self.quantization):
+                return
+            index = faiss.read_index(self.index_file)
+            if index.ntotal != meta["ntotal"]:
+                raise ValueError("index and id map are out of sync")
+        except Exception as e:
+            print(f"[VectorIndex] Could not load saved index, rebuilding: {e}")
+            return
+        self.index = index
+        self.kind = meta["kind"]
+        self.codec = meta.get("codec")
+        from embedding_cache import as_hash
+        self._ids = [None] * meta["next_label"]
+        self._hashes = array('q', bytes(8 * meta["next_label"]))
+        for tid, (label, h) in meta["labels"].items():
+            tid = sys.intern(tid)
+            self._labels[tid] = label
+            self._ids[label] = tid
+            self._hashes[label] = as_hash(h)
+        self._tombstones = meta["tombstones"]
+        self._apply_search_params()
+
+    def save(self):
+        """Persist the index and its id map (atomically, index first)"""
+        if not self._dirty:
+            return
+        faiss.write_index(self.index, self.index_file + ".tmp")
+        with open(self.meta_file + ".tmp", "w") as f:
+            json.dump({
+                "model": self.model_name,
+                "dim": self.dim,
+                "kind": self.kind,
+                "quantization": self.quantization,
+                "codec": self.codec,
+                "ntotal": int(self.index.ntotal),
+                "next_label": len(self._ids),
+                "tombstones": self._tombstones,
+                "labels": {tid: [label, self._hashes[label]] for tid, label in self._labels.items()},
+            }, f)
+        os.replace(self.index_file + ".tmp", self.index_file)
+        os.replace(self.meta_file + ".tmp", self.meta_file)
+        self._dirty = False